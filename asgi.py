@@ -0,0 +1,297 @@
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Request
+
+import sarver
+
+# نقطة دخول ASGI للخادم: الملفات الثابتة تُرسل بشكل غير متزامن،
+# وبقية المسارات (/ و /api/... و /upload) تُنفذ عبر تطبيق Flask في مجموعة خيوط.
+# التشغيل: uvicorn asgi:app --host 0.0.0.0 --port 8080
+
+# حجم القطعة عند قراءة الملفات من القرص
+STATIC_CHUNK_SIZE = 256 * 1024
+# عدد الخيوط المخصصة لتنفيذ طلبات Flask
+WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 32))
+# جسم الطلب يبقى في الذاكرة حتى هذا الحجم ثم يُنقل إلى ملف مؤقت
+REQUEST_BODY_MEMORY_LIMIT = 1024 * 1024
+
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix='asgi-wsgi')
+
+# مسارات Flask التي تُرسل ملفات ثابتة، ودالة تحليل كل منها
+STATIC_RESOLVERS = {
+    'serve_file': sarver.resolve_static,
+    'serve_bundle': sarver.resolve_bundle,
+    'control_panel': sarver.resolve_control_panel,
+    'serve_panel_asset': sarver.resolve_panel_asset,
+}
+
+
+# بناء بيئة WSGI من نطاق ASGI
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+
+async def read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=REQUEST_BODY_MEMORY_LIMIT)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.write(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    body.seek(0)
+    return body
+
+
+# إرسال جزء من ملف مفتوح: sendfile إذا كان الخادم يدعم امتداد zerocopysend، وإلا قراءة بـ pread
+async def send_file_range(scope, send, fd, start, stop):
+    if 'http.response.zerocopysend' in scope.get('extensions', {}):
+        await send({'type': 'http.response.zerocopysend', 'file': fd, 'offset': start, 'count': stop - start,
+                    'more_body': True})
+        return
+    loop = asyncio.get_running_loop()
+    for offset in range(start, stop, STATIC_CHUNK_SIZE):
+        chunk = await loop.run_in_executor(None, os.pread, fd, min(STATIC_CHUNK_SIZE, stop - offset), offset)
+        if not chunk:
+            break
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+
+# إرسال ملف ثابت (أو نطاقات منه) دون حجز خيط طوال مدة الإرسال
+async def send_static(scope, send, result, req):
+    loop = asyncio.get_running_loop()
+    headers = result.headers()
+    head = scope['method'] == 'HEAD'
+
+    if result.status == 304:
+        await send({'type': 'http.response.start', 'status': 304, 'headers': encode_headers(headers.items())})
+        await send({'type': 'http.response.body', 'body': b''})
+        return 0
+
+    f = None
+    if result.data is not None:
+        size = len(result.data)
+    else:
+        f = await loop.run_in_executor(None, open, result.path, 'rb')
+    try:
+        if f is not None:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            if result.mtime is None:
+                headers['Last-Modified'] = sarver.http_date(st.st_mtime)
+
+        try:
+            ranges = sarver.requested_ranges(req, size, result.etag, result.mtime)
+        except sarver.RequestedRangeNotSatisfiable:
+            await send({'type': 'http.response.start', 'status': 416,
+                        'headers': encode_headers([('Content-Range', f"bytes */{size}"), ('Content-Length', '0')])})
+            await send({'type': 'http.response.body', 'body': b''})
+            return 0
+
+        layout = sarver.ByteRanges(ranges or [(0, size)], size, headers.get('Content-Type'))
+        if ranges is None:
+            headers['Content-Length'] = str(size)
+        else:
+            headers.update(layout.headers)
+        await send({'type': 'http.response.start', 'status': 206 if ranges else 200,
+                    'headers': encode_headers(headers.items())})
+        if head:
+            await send({'type': 'http.response.body', 'body': b''})
+            return 0
+
+        for part_head, start, stop in layout.parts:
+            if part_head:
+                await send({'type': 'http.response.body', 'body': part_head, 'more_body': True})
+            if f is None:
+                await send({'type': 'http.response.body', 'body': result.data[start:stop], 'more_body': True})
+            else:
+                await send_file_range(scope, send, f.fileno(), start, stop)
+        await send({'type': 'http.response.body', 'body': layout.trailer})
+        return layout.length if ranges else size
+    finally:
+        if f is not None:
+            f.close()
+
+
+# رفض الطلب بـ 429 (نفس رد تطبيق Flask)
+async def send_rate_limited(send, wait):
+    body = json.dumps({'status': 'error', 'message': 'طلبات كثيرة، حاول مرة أخرى بعد قليل'}).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 429,
+                'headers': encode_headers([('Content-Type', 'application/json'), ('Content-Length', len(body)),
+                                           ('Retry-After', max(1, math.ceil(wait)))])})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# نفس سجل الوصول الذي يكتبه تطبيق Flask لبقية الطلبات
+def log_access(req, client, status, size, start):
+    if sarver.access_log is not None:
+        sarver.access_log.record(time.time(), client, req.method, req.path, sarver.site_for_request(req) or '',
+                                 req.environ.get('sarver.rel_path'), status, size, time.perf_counter() - start)
+
+
+# تنفيذ طلب عبر تطبيق Flask في خيط منفصل مع بث الاستجابة قطعة بقطعة
+async def call_wsgi(scope, receive, send, rate_charged=False):
+    loop = asyncio.get_running_loop()
+    body = await read_body(receive)
+    environ = build_environ(scope, body)
+    environ['sarver.on_disconnect'] = []
+    environ['sarver.rate_charged'] = rate_charged
+    messages = asyncio.Queue(maxsize=16)
+    disconnected = threading.Event()
+
+    # الخادم لا يرفع خطأ عند الإرسال بعد انقطاع الاتصال، فيُراقب http.disconnect مباشرة
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+        for callback in environ['sarver.on_disconnect']:
+            callback()
+
+    def put(message):
+        asyncio.run_coroutine_threadsafe(messages.put(message), loop).result()
+
+    def run():
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start['status'] = int(status.split(' ', 1)[0])
+            response_start['headers'] = headers
+
+        try:
+            result = sarver.app(environ, start_response)
+            try:
+                put(('start', response_start['status'], response_start['headers']))
+                for chunk in result:
+                    if disconnected.is_set():
+                        break
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            put(('end',))
+        except BaseException as e:
+            put(('error', e))
+        finally:
+            body.close()
+
+    loop.run_in_executor(wsgi_executor, run)
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        while True:
+            message = await messages.get()
+            if message[0] == 'error':
+                raise message[1]
+            if disconnected.is_set():
+                # انقطع الاتصال: المنتج يتوقف عند القطعة التالية، ويُفرغ الطابور حتى لا يبقى الخيط معلقاً
+                if message[0] == 'end':
+                    return
+                continue
+            try:
+                if message[0] == 'start':
+                    await send({'type': 'http.response.start', 'status': message[1],
+                                'headers': encode_headers(message[2])})
+                elif message[0] == 'body':
+                    await send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+                else:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+            except OSError:
+                disconnected.set()
+    finally:
+        watcher.cancel()
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                sarver.start_background_tasks()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                sarver.metadata_store.flush()
+                if sarver.access_log is not None:
+                    sarver.access_log.flush()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    # نفس جدول المسارات في Flask يحدد إن كان الطلب لملف ثابت
+    rate_charged = False
+    if scope['method'] in ('GET', 'HEAD'):
+        environ = sarver.apply_site_prefix(build_environ(scope, None))
+        try:
+            endpoint, args = sarver.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        if endpoint in STATIC_RESOLVERS:
+            sarver.start_background_tasks()
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            req = Request(environ)
+            client = sarver.client_address(req)
+            # الحد يُطبق قبل أي قراءة أو حساب للملف
+            if sarver.rate_limiter is not None:
+                wait = sarver.rate_limiter.acquire(client, 'static')
+                if wait:
+                    await send_rate_limited(send, wait)
+                    sarver.metrics.observe_request(endpoint, 429, 0, time.perf_counter() - start)
+                    log_access(req, client, 429, 0, start)
+                    return
+                rate_charged = True
+            result = await loop.run_in_executor(None, STATIC_RESOLVERS[endpoint], *args.values(), req)
+            if result is not None:
+                size = await send_static(scope, send, result, req)
+                if sarver.rate_limiter is not None:
+                    sarver.rate_limiter.charge(client, 'static', size)
+                sarver.metrics.observe_request(endpoint, result.status, size, time.perf_counter() - start)
+                log_access(req, client, result.status, size, start)
+                return
+
+    # الطلب الذي لا يجد ملفاً يكمل إلى Flask، وقد خُصم من الحد هنا فلا يُخصم مرتين
+    await call_wsgi(scope, receive, send, rate_charged)
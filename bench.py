@@ -0,0 +1,319 @@
+import os
+import argparse
+import atexit
+import http.client
+import io
+import json
+import logging
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# قياس أداء الخادم: عرض الملفات، سرد الملفات، والرفع
+# الاستخدام:
+#   python bench.py run --files 5000 --output result.json
+#   python bench.py compare old.json new.json
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# توزيع الملفات الافتراضي على المجلدات: (المجلد، الامتداد، النسبة)
+DEFAULT_MIX = 'html=0.1,css=0.2,js=0.2,images=0.5'
+FOLDER_EXTENSIONS = {'html': ('', 'html'), 'css': ('css', 'css'), 'js': ('js', 'js'), 'images': ('images', 'png')}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in FOLDER_EXTENSIONS:
+            raise SystemExit(f'نوع غير معروف في التوزيع: {name}')
+        weights[name] = float(weight)
+    return weights
+
+
+# إنشاء موقع تجريبي: أحجام الملفات موزعة توزيعاً لوغاريتمياً طبيعياً حول المتوسط
+def generate_site(base_dir, file_count, mean_size, mix, seed):
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    kinds = list(weights)
+    paths = []
+    for i in range(file_count):
+        kind = rng.choices(kinds, weights=[weights[k] for k in kinds])[0]
+        folder, ext = FOLDER_EXTENSIONS[kind]
+        rel_path = f"{folder}/file{i}.{ext}" if folder else f"file{i}.{ext}"
+        size = max(1, int(rng.lognormvariate(0, 1) * mean_size))
+        full_path = os.path.join(base_dir, rel_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            if ext == 'png':
+                f.write(os.urandom(size))
+            else:
+                f.write((b'/* bench */ body { color: red; }\n' * (size // 33 + 1))[:size])
+        paths.append(rel_path)
+    return paths
+
+
+# عنوان الطلب العام للملف (الخادم يحدد المجلد من الامتداد)
+def public_url(rel_path):
+    return '/' + rel_path.rsplit('/', 1)[-1]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss بالبايت على macOS وبالكيلوبايت على Linux
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def summarize(name, transport, latencies, elapsed, errors, bytes_received):
+    latencies.sort()
+    return {
+        'scenario': name,
+        'transport': transport,
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 4),
+        'requests_per_s': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'bytes_received': bytes_received,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+# تنفيذ طلبات بالتوازي: request_fn(worker_state, i) تعيد (نجاح، عدد البايتات)
+def drive(requests, concurrency, make_state, request_fn):
+    latencies = []
+    errors = 0
+    received = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors, received
+        state = make_state()
+        local = []
+        local_errors = 0
+        local_bytes = 0
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                ok, size = request_fn(state, i)
+            except (OSError, http.client.HTTPException):
+                ok, size = False, 0
+                state = make_state()
+            local.append(time.perf_counter() - start)
+            local_errors += 0 if ok else 1
+            local_bytes += size
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+            received += local_bytes
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return latencies, time.perf_counter() - start, errors, received
+
+
+# اختيار الملفات المطلوبة: 80% من الطلبات على 20% من الملفات
+def request_plan(paths, count, seed):
+    rng = random.Random(seed)
+    hot = paths[:max(1, len(paths) // 5)]
+    return [public_url(rng.choice(hot) if rng.random() < 0.8 else rng.choice(paths)) for _ in range(count)]
+
+
+def test_client_scenarios(sarver, paths, args):
+    client = sarver.app.test_client()
+    plan = request_plan(paths, args.requests, args.seed)
+    results = []
+
+    def serve(_, i):
+        response = client.get(plan[i])
+        data = response.get_data()
+        return response.status_code == 200, len(data)
+    results.append(summarize('serve_file', 'test_client', *drive(args.requests, 1, lambda: None, serve)))
+
+    def list_files(_, i):
+        response = client.get('/api/files?limit=100')
+        return response.status_code == 200, len(response.get_data())
+    results.append(summarize('list_files_api', 'test_client',
+                             *drive(max(1, args.requests // 10), 1, lambda: None, list_files)))
+
+    payload = os.urandom(args.upload_size)
+
+    def upload(_, i):
+        response = client.post('/upload', data={
+            'file': (io.BytesIO(payload), f'bench_upload{i % 50}.png'),
+            'file_type': 'images',
+        })
+        return response.status_code == 200, len(response.get_data())
+    results.append(summarize('upload_file', 'test_client', *drive(max(1, args.requests // 10), 1, lambda: None, upload)))
+    return results
+
+
+def socket_scenarios(sarver, paths, args):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, sarver.app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    plan = request_plan(paths, args.requests, args.seed + 1)
+    results = []
+
+    def connect():
+        return http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def fetch(conn, method, url, body=None, headers=None):
+        conn.request(method, url, body=body, headers=headers or {})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status == 200, len(data)
+
+    results.append(summarize('serve_file', 'socket', *drive(
+        args.requests, args.concurrency, connect, lambda conn, i: fetch(conn, 'GET', plan[i]))))
+    results.append(summarize('list_files_api', 'socket', *drive(
+        max(1, args.requests // 10), args.concurrency, connect,
+        lambda conn, i: fetch(conn, 'GET', '/api/files?limit=100'))))
+
+    payload = os.urandom(args.upload_size)
+    boundary = 'benchboundary'
+
+    def upload(conn, i):
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file_type"\r\n\r\nimages\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="bench_socket{i % 50}.png"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode() + payload + f'\r\n--{boundary}--\r\n'.encode()
+        return fetch(conn, 'POST', '/upload', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    results.append(summarize('upload_file', 'socket', *drive(
+        max(1, args.requests // 10), args.concurrency, connect, upload)))
+
+    server.shutdown()
+    return results
+
+
+def run(args):
+    original_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='sarver-bench-')
+    # الخادم يستخدم مسارات نسبية لمجلد العمل، لذلك ننتقل إليه قبل استيراده
+    os.chdir(workdir)
+    start = time.perf_counter()
+    paths = generate_site(os.path.join(workdir, 'my_website'), args.files, args.mean_size, args.mix, args.seed)
+    generate_s = time.perf_counter() - start
+
+    sys.path.insert(0, REPO_DIR)
+    start = time.perf_counter()
+    import sarver
+    import_s = time.perf_counter() - start
+    sarver.app.logger.disabled = True
+
+    results = []
+    if args.transport in ('all', 'test_client'):
+        results.extend(test_client_scenarios(sarver, paths, args))
+    if args.transport in ('all', 'socket'):
+        results.extend(socket_scenarios(sarver, paths, args))
+
+    report = {
+        'config': {
+            'files': args.files,
+            'mean_size': args.mean_size,
+            'mix': args.mix,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'upload_size': args.upload_size,
+            'seed': args.seed,
+        },
+        'python': sys.version.split()[0],
+        'timestamp': time.time(),
+        'setup': {
+            'generate_s': round(generate_s, 4),
+            # يشمل بناء فهرس التخزين عند بدء التشغيل
+            'import_s': round(import_s, 4),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    # مجلد العمل سيُحذف، فلا داعي لحفظ البيانات الوصفية عند الخروج
+    sarver.metadata_store.flush()
+    atexit.unregister(sarver.metadata_store.flush)
+    os.chdir(original_cwd)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+# مقارنة نتيجتين: نسبة التغير في عدد الطلبات بالثانية وزمن p95
+def compare(args):
+    with open(args.old, encoding='utf-8') as f:
+        old = {(r['scenario'], r['transport']): r for r in json.load(f)['results']}
+    with open(args.new, encoding='utf-8') as f:
+        new = {(r['scenario'], r['transport']): r for r in json.load(f)['results']}
+
+    rows = []
+    for key in sorted(set(old) & set(new)):
+        before, after = old[key], new[key]
+        rows.append({
+            'scenario': key[0],
+            'transport': key[1],
+            'requests_per_s': [before['requests_per_s'], after['requests_per_s']],
+            'requests_per_s_change_pct': round(
+                (after['requests_per_s'] - before['requests_per_s']) / before['requests_per_s'] * 100, 2)
+            if before['requests_per_s'] else None,
+            'p95_ms': [before['latency_ms']['p95'], after['latency_ms']['p95']],
+            'p95_change_pct': round(
+                (after['latency_ms']['p95'] - before['latency_ms']['p95']) / before['latency_ms']['p95'] * 100, 2)
+            if before['latency_ms']['p95'] else None,
+        })
+    print(json.dumps(rows, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='قياس أداء نظام الاستضافة')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='إنشاء موقع تجريبي وقياس الأداء')
+    run_parser.add_argument('--files', type=int, default=2000, help='عدد الملفات في الموقع التجريبي')
+    run_parser.add_argument('--mean-size', type=int, default=8 * 1024, help='متوسط حجم الملف بالبايت')
+    run_parser.add_argument('--mix', default=DEFAULT_MIX, help='توزيع الملفات على الأنواع')
+    run_parser.add_argument('--requests', type=int, default=2000, help='عدد طلبات عرض الملفات لكل سيناريو')
+    run_parser.add_argument('--concurrency', type=int, default=8, help='عدد الاتصالات المتزامنة عبر المقبس')
+    run_parser.add_argument('--upload-size', type=int, default=16 * 1024, help='حجم الملف في سيناريو الرفع')
+    run_parser.add_argument('--transport', choices=['all', 'test_client', 'socket'], default='all')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', help='حفظ النتيجة في ملف JSON')
+    run_parser.add_argument('--keep', action='store_true', help='عدم حذف الموقع التجريبي بعد القياس')
+
+    compare_parser = commands.add_parser('compare', help='مقارنة نتيجتين')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
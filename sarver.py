@@ -1,7 +1,66 @@
 import os
-from flask import Flask, request, send_from_directory, render_template_string, jsonify
+import argparse
+import atexit
+import ctypes
+import ctypes.util
+import gzip
+import hashlib
+import json
+import math
+import mimetypes
+import multiprocessing
+import queue
+import re
+import select
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import Flask, Response, request, send_file, render_template_string, jsonify, abort, g
+from werkzeug.security import safe_join
+from werkzeug.serving import make_server
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import http_date, quote_etag
+from werkzeug.utils import get_content_type
 from werkzeug.utils import secure_filename
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
 app = Flask(__name__)
 
 # إعدادات التصميم
@@ -12,42 +71,2725 @@ TEXT_COLOR = "#212529"
 ACCENT_COLOR = "#4cc9f0"
 
 # إعدادات الموقع
-BASE_DIR = "my_website"
+# استضافة عدة مواقع: عند تحديد SITES_DIR يكون لكل موقع مجلد داخله، ويُحدد الموقع من اسم النطاق
+# (<site><SITES_HOST_SUFFIX>) أو من بادئة المسار (/sites/<site>/...). بدونه يعمل الخادم كموقع واحد في my_website
+SITES_DIR = os.environ.get('SITES_DIR', '')
+SITES_HOST_SUFFIX = os.environ.get('SITES_HOST_SUFFIX', '').lower()
+SITES_PATH_PREFIX = '/sites/'
+SITE_NAME = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+BASE_DIR = SITES_DIR or "my_website"
+# مجلد البيانات الوصفية (خارج مجلد الموقع حتى لا يظهر في قائمة الملفات). افتراضياً بجانب مجلد الموقع
+# وعلى نفس القرص، ويُحفظ كمسار مطلق فلا يتبع مجلد العمل إذا تغير بعد الاستيراد
+META_DIR = os.path.abspath(os.environ.get('META_DIR')
+                           or os.path.join(os.path.dirname(os.path.abspath(BASE_DIR)), '.hosting_meta'))
+# الملفات المؤقتة تُنقل بـ os.replace إلى مجلد الموقع فيجب أن تكون على نفس القرص: في وضع تعدد المواقع
+# تُكتب في مجلد داخل SITES_DIR لا يطابق اسمه اسم أي موقع، ولا يدخل في المسح والمراقبة
+WORK_DIR_NAME = '.hosting_tmp'
+WORK_DIR = os.path.join(SITES_DIR, WORK_DIR_NAME) if SITES_DIR else META_DIR
 ALLOWED_EXTENSIONS = {'html', 'css', 'js', 'png', 'jpg', 'jpeg', 'gif', 'ico'}
+UPLOAD_FOLDERS = ['css', 'js', 'images', 'fonts']
+# الحد الأقصى لمساحة كل موقع (0 بلا حد)، ويمكن تغييره لموقع معين بالأمر add-site.
+# بدون SITES_DIR لا حد افتراضياً كما كان الخادم من قبل
+SITE_QUOTA_MB = float(os.environ.get('SITE_QUOTA_MB', 100 if SITES_DIR else 0))
 os.makedirs(BASE_DIR, exist_ok=True)
-for folder in ['css', 'js', 'images', 'fonts']:
-    os.makedirs(f"{BASE_DIR}/{folder}", exist_ok=True)
+if not SITES_DIR:
+    for folder in UPLOAD_FOLDERS:
+        os.makedirs(f"{BASE_DIR}/{folder}", exist_ok=True)
+os.makedirs(META_DIR, exist_ok=True)
+
+# في وضع تعدد المواقع يبدأ مسار كل ملف في الفهرس باسم موقعه
+def site_path(site, rel_path):
+    return f"{site}/{rel_path}" if site else rel_path
+
+def split_site(rel_path):
+    if not SITES_DIR:
+        return '', rel_path
+    site, _, rest = rel_path.partition('/')
+    return site, rest
+
+# مسار داخل الموقع من رابط أو اسم يرسله العميل، أو None إذا حاول الخروج من مجلد الموقع
+def site_rel_path(site, path):
+    rel_path = os.path.normpath(path).replace('\\', '/').lstrip('/')
+    if rel_path in ('.', '..') or rel_path.startswith('../'):
+        return None
+    return site_path(site, rel_path)
+
+# الفاصل الزمني (بالثواني) لمطابقة فهرس التخزين مع القرص
+STORAGE_RECONCILE_INTERVAL = int(os.environ.get('STORAGE_RECONCILE_INTERVAL', 300))
+
+# حجم الصفحة الافتراضي والأقصى في واجهة سرد الملفات
+FILES_PAGE_SIZE = 100
+FILES_MAX_PAGE_SIZE = 1000
+
+# حدود فئات المدد (بالثواني) في مدرجات زمن الاستجابة
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
 
-# دالة لحساب مساحة التخزين
-def get_storage_info():
-    total_size = 0
-    file_count = 0
+# مقاييس الأداء: مدة كل مسار، أعداد رموز الحالة، البايتات المرسلة، ومدة العمليات الداخلية
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}  # route -> Histogram
+        self.operations = {}  # operation -> Histogram
+        self.statuses = Counter()  # (route, status) -> count
+        self.bytes_sent = Counter()  # route -> bytes
+        # دوال إضافية تعيد مقاييس بصيغة (الاسم، النوع، الوصف، [(التسميات، القيمة)])
+        self.collectors = []
+        # الخيوط التي تعالج طلباً حالياً: thread_id -> route (يستخدمها المحلل)
+        self.active = {}
+
+    def observe_request(self, route, status, size, duration):
+        with self._lock:
+            histogram = self.routes.get(route)
+            if histogram is None:
+                histogram = self.routes[route] = Histogram()
+            histogram.observe(duration)
+            self.statuses[(route, status)] += 1
+            self.bytes_sent[route] += size
+
+    def observe_operation(self, operation, duration):
+        with self._lock:
+            histogram = self.operations.get(operation)
+            if histogram is None:
+                histogram = self.operations[operation] = Histogram()
+            histogram.observe(duration)
+
+    @contextmanager
+    def timer(self, operation):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_operation(operation, time.perf_counter() - start)
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    # تصدير المقاييس بصيغة Prometheus النصية
+    def render(self):
+        lines = []
+        
+        def labels(**values):
+            return ','.join(f'{k}="{v}"' for k, v in values.items())
+        
+        def histogram_lines(name, help_text, label, histograms):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels(**{label: key, "le": bound})}}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels(**{label: key})}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{labels(**{label: key})}}} {histogram.count}')
+        
+        with self._lock:
+            histogram_lines('sarver_request_duration_seconds', 'Request latency per route.', 'route', self.routes)
+            histogram_lines('sarver_operation_duration_seconds', 'Duration of internal filesystem operations.',
+                            'operation', self.operations)
+            lines.append('# HELP sarver_responses_total Responses per route and status code.')
+            lines.append('# TYPE sarver_responses_total counter')
+            for (route, status), count in sorted(self.statuses.items()):
+                lines.append(f'sarver_responses_total{{{labels(route=route, status=status)}}} {count}')
+            lines.append('# HELP sarver_response_bytes_total Response body bytes per route.')
+            lines.append('# TYPE sarver_response_bytes_total counter')
+            for route, size in sorted(self.bytes_sent.items()):
+                lines.append(f'sarver_response_bytes_total{{{labels(route=route)}}} {size}')
+        
+        for collect in self.collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for sample_labels, value in samples:
+                    suffix = f'{{{labels(**sample_labels)}}}' if sample_labels else ''
+                    lines.append(f'{name}{suffix} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# المحلل بالعينات (معطل افتراضياً): يلتقط مكدسات الخيوط التي تعالج مساراً معيناً
+ENABLE_PROFILER = os.environ.get('ENABLE_PROFILER', '') == '1'
+PROFILER_INTERVAL = 0.005
+PROFILER_MAX_SECONDS = 60
+
+def sample_route_stacks(route, seconds, top):
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    own_thread = threading.get_ident()
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        for thread_id, active_route in list(metrics.active.items()):
+            if active_route != route or thread_id == own_thread:
+                continue
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            stacks[';'.join(reversed(stack))] += 1
+            samples += 1
+        time.sleep(PROFILER_INTERVAL)
+    return {
+        'route': route,
+        'seconds': seconds,
+        'samples': samples,
+        'stacks': [{'stack': stack, 'count': count} for stack, count in stacks.most_common(top)]
+    }
+
+# تحويل المسار إلى مفتاح موحد نسبةً إلى جذر الموقع
+def normalize_rel_path(path):
+    return os.path.normpath(path).replace('\\', '/').lstrip('/')
+
+# مسح متوازٍ لشجرة الملفات: كل مجلد يُقرأ بـ os.scandir في مجموعة خيوط (المجلدات الفرعية تُوزع على الخيوط
+# فور اكتشافها)، ونتيجة stat تؤخذ من DirEntry نفسه. النتائج تُبث على دفعات عبر طابور محدود الحجم،
+# فلا تحتفظ الدالة بأكثر من SCAN_QUEUE_SIZE دفعة مهما كبرت الشجرة
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+SCAN_BATCH_SIZE = 1024
+SCAN_QUEUE_SIZE = 64
+
+# إرجاع (rel_path, stat) لكل ملف تحت root بترتيب غير محدد، مع تخطي المجلدات exclude في المستوى الأول
+def scan_tree(root, workers=SCAN_WORKERS, exclude=()):
+    results = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    remaining = [1]  # عدد المجلدات التي لم ينتهِ مسحها
+    lock = threading.Lock()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    
+    def scan_dir(rel_dir):
+        batch = []
+        try:
+            with os.scandir(os.path.join(root, rel_dir) if rel_dir else root) as it:
+                for entry in it:
+                    if stop.is_set():
+                        break
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if not rel_dir and entry.name in exclude:
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            with lock:
+                                remaining[0] += 1
+                            executor.submit(scan_dir, rel_path)
+                        elif entry.is_file():
+                            batch.append((rel_path, entry.stat()))
+                    except OSError:
+                        continue
+                    if len(batch) >= SCAN_BATCH_SIZE:
+                        results.put(batch)
+                        batch = []
+        except OSError:
+            pass
+        finally:
+            if batch:
+                results.put(batch)
+            with lock:
+                remaining[0] -= 1
+                done = not remaining[0]
+            if done:
+                results.put(None)
     
-    for dirpath, dirnames, filenames in os.walk(BASE_DIR):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
-            file_count += 1
+    executor.submit(scan_dir, '')
+    finished = False
+    try:
+        while True:
+            batch = results.get()
+            if batch is None:
+                finished = True
+                return
+            yield from batch
+    finally:
+        # توقف المستهلك قبل النهاية: إيقاف المسح وتفريغ الطابور حتى لا تبقى الخيوط معلقة
+        if not finished:
+            stop.set()
+            while results.get() is not None:
+                pass
+        executor.shutdown(wait=False)
+
+# فهرس التخزين: يحفظ حجم وتاريخ تعديل كل ملف في الذاكرة
+# حتى تُحسب الإحصائيات دون المرور على كامل شجرة الملفات
+class StorageIndex:
+    def __init__(self, root, namespaced=False):
+        self.root = root
+        # في وضع تعدد المواقع: الحجم وعدد الملفات لكل موقع حتى لا يُمسح إلا الموقع المطلوب
+        self.namespaced = namespaced
+        self._site_totals = {}  # site -> [size, count]
+        self._lock = threading.Lock()
+        self._files = {}  # rel_path -> (size, mtime)
+        # رقم inode لكل ملف: الملفات المرتبطة بنفس المحتوى (hardlink) تُحسب مرة واحدة في المساحة الفعلية
+        self._inodes = {}  # rel_path -> inode
+        self._inode_refs = Counter()
+        self._physical_size = 0
+        self._sorted = []  # المسارات مرتبة لتقسيم النتائج إلى صفحات
+        self._total_size = 0
+        # التغييرات التي تحدث أثناء المطابقة تُحفظ هنا ثم تُطبق على نتيجة المسح
+        self._pending = None
+
+    def _scan(self):
+        entries = {}
+        with metrics.timer('tree_scan'):
+            for rel_path, st in scan_tree(self.root, exclude=(WORK_DIR_NAME,) if self.namespaced else ()):
+                entries[rel_path] = (st.st_size, st.st_mtime, st.st_ino)
+        return entries
+
+    # الملفات التي تختلف على القرص عما في الفهرس (إضافة أو تعديل أو حذف)
+    def changes(self):
+        entries = self._scan()
+        with self._lock:
+            changed = {rel_path for rel_path in self._files if rel_path not in entries}
+            changed.update(rel_path for rel_path, (size, mtime, _) in entries.items()
+                           if self._files.get(rel_path) != (size, mtime))
+        return changed
+
+    # مطابقة الفهرس مع القرص (عند بدء التشغيل وبشكل دوري)
+    def reconcile(self):
+        with self._lock:
+            self._pending = {}
+        try:
+            entries = self._scan()
+        finally:
+            with self._lock:
+                pending, self._pending = self._pending, None
+        for rel_path, entry in pending.items():
+            if entry is None:
+                entries.pop(rel_path, None)
+            else:
+                entries[rel_path] = entry
+        files = {}
+        inodes = {}
+        inode_refs = Counter()
+        site_totals = {}
+        total_size = 0
+        physical_size = 0
+        for rel_path, (size, mtime, inode) in entries.items():
+            files[rel_path] = (size, mtime)
+            if self.namespaced:
+                totals = site_totals.setdefault(rel_path.partition('/')[0], [0, 0])
+                totals[0] += size
+                totals[1] += 1
+            inodes[rel_path] = inode
+            total_size += size
+            if not inode_refs[inode]:
+                physical_size += size
+            inode_refs[inode] += 1
+        sorted_paths = sorted(entries)
+        with self._lock:
+            self._files = files
+            self._inodes = inodes
+            self._inode_refs = inode_refs
+            self._sorted = sorted_paths
+            self._total_size = total_size
+            self._physical_size = physical_size
+            self._site_totals = site_totals
+
+    def _add_site_totals(self, rel_path, size, count):
+        if self.namespaced:
+            totals = self._site_totals.setdefault(rel_path.partition('/')[0], [0, 0])
+            totals[0] += size
+            totals[1] += count
+
+    def _set(self, rel_path, entry):
+        old = self._files.pop(rel_path, None)
+        if old is not None:
+            self._total_size -= old[0]
+            self._add_site_totals(rel_path, -old[0], -1)
+            inode = self._inodes.pop(rel_path)
+            self._inode_refs[inode] -= 1
+            if not self._inode_refs[inode]:
+                del self._inode_refs[inode]
+                self._physical_size -= old[0]
+            if entry is None:
+                del self._sorted[bisect_left(self._sorted, rel_path)]
+        if entry is not None:
+            size, mtime, inode = entry
+            self._files[rel_path] = (size, mtime)
+            self._inodes[rel_path] = inode
+            self._total_size += size
+            self._add_site_totals(rel_path, size, 1)
+            if not self._inode_refs[inode]:
+                self._physical_size += size
+            self._inode_refs[inode] += 1
+            if old is None:
+                insort(self._sorted, rel_path)
+        if self._pending is not None:
+            self._pending[rel_path] = entry
+
+    # تحديث ملف واحد بعد رفعه أو تعديله
+    def update(self, rel_path):
+        rel_path = normalize_rel_path(rel_path)
+        try:
+            st = os.stat(os.path.join(self.root, rel_path))
+            entry = (st.st_size, st.st_mtime, st.st_ino)
+        except OSError:
+            entry = None
+        with self._lock:
+            self._set(rel_path, entry)
+
+    # إزالة ملف من الفهرس بعد حذفه
+    def remove(self, rel_path):
+        with self._lock:
+            self._set(normalize_rel_path(rel_path), None)
+
+    def get(self, rel_path):
+        return self._files.get(normalize_rel_path(rel_path))
+
+    def paths(self):
+        with self._lock:
+            return list(self._sorted)
+
+    # صفحة من المسارات المرتبة تبدأ بعد المؤشر cursor
+    # تعيد المسارات ومؤشر الصفحة التالية (None إذا انتهت النتائج)
+    def page(self, cursor='', limit=FILES_PAGE_SIZE, prefix='', extensions=None):
+        files = []
+        with self._lock:
+            keys = self._sorted
+            i = bisect_right(keys, cursor) if cursor else 0
+            if prefix:
+                i = max(i, bisect_left(keys, prefix))
+            while i < len(keys):
+                key = keys[i]
+                i += 1
+                if prefix and not key.startswith(prefix):
+                    break
+                if extensions and key.rsplit('.', 1)[-1].lower() not in extensions:
+                    continue
+                if len(files) == limit:
+                    return files, files[-1]
+                files.append(key)
+        return files, None
+
+    def totals(self):
+        with self._lock:
+            return self._total_size, len(self._files)
+
+    def site_totals(self, site):
+        if not self.namespaced:
+            return self.totals()
+        with self._lock:
+            size, count = self._site_totals.get(site, (0, 0))
+            return size, count
+
+    # المساحة الفعلية على القرص بعد احتساب الملفات المكررة مرة واحدة
+    def physical_size(self):
+        with self._lock:
+            return self._physical_size
+
+storage_index = StorageIndex(BASE_DIR, namespaced=bool(SITES_DIR))
+storage_index.reconcile()
+
+# مجلد الملف حسب امتداده: يُستخدم للحفظ في الرفع الجماعي وللروابط المختصرة (x.css -> css/x.css)
+EXTENSION_FOLDERS = {'css': 'css', 'js': 'js', 'png': 'images', 'jpg': 'images', 'jpeg': 'images', 'gif': 'images'}
+# مدة تذكر الروابط غير الموجودة قبل التحقق من القرص مجدداً، والحد الأقصى لعددها
+ROUTE_MISS_TTL = float(os.environ.get('ROUTE_MISS_TTL', 5.0))
+ROUTE_MISS_MAX = int(os.environ.get('ROUTE_MISS_MAX', 10000))
+
+# جدول الروابط: كل رابط يُطابق مساره على القرص ببحث واحد في قاموس.
+# الملف css/x.css متاح بالرابط css/x.css وبالرابط المختصر x.css ما لم يوجد ملف x.css في الجذر
+class RouteTable:
+    def __init__(self, index):
+        self.index = index
+        self._routes = {}  # url -> rel_path
+        self._misses = OrderedDict()  # url -> وقت انتهاء الصلاحية
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _alias(rel_path):
+        site, rel_path = split_site(rel_path)
+        folder, _, rest = rel_path.partition('/')
+        if rest and EXTENSION_FOLDERS.get(rest.rsplit('.', 1)[-1].lower()) == folder:
+            return site_path(site, rest)
+        return None
+
+    @staticmethod
+    def _candidates(url):
+        yield url
+        site, url = split_site(url)
+        folder = EXTENSION_FOLDERS.get(url.rsplit('.', 1)[-1].lower())
+        if folder:
+            yield site_path(site, f"{folder}/{url}")
+
+    def _refresh(self, url):
+        for rel_path in self._candidates(url):
+            if self.index.get(rel_path) is not None:
+                self._routes[url] = rel_path
+                break
+        else:
+            self._routes.pop(url, None)
+        self._misses.pop(url, None)
+
+    def rebuild(self):
+        with self._lock:
+            paths = self.index.paths()
+            routes = {rel_path: rel_path for rel_path in paths}
+            for rel_path in paths:
+                alias = self._alias(rel_path)
+                if alias:
+                    routes.setdefault(alias, rel_path)
+            self._routes = routes
+            self._misses.clear()
+
+    # تحديث الروابط المتأثرة بإضافة ملف أو حذفه (بعد تحديث الفهرس)
+    def update(self, rel_path):
+        with self._lock:
+            self._refresh(rel_path)
+            alias = self._alias(rel_path)
+            if alias:
+                self._refresh(alias)
+
+    def resolve(self, url):
+        url = normalize_rel_path(url)
+        rel_path = self._routes.get(url)
+        if rel_path is not None:
+            return rel_path
+        
+        now = time.monotonic()
+        expires = self._misses.get(url)
+        if expires is not None and expires > now:
+            return None
+        
+        # ملف أضيف خارج الخادم ولم يصل إلى الفهرس بعد
+        for rel_path in self._candidates(url):
+            path = safe_join(os.path.abspath(self.index.root), rel_path)
+            if path is not None and os.path.isfile(path):
+                self.index.update(rel_path)
+                self.update(rel_path)
+                return self._routes.get(url)
+        
+        with self._lock:
+            self._misses[url] = now + ROUTE_MISS_TTL
+            self._misses.move_to_end(url)
+            while len(self._misses) > ROUTE_MISS_MAX:
+                self._misses.popitem(last=False)
+        return None
+
+route_table = RouteTable(storage_index)
+route_table.rebuild()
+
+# المهام الخلفية: تُشغّل مرة واحدة لكل عملية عند أول طلب
+_background_tasks = []
+_background_pid = None
+_background_lock = threading.Lock()
+
+def background_task(func):
+    _background_tasks.append(func)
+    return func
+
+def start_background_tasks():
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        for task in _background_tasks:
+            threading.Thread(target=task, name=task.__name__, daemon=True).start()
+
+@app.before_request
+def ensure_background_tasks():
+    if _background_pid != os.getpid():
+        start_background_tasks()
+
+# قياس مدة كل طلب
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.active[threading.get_ident()] = request.endpoint or 'unmatched'
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        metrics.observe_request(request.endpoint or 'unmatched', response.status_code,
+                                response.content_length or 0, time.perf_counter() - start)
+    return response
+
+@app.teardown_request
+def clear_active_request(exc):
+    metrics.active.pop(threading.get_ident(), None)
+
+# تحديد معدل الطلبات لكل عميل: دلو رموز (token bucket) لكل (عنوان IP، فئة المسار)، واحد للطلبات
+# وآخر للبايتات. بايتات الاستجابة تُخصم بعد إرسالها وقد يصبح الرصيد سالباً، فتُرفض طلبات العميل
+# التالية بـ 429 حتى يُسدد. الجدول محدود الحجم (LRU) ومقسم إلى أجزاء لكل منها قفله؛ العميل الذي يُحذف
+# من الجدول يعود برصيد كامل. الحدود لكل عملية عاملة على حدة.
+# معطل افتراضياً: خلف وكيل عكسي دون RATE_LIMIT_TRUST_PROXY يشترك كل الزوار في دلو واحد
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT', '0') == '1'
+# الطلبات في الثانية والبايتات في الثانية لكل فئة (0 بلا حد)
+RATE_LIMITS = {
+    route_class: (float(os.environ.get(f'RATE_LIMIT_{route_class.upper()}_RPS', rps)),
+                  float(os.environ.get(f'RATE_LIMIT_{route_class.upper()}_BPS', bps)))
+    for route_class, rps, bps in [('static', 200, 0), ('api', 50, 0), ('upload', 10, 0)]
+}
+# الدفعة المسموح بها بعد فترة هدوء، بالثواني من المعدل
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 2.0))
+RATE_LIMIT_TABLE_SIZE = int(os.environ.get('RATE_LIMIT_TABLE_SIZE', 100000))
+RATE_LIMIT_SHARDS = 16
+# خلف وكيل عكسي: العنوان الأول في X-Forwarded-For هو عنوان العميل
+RATE_LIMIT_TRUST_PROXY = os.environ.get('RATE_LIMIT_TRUST_PROXY', '') == '1'
+
+STATIC_ENDPOINTS = {'serve_file', 'serve_bundle', 'serve_panel_asset', 'control_panel'}
+UPLOAD_ENDPOINTS = {'upload_file', 'upload_batch', 'create_upload', 'upload_chunk', 'finalize_upload'}
+
+def route_class(endpoint):
+    if endpoint in STATIC_ENDPOINTS:
+        return 'static'
+    if endpoint in UPLOAD_ENDPOINTS:
+        return 'upload'
+    return 'api'
+
+def client_address(req):
+    if RATE_LIMIT_TRUST_PROXY and req.access_route:
+        return req.access_route[0]
+    return req.remote_addr or ''
+
+class TokenBucket:
+    __slots__ = ('requests', 'bytes', 'updated')
+
+    def __init__(self, requests, nbytes, updated):
+        self.requests = requests
+        self.bytes = nbytes
+        self.updated = updated
+
+class RateLimiter:
+    def __init__(self, limits, burst, table_size, shards):
+        self.limits = limits
+        self.burst = burst
+        self.shard_size = max(1, table_size // shards)
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+        self.allowed = Counter()
+        self.limited = Counter()
+        self.evictions = 0
+
+    # الدلو بعد إضافة ما تراكم منذ آخر استخدام (يُستدعى مع قفل الجزء)
+    def _bucket(self, table, key, now):
+        rps, bps = self.limits[key[1]]
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rps * self.burst, bps * self.burst, now)
+            table[key] = bucket
+            if len(table) > self.shard_size:
+                table.popitem(last=False)
+                self.evictions += 1
+        else:
+            table.move_to_end(key)
+            elapsed = now - bucket.updated
+            bucket.requests = min(rps * self.burst, bucket.requests + elapsed * rps)
+            bucket.bytes = min(bps * self.burst, bucket.bytes + elapsed * bps)
+            bucket.updated = now
+        return bucket
+
+    def _shard(self, key):
+        return self._shards[zlib.crc32(key[0].encode('utf-8')) % len(self._shards)]
+
+    # قبول طلب (مع خصم nbytes إن كان حجمه معروفاً مسبقاً)، أو إرجاع عدد الثواني قبل المحاولة مجدداً.
+    # count=False يحد البايتات فقط دون عد الطلب
+    def acquire(self, client, route_class, nbytes=0, count=True):
+        rps, bps = self.limits[route_class]
+        if not count:
+            rps = 0
+        if not rps and not bps:
+            return 0
+        key = (client, route_class)
+        table, lock = self._shard(key)
+        with lock:
+            bucket = self._bucket(table, key, time.monotonic())
+            wait = 0
+            if rps and bucket.requests < 1:
+                wait = (1 - bucket.requests) / rps
+            if bps and bucket.bytes < 0:
+                wait = max(wait, -bucket.bytes / bps)
+            if wait:
+                self.limited[route_class] += 1
+                return wait
+            if rps:
+                bucket.requests -= 1
+            if bps:
+                bucket.bytes -= nbytes
+            self.allowed[route_class] += 1
+        return 0
+
+    # خصم بايتات الاستجابة بعد إرسالها
+    def charge(self, client, route_class, nbytes):
+        bps = self.limits[route_class][1]
+        if not bps or not nbytes:
+            return
+        key = (client, route_class)
+        table, lock = self._shard(key)
+        with lock:
+            self._bucket(table, key, time.monotonic()).bytes -= nbytes
+
+    def stats(self):
+        entries = 0
+        for table, lock in self._shards:
+            with lock:
+                entries += len(table)
+        return {
+            'entries': entries,
+            'evictions': self.evictions,
+            'allowed': dict(self.allowed),
+            'limited': dict(self.limited)
+        }
+
+rate_limiter = None
+if RATE_LIMIT_ENABLED:
+    rate_limiter = RateLimiter(RATE_LIMITS, RATE_LIMIT_BURST, RATE_LIMIT_TABLE_SIZE, RATE_LIMIT_SHARDS)
+
+def rate_limit_response(wait):
+    response = jsonify({'status': 'error', 'message': 'طلبات كثيرة، حاول مرة أخرى بعد قليل'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+@app.before_request
+def enforce_rate_limit():
+    if rate_limiter is None:
+        return None
+    route = route_class(request.endpoint)
+    # الطلب الذي قبله مسار ASGI السريع ثم أكمل إلى هنا لا يُخصم مرة ثانية
+    if not request.environ.get('sarver.rate_charged'):
+        # حجم الرفع معروف مسبقاً فيُخصم قبل قراءته
+        nbytes = (request.content_length or 0) if route == 'upload' else 0
+        # أجزاء الرفع المجزأ تُحد بالبايتات فقط، فعدد الأجزاء لا يبطئ رفع ملف كبير
+        wait = rate_limiter.acquire(client_address(request), route, nbytes, request.endpoint != 'upload_chunk')
+        if wait:
+            return rate_limit_response(wait)
+    g.rate_limit_class = route
+    return None
+
+@app.after_request
+def charge_rate_limit(response):
+    if rate_limiter is not None and g.get('rate_limit_class') in ('static', 'api'):
+        rate_limiter.charge(client_address(request), g.rate_limit_class, response.content_length or 0)
+    return response
+
+# سجل الوصول: الطلب يُضاف إلى طابور محدود في الذاكرة دون انتظار (ويُسقط ويُعد إذا امتلأ الطابور)،
+# وخيط في الخلفية يكتب السجلات دفعات بصيغة JSONL في META/logs/access.jsonl ويدوّره حسب الحجم.
+# العمليات العاملة تكتب في نفس الملف (O_APPEND، دفعة كاملة في كل write). نفس الخيط يجمع الطلبات
+# والبايتات لكل ملف في دلاء زمنية، ويحفظ لقطة منها في META/stats/<pid>.json لتجمعها /api/stats
+ACCESS_LOG_ENABLED = os.environ.get('ACCESS_LOG', '1') == '1'
+ACCESS_LOG_DIR = os.path.join(META_DIR, 'logs')
+ACCESS_LOG_QUEUE_SIZE = int(os.environ.get('ACCESS_LOG_QUEUE_SIZE', 10000))
+ACCESS_LOG_BATCH_SIZE = 1000
+# أقصى مدة (بالثواني) ينتظرها السجل في الذاكرة قبل كتابته
+ACCESS_LOG_FLUSH_INTERVAL = float(os.environ.get('ACCESS_LOG_FLUSH_INTERVAL', 1.0))
+ACCESS_LOG_MAX_BYTES = int(os.environ.get('ACCESS_LOG_MAX_MB', 64)) * 1024 * 1024
+ACCESS_LOG_BACKUPS = int(os.environ.get('ACCESS_LOG_BACKUPS', 5))
+STATS_DIR = os.path.join(META_DIR, 'stats')
+# مدة الإحصائيات المتجددة وطول كل دلو (بالثواني)
+STATS_WINDOW = int(os.environ.get('STATS_WINDOW', 3600))
+STATS_BUCKET_SECONDS = 60
+STATS_SNAPSHOT_INTERVAL = float(os.environ.get('STATS_SNAPSHOT_INTERVAL', 5.0))
+STATS_TOP_N = 10
+# أقصى عدد من الملفات المختلفة في كل دلو؛ ما يزيد يُحسب في إجمالي الموقع فقط
+STATS_MAX_FILES = int(os.environ.get('STATS_MAX_FILES', 1000))
+
+class AccessStats:
+    def __init__(self, window, bucket_seconds):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        # كل دلو: بداية الدقيقة، و{الموقع: [طلبات، بايتات]}، و{الملف: [طلبات، بايتات]}
+        self._buckets = deque()
+        self._lock = threading.Lock()
+        self.changed = False
+
+    def add(self, ts, site, key, nbytes):
+        start = int(ts // self.bucket_seconds) * self.bucket_seconds
+        with self._lock:
+            if not self._buckets or self._buckets[-1]['start'] < start:
+                self._buckets.append({'start': start, 'sites': {}, 'files': {}})
+                while self._buckets[0]['start'] <= start - self.window:
+                    self._buckets.popleft()
+            bucket = self._buckets[-1]
+            totals = bucket['sites'].setdefault(site, [0, 0])
+            totals[0] += 1
+            totals[1] += nbytes
+            if key is not None and (key in bucket['files'] or len(bucket['files']) < STATS_MAX_FILES):
+                totals = bucket['files'].setdefault(key, [0, 0])
+                totals[0] += 1
+                totals[1] += nbytes
+            self.changed = True
+
+    def dumps(self):
+        with self._lock:
+            self.changed = False
+            return json.dumps(list(self._buckets), ensure_ascii=False, separators=(',', ':'))
+
+    def buckets(self):
+        with self._lock:
+            return json.loads(json.dumps(list(self._buckets)))
+
+class AccessLog:
+    def __init__(self, directory, stats_directory, queue_size):
+        self.directory = directory
+        self.stats_directory = stats_directory
+        self.path = os.path.join(directory, 'access.jsonl')
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = AccessStats(STATS_WINDOW, STATS_BUCKET_SECONDS)
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+        self._fd = None
+        self._inode = None
+        self._write_lock = threading.Lock()
+
+    # يُستدعى في مسار الطلب: لا ترميز ولا قرص، فقط إضافة إلى الطابور
+    # rel_path: الملف الذي حلله resolve_static (مفتاح الإحصائيات)، أو None لغير الملفات
+    def record(self, ts, client, method, path, site, rel_path, status, nbytes, duration):
+        try:
+            self.queue.put_nowait((ts, client, method, path, site, rel_path, status, nbytes, duration))
+        except queue.Full:
+            self.dropped += 1
+
+    def _backup_path(self, index):
+        return os.path.join(self.directory, f"access.{index}.jsonl")
+
+    # الملف المفتوح، ويُعاد فتحه إذا دوّرته عملية أخرى
+    def _open(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._fd is not None and inode != self._inode:
+            os.close(self._fd)
+            self._fd = None
+        if self._fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._inode = os.fstat(self._fd).st_ino
+        return self._fd
+
+    # access.jsonl ← access.1.jsonl ← ... تحت قفل الملف حتى لا تدوّره عمليتان معاً
+    def _rotate(self):
+        with open(os.path.join(self.directory, 'access.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.stat(self.path).st_size < ACCESS_LOG_MAX_BYTES:
+                    return
+            except FileNotFoundError:
+                return
+            for index in range(ACCESS_LOG_BACKUPS - 1, 0, -1):
+                if os.path.exists(self._backup_path(index)):
+                    os.replace(self._backup_path(index), self._backup_path(index + 1))
+            if ACCESS_LOG_BACKUPS:
+                os.replace(self.path, self._backup_path(1))
+            else:
+                os.unlink(self.path)
+            self.rotations += 1
+
+    def _write(self, batch):
+        lines = []
+        for ts, client, method, path, site, rel_path, status, nbytes, duration in batch:
+            lines.append(json.dumps({'time': round(ts, 3), 'ip': client, 'method': method, 'site': site, 'path': path,
+                                     'status': status, 'bytes': nbytes, 'ms': round(duration * 1000, 2)},
+                                    ensure_ascii=False, separators=(',', ':')))
+            self.stats.add(ts, site, rel_path if status < 400 else None, nbytes)
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        with self._write_lock:
+            try:
+                fd = self._open()
+                os.write(fd, data)
+                self.written += len(batch)
+                if os.fstat(fd).st_size >= ACCESS_LOG_MAX_BYTES:
+                    self._rotate()
+            except OSError as e:
+                app.logger.warning('فشل كتابة سجل الوصول: %s', e)
+
+    # دفعة واحدة: أول سجل ثم ما يصل خلال ACCESS_LOG_FLUSH_INTERVAL حتى ACCESS_LOG_BATCH_SIZE
+    def _next_batch(self, timeout):
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + ACCESS_LOG_FLUSH_INTERVAL
+        while len(batch) < ACCESS_LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        last_snapshot = time.monotonic()
+        while True:
+            batch = self._next_batch(STATS_SNAPSHOT_INTERVAL)
+            if batch:
+                self._write(batch)
+            if self.stats.changed and time.monotonic() - last_snapshot >= STATS_SNAPSHOT_INTERVAL:
+                self.save_snapshot()
+                last_snapshot = time.monotonic()
+
+    # كتابة ما بقي في الطابور فوراً (عند إيقاف العملية)
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+        if self.stats.changed:
+            self.save_snapshot()
+
+    def save_snapshot(self):
+        path = os.path.join(self.stats_directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.stats_directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.stats.dumps())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            app.logger.warning('فشل حفظ إحصائيات الوصول: %s', e)
+
+    # دلاء هذه العملية ثم لقطات العمليات الأخرى، مع حذف لقطات العمليات التي توقفت منذ مدة
+    def snapshots(self):
+        result = [self.stats.buckets()]
+        own = f"{os.getpid()}.json"
+        try:
+            names = os.listdir(self.stats_directory)
+        except FileNotFoundError:
+            return result
+        cutoff = time.time() - self.stats.window
+        for name in names:
+            if name == own or not name.endswith('.json'):
+                continue
+            path = os.path.join(self.stats_directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    result.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return result
+
+    # إجمالي الطلبات والبايتات لموقع خلال آخر window ثانية، وأكثر ملفاته طلباً وأكبرها استهلاكاً
+    def summary(self, site, top, window):
+        since = time.time() - window
+        prefix = f"{site}/" if site else ''
+        requests = nbytes = 0
+        files = {}
+        for buckets in self.snapshots():
+            for bucket in buckets:
+                if bucket['start'] + self.stats.bucket_seconds <= since:
+                    continue
+                totals = bucket['sites'].get(site)
+                if totals:
+                    requests += totals[0]
+                    nbytes += totals[1]
+                for key, (hits, size) in bucket['files'].items():
+                    if key.startswith(prefix):
+                        totals = files.setdefault(key[len(prefix):], [0, 0])
+                        totals[0] += hits
+                        totals[1] += size
+
+        def ranked(index):
+            ordered = sorted(files.items(), key=lambda item: item[1][index], reverse=True)[:top]
+            return [{'path': path, 'hits': hits, 'bytes': size} for path, (hits, size) in ordered]
+
+        return {
+            'window': window,
+            'requests': requests,
+            'bytes': nbytes,
+            'files': len(files),
+            'top_hits': ranked(0),
+            'top_bytes': ranked(1),
+            'dropped': self.dropped
+        }
+
+access_log = AccessLog(ACCESS_LOG_DIR, STATS_DIR, ACCESS_LOG_QUEUE_SIZE) if ACCESS_LOG_ENABLED else None
+
+@background_task
+def access_log_writer():
+    if access_log is not None:
+        access_log.run()
+
+@app.after_request
+def log_access(response):
+    if access_log is not None:
+        start = g.get('request_start')
+        access_log.record(time.time(), client_address(request), request.method, request.path, g.get('site') or '',
+                          request.environ.get('sarver.rel_path'), response.status_code, response.content_length or 0,
+                          time.perf_counter() - start if start is not None else 0)
+    return response
+
+@background_task
+def storage_reconcile_loop():
+    while True:
+        time.sleep(STORAGE_RECONCILE_INTERVAL)
+        try:
+            storage_index.reconcile()
+            route_table.rebuild()
+            metadata_store.retain(storage_index.paths())
+        except OSError as e:
+            app.logger.warning('فشل مطابقة فهرس التخزين: %s', e)
+
+# حدود المساحة المخصصة لمواقع بعينها، تُقرأ من جديد إذا تغير الملف
+class SiteQuotas:
+    def __init__(self, path):
+        self.path = path
+        self._quotas = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._quotas = json.load(f)
+        except (OSError, ValueError):
+            self._quotas = {}
+        self._mtime = mtime
+
+    # الحد بالبايت (0 بلا حد)
+    def get(self, site):
+        with self._lock:
+            self._refresh()
+            quota_mb = self._quotas.get(site, SITE_QUOTA_MB)
+        return int(quota_mb * 1024 * 1024)
+
+    def set(self, site, quota_mb):
+        with self._lock:
+            self._refresh()
+            self._quotas[site] = quota_mb
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._quotas, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+site_quotas = SiteQuotas(os.path.join(META_DIR, 'sites.json'))
+
+class QuotaExceeded(Exception):
+    pass
+
+# التحقق من أن الملفات الجديدة لن تتجاوز مساحة الموقع (الملفات المستبدلة لا تُحسب مرتين)
+def check_quota(site, incoming, replacing=()):
+    quota = site_quotas.get(site)
+    if not quota:
+        return
+    used, _ = storage_index.site_totals(site)
+    for rel_path in replacing:
+        indexed = storage_index.get(rel_path)
+        if indexed is not None:
+            used -= indexed[0]
+    if used + incoming > quota:
+        raise QuotaExceeded(f'تم تجاوز المساحة المخصصة للموقع ({round(quota / (1024 * 1024), 2)} MB)')
+
+# دالة لحساب مساحة التخزين (لموقع واحد في وضع تعدد المواقع)
+def get_storage_info(site=''):
+    total_size, file_count = storage_index.site_totals(site)
+    quota = site_quotas.get(site)
     
     # تحويل البايت إلى ميغابايت
     total_size_mb = total_size / (1024 * 1024)
     
-    return {
+    info = {
         'total_size': total_size,
         'total_size_mb': round(total_size_mb, 2),
-        'file_count': file_count
+        'file_count': file_count,
+        'quota': quota,
+        'quota_mb': round(quota / (1024 * 1024), 2)
     }
+    # المساحة الفعلية مشتركة بين المواقع (المحتوى المكرر يُحفظ مرة واحدة)
+    if not SITES_DIR:
+        physical_size = storage_index.physical_size()
+        info['physical_size'] = physical_size
+        info['physical_size_mb'] = round(physical_size / (1024 * 1024), 2)
+    return info
 
-# واجهة التحكم الجميلة مع قسم التخزين
-CONTROL_PANEL = f'''
-<!DOCTYPE html>
-<html lang="ar" dir="rtl">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>نظام الاستضافة المتكامل</title>
-    <link href="https://fonts.googleapis.com/css2?family=Tajawal:wght@400;500;700&display=swap" rel="stylesheet">
-    <style>
+# تحديد الموقع المطلوب من الطلب (يعمل مع كائن Request من Werkzeug خارج سياق Flask أيضاً)
+def site_for_request(req):
+    if not SITES_DIR:
+        return ''
+    site = req.environ.get('sarver.site')
+    if site is None and SITES_HOST_SUFFIX:
+        host = req.host.rsplit(':', 1)[0].lower()
+        if host.endswith(SITES_HOST_SUFFIX):
+            site = host[:-len(SITES_HOST_SUFFIX)]
+    if site and SITE_NAME.match(site) and os.path.isdir(os.path.join(SITES_DIR, site)):
+        return site
+    return None
+
+# بادئة المسار /sites/<site>/ تُنقل إلى SCRIPT_NAME حتى تعمل كل المسارات داخل الموقع كما هي
+def apply_site_prefix(environ):
+    path = environ.get('PATH_INFO', '')
+    if SITES_DIR and path.startswith(SITES_PATH_PREFIX):
+        site, _, rest = path[len(SITES_PATH_PREFIX):].partition('/')
+        environ['sarver.site'] = site
+        environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + SITES_PATH_PREFIX + site
+        environ['PATH_INFO'] = '/' + rest
+    return environ
+
+class SitePrefixMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        return self.wsgi_app(apply_site_prefix(environ), start_response)
+
+app.wsgi_app = SitePrefixMiddleware(app.wsgi_app)
+
+# المسارات العامة التي لا تخص موقعاً بعينه
+GLOBAL_ENDPOINTS = {'metrics_api', 'profile_api', 'cache_stats_api', 'serve_bundle', 'serve_panel_asset'}
+
+@app.before_request
+def resolve_site():
+    g.site = site_for_request(request)
+    if g.site is None and request.endpoint not in GLOBAL_ENDPOINTS:
+        abort(404)
+
+@app.errorhandler(QuotaExceeded)
+def quota_exceeded(e):
+    return jsonify({'status': 'error', 'message': str(e)}), 413
+
+# إعدادات ذاكرة الملفات الساخنة (0 لتعطيلها)
+HOT_CACHE_MAX_BYTES = int(os.environ.get('HOT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+HOT_CACHE_MAX_FILE_SIZE = int(os.environ.get('HOT_CACHE_MAX_FILE_SIZE', 1024 * 1024))
+# أقل مدة (بالثواني) بين فحصين لتاريخ تعديل الملف المخزن
+HOT_CACHE_REVALIDATE_INTERVAL = float(os.environ.get('HOT_CACHE_REVALIDATE_INTERVAL', 1.0))
+
+class HotCacheEntry:
+    __slots__ = ('data', 'size', 'mtime', 'mimetype', 'checked')
+
+    def __init__(self, data, mtime, mimetype):
+        self.data = data
+        self.size = len(data)
+        self.mtime = mtime
+        self.mimetype = mimetype
+        self.checked = time.monotonic()
+
+# ذاكرة LRU محدودة بالحجم لمحتوى الملفات الأكثر طلباً
+# المفتاح هو المسار المطلق للملف على القرص
+class HotCache:
+    def __init__(self, max_bytes, max_file_size, revalidate_interval):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.revalidate_interval = revalidate_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+        
+        # التحقق من أن الملف لم يتغير على القرص
+        now = time.monotonic()
+        if now - entry.checked >= self.revalidate_interval:
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is None or st.st_mtime != entry.mtime or st.st_size != entry.size:
+                self.invalidate(path)
+                with self._lock:
+                    self.misses += 1
+                return None
+            entry.checked = now
+        
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    # قراءة الملف من القرص وتخزينه إن كان حجمه مناسباً
+    def load(self, path, mimetype=None):
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_size > self.max_file_size:
+                    return None
+                data = f.read()
+        except OSError:
+            return None
+        
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        entry = HotCacheEntry(data, st.st_mtime, mimetype)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[path] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+hot_cache = HotCache(HOT_CACHE_MAX_BYTES, HOT_CACHE_MAX_FILE_SIZE, HOT_CACHE_REVALIDATE_INTERVAL)
+
+# الفاصل الزمني (بالثواني) لحفظ البيانات الوصفية على القرص
+METADATA_FLUSH_INTERVAL = float(os.environ.get('METADATA_FLUSH_INTERVAL', 2.0))
+HASH_CHUNK_SIZE = 64 * 1024
+
+# حساب بصمة المحتوى المستخدمة كـ ETag
+def content_hash():
+    return hashlib.sha256()
+
+def etag_from_hash(hasher):
+    return hasher.hexdigest()[:32]
+
+def hash_file(path):
+    hasher = content_hash()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return etag_from_hash(hasher)
+
+# تثبيت الملفات على القرص (fsync) قبل نقلها إلى مكانها، حتى لا يبقى بعد انقطاع الكهرباء ملف فارغ أو ناقص
+FSYNC_WRITES = os.environ.get('FSYNC_WRITES', '1') == '1'
+
+def fsync_file(f):
+    if FSYNC_WRITES:
+        f.flush()
+        os.fsync(f.fileno())
+
+# تثبيت عملية النقل أو الحذف نفسها (مدخل المجلد)
+def fsync_dir(path):
+    if not FSYNC_WRITES or not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# حفظ البيانات مع حساب بصمتها أثناء الكتابة
+def save_stream(stream, save_path):
+    hasher = content_hash()
+    with metrics.timer('file_save'), open(save_path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            out.write(chunk)
+        fsync_file(out)
+    return etag_from_hash(hasher)
+
+# حفظ الملف المرفوع
+def save_upload(file, save_path):
+    return save_stream(file.stream, save_path)
+
+# مخزن البيانات الوصفية لكل ملف (ETag وغيرها) في ملف جانبي
+# كل سجل مرتبط بحجم الملف وتاريخ تعديله، ويُتجاهل إذا تغير أي منهما
+class MetadataStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, rel_path, size, mtime):
+        entry = self._entries.get(rel_path)
+        if entry is not None and entry['size'] == size and entry['mtime'] == mtime:
+            return entry
+        return None
+
+    def put(self, rel_path, size, mtime, **fields):
+        entry = dict(fields, size=size, mtime=mtime)
+        with self._lock:
+            self._entries[rel_path] = entry
+            self._dirty = True
+        return entry
+
+    # إضافة حقول إلى سجل موجود ما دام الملف لم يتغير
+    def update(self, rel_path, size, mtime, **fields):
+        with self._lock:
+            entry = self._entries.get(rel_path)
+            if entry is None or entry['size'] != size or entry['mtime'] != mtime:
+                return None
+            entry = dict(entry, **fields)
+            self._entries[rel_path] = entry
+            self._dirty = True
+        return entry
+
+    def remove(self, rel_path):
+        with self._lock:
+            if self._entries.pop(rel_path, None) is not None:
+                self._dirty = True
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    # حذف سجلات الملفات التي لم تعد موجودة
+    def retain(self, rel_paths):
+        keep = set(rel_paths)
+        with self._lock:
+            stale = [p for p in self._entries if p not in keep]
+            for rel_path in stale:
+                del self._entries[rel_path]
+            if stale:
+                self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries, ensure_ascii=False)
+            self._dirty = False
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+metadata_store = MetadataStore(os.path.join(META_DIR, 'metadata.json'))
+atexit.register(metadata_store.flush)
+
+# مخزن المحتوى المعنون ببصمته (اختياري): كل محتوى يُحفظ مرة واحدة في مجلد blobs
+# وملفات الموقع روابط صلبة (hardlink) إليه، لذلك يجب أن يكون META_DIR وBASE_DIR على نفس القرص.
+# الملفات المخزنة للقراءة فقط حتى لا يغيّر تعديلٌ مباشر على ملف محتوى الملفات المرتبطة به
+BLOB_STORE_ENABLED = os.environ.get('BLOB_STORE', '') == '1'
+BLOB_GC_INTERVAL = int(os.environ.get('BLOB_GC_INTERVAL', 3600))
+TMP_DIR = os.path.join(WORK_DIR, 'tmp')
+os.makedirs(TMP_DIR, exist_ok=True)
+
+class BlobStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    # نقل ملف مكتوب حديثاً إلى المخزن (أو حذفه إن كان محتواه موجوداً) ثم ربطه بمساره في الموقع
+    def ingest(self, src_path, dest_path, digest):
+        blob = self.path(digest)
+        tmp_link = f"{dest_path}.{uuid.uuid4().hex}.link"
+        with self._lock:
+            if os.path.exists(blob):
+                os.remove(src_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.chmod(src_path, 0o444)
+                os.replace(src_path, blob)
+            os.link(blob, tmp_link)
+        os.replace(tmp_link, dest_path)
+
+    # حذف المحتوى إذا لم يعد أي ملف في الموقع مرتبطاً به
+    def collect(self, digest):
+        blob = self.path(digest)
+        with self._lock:
+            try:
+                if os.stat(blob).st_nlink == 1:
+                    os.remove(blob)
+                    return True
+            except OSError:
+                pass
+        return False
+
+    # مسح كامل للمخزن لحذف كل محتوى غير مرتبط
+    def gc(self):
+        removed = 0
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if os.path.isdir(prefix_dir):
+                for digest in os.listdir(prefix_dir):
+                    removed += self.collect(digest)
+        return removed
+
+    def stats(self):
+        blobs = 0
+        size = 0
+        for _, st in scan_tree(self.directory):
+            size += st.st_size
+            blobs += 1
+        return {'blobs': blobs, 'size': size}
+
+blob_store = BlobStore(os.path.join(META_DIR, 'blobs')) if BLOB_STORE_ENABLED else None
+
+@background_task
+def blob_gc_loop():
+    while blob_store is not None:
+        time.sleep(BLOB_GC_INTERVAL)
+        try:
+            blob_store.gc()
+        except OSError as e:
+            app.logger.warning('فشل تنظيف مخزن المحتوى: %s', e)
+
+# بصمة المحتوى الحالي لملف في الموقع (إن كانت معروفة)
+def current_digest(rel_path):
+    indexed = storage_index.get(rel_path)
+    if indexed is None:
+        return None
+    entry = metadata_store.get(rel_path, *indexed)
+    return entry['etag'] if entry is not None else None
+
+# وضع ملف مكتوب في مجلد مؤقت في مكانه النهائي داخل الموقع
+def place_file(src_path, rel_path, digest):
+    dest_path = os.path.join(BASE_DIR, rel_path)
+    if blob_store is None:
+        os.replace(src_path, dest_path)
+    else:
+        previous = current_digest(rel_path)
+        blob_store.ingest(src_path, dest_path, digest)
+        if previous is not None and previous != digest:
+            blob_store.collect(previous)
+    fsync_dir(os.path.dirname(dest_path))
+
+# حذف ملف من الموقع مع حذف محتواه من المخزن إن لم يعد مستخدماً
+def remove_site_file(rel_path):
+    previous = current_digest(rel_path) if blob_store is not None else None
+    path = os.path.join(BASE_DIR, rel_path)
+    os.remove(path)
+    fsync_dir(os.path.dirname(path))
+    if previous is not None:
+        blob_store.collect(previous)
+
+# ملف مؤقت على نفس القرص لكتابة المحتوى قبل نقله إلى مكانه
+def temp_upload_path():
+    return os.path.join(TMP_DIR, uuid.uuid4().hex)
+
+# أقفال المسارات: كل مسار يقع في خانة من PATH_LOCK_STRIPES خانة، فالكتابة على نفس المسار تتسلسل
+# والكتابة على مسارات مختلفة تتم بالتوازي دون قفل عام. القفل يشمل العمليات العاملة الأخرى
+# بقفل بايت واحد (رقم الخانة) في ملف مشترك عبر fcntl.lockf
+PATH_LOCK_STRIPES = int(os.environ.get('PATH_LOCK_STRIPES', 256))
+
+class PathLocks:
+    def __init__(self, path, stripes):
+        self.path = path
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._fd = None
+        self._fd_lock = threading.Lock()
+        self.contended = 0
+
+    # الملف يُفتح مرة واحدة لكل عملية: إغلاق أي واصف له يحرر كل أقفال العملية عليه
+    def _lock_fd(self):
+        if fcntl is None:
+            return None
+        with self._fd_lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            return self._fd
+
+    # الخانات تُقفل بترتيب ثابت حتى لا تتعارض عمليتان تقفلان عدة مسارات
+    @contextmanager
+    def hold(self, *rel_paths):
+        stripes = sorted({zlib.crc32(rel_path.encode('utf-8')) % self.stripes for rel_path in rel_paths})
+        fd = self._lock_fd()
+        held = []
+        try:
+            for stripe in stripes:
+                lock = self._locks[stripe]
+                if not lock.acquire(blocking=False):
+                    self.contended += 1
+                    lock.acquire()
+                held.append(stripe)
+                if fd is not None:
+                    try:
+                        fcntl.lockf(fd, fcntl.LOCK_EX, 1, stripe)
+                    except BaseException:
+                        held.pop()
+                        lock.release()
+                        raise
+            yield
+        finally:
+            for stripe in reversed(held):
+                if fd is not None:
+                    fcntl.lockf(fd, fcntl.LOCK_UN, 1, stripe)
+                self._locks[stripe].release()
+
+path_locks = PathLocks(os.path.join(META_DIR, 'paths.lock'), PATH_LOCK_STRIPES)
+
+class WriteConflict(Exception):
+    pass
+
+@app.errorhandler(WriteConflict)
+def write_conflict(e):
+    return jsonify({'status': 'error', 'message': str(e)}), 412
+
+# If-Match: الكتابة أو الحذف فقط إذا كان الملف ما زال بالبصمة التي قرأها العميل
+def check_if_match(rel_path, if_match):
+    if not if_match:
+        return
+    indexed = storage_index.get(rel_path)
+    meta = get_file_metadata(rel_path, os.path.join(BASE_DIR, rel_path), *indexed) if indexed is not None else None
+    if meta is None or not if_match.contains(meta['etag']):
+        raise WriteConflict('تم تعديل الملف منذ قراءته')
+
+# خطوة الحفظ الواحدة تحت قفل المسار: نقل الملف المكتوب إلى مكانه ثم تحديث الفهرس والبيانات الوصفية والذاكرة المؤقتة
+def write_site_file(src_path, rel_path, etag, if_match=None):
+    with path_locks.hold(rel_path):
+        check_if_match(rel_path, if_match)
+        place_file(src_path, rel_path, etag)
+        commit_file(rel_path, etag)
+
+# حذف ملف من الموقع وكل ما يخصه، أو False إذا لم يكن موجوداً
+def delete_site_file(rel_path, if_match=None):
+    with path_locks.hold(rel_path):
+        if not os.path.isfile(os.path.join(BASE_DIR, rel_path)):
+            return False
+        check_if_match(rel_path, if_match)
+        remove_site_file(rel_path)
+        forget_file(rel_path)
+    return True
+
+@background_task
+def metadata_flush_loop():
+    while True:
+        time.sleep(METADATA_FLUSH_INTERVAL)
+        try:
+            metadata_store.flush()
+        except OSError as e:
+            app.logger.warning('فشل حفظ البيانات الوصفية: %s', e)
+
+# إرجاع البيانات الوصفية للملف، وحساب ETag مرة واحدة إذا لم يكن معروفاً
+def get_file_metadata(rel_path, path, size, mtime):
+    entry = metadata_store.get(rel_path, size, mtime)
+    if entry is not None:
+        return entry
+    try:
+        etag = hash_file(path)
+    except OSError:
+        return None
+    return metadata_store.put(rel_path, size, mtime, etag=etag)
+
+# إعدادات الضغط المسبق للملفات النصية
+COMPRESSIBLE_EXTENSIONS = {'html', 'css', 'js'}
+VARIANTS_DIR = os.path.join(META_DIR, 'variants')
+
+# الترميزات المتاحة مرتبة حسب الأفضلية: (الترميز، اللاحقة، دالة الضغط)
+COMPRESSORS = [('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+if brotli is not None:
+    COMPRESSORS.insert(0, ('br', '.br', lambda data: brotli.compress(data, quality=11)))
+ENCODING_SUFFIXES = {encoding: suffix for encoding, suffix, _ in COMPRESSORS}
+
+def is_compressible(rel_path):
+    return rel_path.rsplit('.', 1)[-1].lower() in COMPRESSIBLE_EXTENSIONS
+
+# النسخ المضغوطة تحفظ خارج مجلد الموقع حتى لا تظهر في القائمة أو تُحسب في التخزين
+def variant_path(rel_path, suffix):
+    return os.path.join(VARIANTS_DIR, rel_path + suffix)
+
+# إنشاء النسخ المضغوطة لملف واحد وتسجيلها في البيانات الوصفية
+def build_variants(rel_path):
+    indexed = storage_index.get(rel_path)
+    if indexed is None:
+        return []
+    size, mtime = indexed
+    path = os.path.join(BASE_DIR, rel_path)
+    meta = get_file_metadata(rel_path, path, size, mtime)
+    if meta is None:
+        return []
+    # الملف المبني (المصغر) هو ما يُرسل، فيُضغط بدل الأصل
+    with open(build_path(rel_path) if meta.get('build') else path, 'rb') as f:
+        data = f.read()
+    
+    encodings = []
+    for encoding, suffix, compress in COMPRESSORS:
+        out_path = variant_path(rel_path, suffix)
+        compressed = compress(data)
+        # لا فائدة من نسخة مضغوطة أكبر من الأصل
+        if len(compressed) >= len(data):
+            continue
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, out_path)
+        hot_cache.invalidate(os.path.abspath(out_path))
+        encodings.append(encoding)
+    
+    metadata_store.update(rel_path, size, mtime, encodings=encodings)
+    invalidation_bus.publish({'type': 'variants', 'path': rel_path, 'size': size, 'mtime': mtime, 'encodings': encodings})
+    return encodings
+
+def invalidate_variants(rel_path):
+    for _, suffix, _ in COMPRESSORS:
+        hot_cache.invalidate(os.path.abspath(variant_path(rel_path, suffix)))
+
+def remove_variants(rel_path):
+    for _, suffix, _ in COMPRESSORS:
+        try:
+            os.remove(variant_path(rel_path, suffix))
+        except OSError:
+            pass
+    invalidate_variants(rel_path)
+
+# طابور الضغط: الرفع لا ينتظر الضغط، بل يضيف الملف إلى الطابور
+compression_queue = queue.Queue()
+
+def schedule_compression(rel_path):
+    if is_compressible(rel_path):
+        compression_queue.put(rel_path)
+
+@background_task
+def compression_worker():
+    while True:
+        rel_path = compression_queue.get()
+        try:
+            if BUILD_ON_UPLOAD:
+                build_asset(rel_path)
+            build_variants(rel_path)
+        except Exception as e:
+            # ملف واحد معطوب لا يوقف الضغط لبقية الملفات
+            app.logger.warning('فشل ضغط الملف %s: %s', rel_path, e)
+
+# ضغط كل الملفات الموجودة مسبقاً (أمر compress في سطر الأوامر)
+def backfill_variants():
+    count = 0
+    for rel_path in storage_index.paths():
+        if is_compressible(rel_path) and build_variants(rel_path):
+            count += 1
+    metadata_store.flush()
+    return count
+
+# إعدادات تحسين الصور (تتطلب مكتبة Pillow): إزالة البيانات الوصفية وإعادة الضغط،
+# مع نسخ WebP ونسخ مصغرة بالعروض المحددة
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+IMAGE_OPTIMIZATION_ENABLED = Image is not None and os.environ.get('IMAGE_OPTIMIZATION', '1') == '1'
+IMAGE_WIDTHS = sorted(int(w) for w in os.environ.get('IMAGE_WIDTHS', '320,640,1024,1920').split(','))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 82))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+IMAGES_DIR = os.path.join(META_DIR, 'images')
+
+def is_image(rel_path):
+    return rel_path.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+# نسخ الصورة تُحفظ في مجلد باسم بصمة المحتوى، فلا تختلط نسخ محتوى قديم بنسخ محتوى جديد
+def image_variant_dir(rel_path, etag=None):
+    directory = os.path.join(IMAGES_DIR, rel_path)
+    return os.path.join(directory, etag) if etag else directory
+
+# معالجة صورة واحدة، تعمل في عملية منفصلة حتى لا تحجز خيوط الطلبات
+def optimize_image(src_path, out_dir, widths, quality):
+    with Image.open(src_path) as image:
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+    ext = src_path.rsplit('.', 1)[-1].lower()
+    os.makedirs(out_dir, exist_ok=True)
+    
+    def save(img, name, fmt, **options):
+        out_path = os.path.join(out_dir, name)
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
+        img.save(tmp_path, fmt, **options)
+        os.replace(tmp_path, out_path)
+        return os.path.getsize(out_path)
+    
+    def save_original_format(img, name):
+        if image_format == 'JPEG':
+            return save(img.convert('RGB'), name, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return save(img, name, image_format, optimize=True)
+    
+    targets = [('full', image)]
+    for width in widths:
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            targets.append((f"w{width}", image.resize((width, height), Image.LANCZOS)))
+    
+    variants = []
+    full_size = os.path.getsize(src_path)
+    for label, img in targets:
+        size = save_original_format(img, f"{label}.{ext}")
+        # النسخة المعاد ضغطها بالحجم الأصلي لا تُستخدم إلا إذا كانت أصغر من الأصل
+        if label == 'full' and size >= full_size:
+            os.remove(os.path.join(out_dir, f"{label}.{ext}"))
+        else:
+            variants.append(f"{label}.{ext}")
+            if label == 'full':
+                full_size = size
+        webp_size = save(img, f"{label}.webp", 'WEBP', quality=quality, method=6)
+        if label == 'full' and webp_size >= full_size:
+            os.remove(os.path.join(out_dir, f"{label}.webp"))
+        else:
+            variants.append(f"{label}.webp")
+    widths = [int(label[1:]) for label, _ in targets[1:]]
+    return {'width': image.width, 'widths': widths, 'variants': variants}
+
+# مجموعة العمليات تُنشأ عند أول استخدام في كل عملية (بعد fork في وضع تعدد العمليات)
+_image_pool = None
+_image_pool_pid = None
+_image_pool_lock = threading.Lock()
+
+# عمليات الصور لا تُنشأ بـ fork من الخادم: خيوطه (المسح، سجل الوصول، الطلبات) قد تمسك أقفالاً
+# تُنسخ ممسوكة إلى العملية الجديدة فتتوقف عندها. خادم forkserver يستورد هذه الوحدة مرة واحدة
+# وتتفرع العمليات منه، وspawn حيث لا يتوفر forkserver
+def image_pool_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def image_pool():
+    global _image_pool, _image_pool_pid
+    with _image_pool_lock:
+        if _image_pool_pid != os.getpid():
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=image_pool_context())
+            _image_pool_pid = os.getpid()
+        return _image_pool
+
+def schedule_image_optimization(rel_path):
+    if not IMAGE_OPTIMIZATION_ENABLED or not is_image(rel_path):
+        return
+    indexed = storage_index.get(rel_path)
+    if indexed is None:
+        return
+    size, mtime = indexed
+    path = os.path.join(BASE_DIR, rel_path)
+    meta = get_file_metadata(rel_path, path, size, mtime)
+    if meta is None:
+        return
+    out_dir = image_variant_dir(rel_path, meta['etag'])
+    future = image_pool().submit(optimize_image, path, out_dir, IMAGE_WIDTHS, IMAGE_QUALITY)
+    future.add_done_callback(lambda f: finish_image_optimization(rel_path, size, mtime, out_dir, f))
+
+def finish_image_optimization(rel_path, size, mtime, out_dir, future):
+    try:
+        images = future.result()
+    except Exception as e:
+        app.logger.warning('فشل تحسين الصورة %s: %s', rel_path, e)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return
+    # تغيرت الصورة أثناء المعالجة: النسخ الناتجة لم تعد صالحة
+    if metadata_store.update(rel_path, size, mtime, images=images) is None:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return
+    invalidation_bus.publish({'type': 'images', 'path': rel_path, 'size': size, 'mtime': mtime, 'images': images})
+
+def remove_image_variants(rel_path):
+    if is_image(rel_path):
+        shutil.rmtree(image_variant_dir(rel_path), ignore_errors=True)
+
+# اختيار أنسب نسخة: أصغر عرض لا يقل عن ?w= المطلوب، وWebP إذا كان المتصفح يقبله
+def select_image_variant(req, rel_path, images):
+    if not images:
+        return None
+    label = 'full'
+    width = req.args.get('w', type=int)
+    if width:
+        fits = [w for w in images['widths'] if w >= width]
+        if fits:
+            label = f"w{fits[0]}"
+    accepts_webp = any(value == 'image/webp' and quality > 0 for value, quality in req.accept_mimetypes)
+    candidates = [f"{label}.webp"] if accepts_webp else []
+    candidates.append(f"{label}.{rel_path.rsplit('.', 1)[-1].lower()}")
+    for name in candidates:
+        if name in images['variants']:
+            return name
+    return None
+
+# مرحلة البناء: تصغير html/css/js في نسخ مشتقة، وجمع ملفات css/js المحلية في صفحة html
+# في حزم تحمل بصمة محتواها (/_bundles/<بصمة>.css) تُخزن في المتصفح دون انتهاء.
+# تعمل بعد كل رفع إذا كان BUILD_ON_UPLOAD=1، أو بالأمر: python sarver.py build
+BUILD_ON_UPLOAD = os.environ.get('BUILD_ON_UPLOAD', '') == '1'
+BUILD_DIR = os.path.join(META_DIR, 'build')
+BUNDLES_DIR = os.path.join(META_DIR, 'bundles')
+BUNDLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+os.makedirs(BUNDLES_DIR, exist_ok=True)
+
+def build_path(rel_path):
+    return os.path.join(BUILD_DIR, rel_path)
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+CSS_STRING = re.compile(r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')''')
+CSS_COMMENT = re.compile(r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')|/\*.*?\*/''', re.S)
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+HTML_RAW = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.S | re.I)
+HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+BUNDLE_TAG = re.compile(r'<link\b([^>]*)>|<script\b([^>]*)>\s*</script\s*>', re.I)
+TAG_ATTR = re.compile(r'''([\w-]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?''')
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = CSS_COMMENT.sub(lambda m: m.group(1) or '', text)
+    parts = CSS_STRING.split(text)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[i])
+        parts[i] = re.sub(r' ?([{};,>]) ?', r'\1', part).replace(';}', '}')
+    return ''.join(parts).strip()
+
+# بدون rjsmin: حذف المسافات في بداية ونهاية الأسطر والأسطر الفارغة فقط، ولا يُلمس الملف إذا احتوى
+# على نصوص قالبية (`) أو نصوص ممتدة على أكثر من سطر (\ في نهاية السطر) قد تتأثر بذلك
+def minify_js(text):
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    if '`' in text or re.search(r'\\\r?\n', text):
+        return text
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+# محتوى pre وtextarea وscript وstyle يبقى كما هو
+def minify_html(text):
+    parts = HTML_RAW.split(text)
+    out = []
+    for i in range(0, len(parts), 3):
+        out.append(re.sub(r'\s+', ' ', HTML_COMMENT.sub('', parts[i])))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return ''.join(out).strip()
+
+MINIFIERS = {'css': minify_css, 'js': minify_js, 'html': minify_html}
+
+def tag_attrs(text):
+    return {name.lower(): value.strip('"\'') for name, value in TAG_ATTR.findall(text)}
+
+# مسار الملف المحلي الذي يشير إليه رابط في صفحة، أو None إن لم يكن ملفاً في الموقع
+def local_asset(page_rel_path, url):
+    if not url or re.match(r'^([a-z][a-z0-9+.-]*:|//)', url, re.I) or '?' in url or '#' in url:
+        return None
+    site, page_path = split_site(page_rel_path)
+    if not url.startswith('/'):
+        url = os.path.join(os.path.dirname(page_path), url)
+    rel_path = site_rel_path(site, url)
+    return route_table.resolve(rel_path) if rel_path is not None else None
+
+# الوسوم القابلة للجمع: ملف css بـ rel=stylesheet أو سكربت خارجي عادي (بلا async/defer/module)
+def bundle_member(page_rel_path, match):
+    if match.group(1) is not None:
+        attrs = tag_attrs(match.group(1))
+        if attrs.get('rel', '').lower() != 'stylesheet' or set(attrs) - {'rel', 'href', 'type'}:
+            return None
+        return 'css', local_asset(page_rel_path, attrs.get('href'))
+    attrs = tag_attrs(match.group(2))
+    if set(attrs) - {'src', 'type'} or attrs.get('type', 'text/javascript').lower() != 'text/javascript':
+        return None
+    return 'js', local_asset(page_rel_path, attrs.get('src'))
+
+# روابط url() النسبية في css تصبح مطلقة حتى تعمل من مجلد الحزم
+def absolutize_css_urls(text, rel_path):
+    base = os.path.dirname(split_site(rel_path)[1])
+    
+    def rewrite(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z][a-z0-9+.-]*:|/|#)', url, re.I):
+            return match.group(0)
+        return f"url({quote}/{normalize_rel_path(os.path.join(base, url))}{quote})"
+    return CSS_URL.sub(rewrite, text)
+
+def write_bundle(kind, members):
+    sources = []
+    for rel_path in members:
+        # بايتات الملف غير الصالحة في UTF-8 تبقى كما هي في الحزمة
+        with open(os.path.join(BASE_DIR, rel_path), encoding='utf-8', errors='surrogateescape') as f:
+            text = f.read()
+        if kind == 'css':
+            sources.append(minify_css(absolutize_css_urls(text, rel_path)))
+        else:
+            sources.append(minify_js(text))
+    data = ('\n' if kind == 'css' else ';\n').join(sources).encode('utf-8', 'surrogateescape')
+    hasher = content_hash()
+    hasher.update(data)
+    name = f"{hasher.hexdigest()[:16]}.{kind}"
+    path = os.path.join(BUNDLES_DIR, name)
+    if not os.path.exists(path):
+        for _, suffix, compress in COMPRESSORS:
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                write_atomic(path + suffix, compressed)
+        write_atomic(path, data)
+    return name
+
+# استبدال كل مجموعة متتالية من وسوم css أو js المحلية في الصفحة بحزمة واحدة
+def bundle_page(rel_path, html):
+    runs = []
+    for match in BUNDLE_TAG.finditer(html):
+        member = bundle_member(rel_path, match)
+        if member is None or member[1] is None:
+            continue
+        last = runs[-1] if runs else None
+        if last and last['kind'] == member[0] and not html[last['end']:match.start()].strip():
+            last['members'].append(member[1])
+            last['end'] = match.end()
+        else:
+            runs.append({'kind': member[0], 'start': match.start(), 'end': match.end(), 'members': [member[1]]})
+    
+    deps = []
+    bundles = []
+    for run in reversed(runs):
+        name = write_bundle(run['kind'], run['members'])
+        if run['kind'] == 'css':
+            tag = f'<link rel="stylesheet" href="/_bundles/{name}">'
+        else:
+            tag = f'<script src="/_bundles/{name}"></script>'
+        html = html[:run['start']] + tag + html[run['end']:]
+        deps.extend(run['members'])
+        bundles.append(name)
+    return html, sorted(set(deps)), bundles
+
+# الصفحات التي تعتمد حزمها على ملف css/js معين، لإعادة بنائها عند تغيره
+bundle_dependents = {}
+bundle_dependents_lock = threading.Lock()
+
+def set_bundle_deps(page_rel_path, deps):
+    with bundle_dependents_lock:
+        for pages in bundle_dependents.values():
+            pages.discard(page_rel_path)
+        for rel_path in deps:
+            bundle_dependents.setdefault(rel_path, set()).add(page_rel_path)
+
+for _rel_path, _entry in metadata_store.items():
+    if _entry.get('build'):
+        set_bundle_deps(_rel_path, _entry['build'].get('deps', []))
+
+def schedule_dependents(rel_path):
+    if BUILD_ON_UPLOAD:
+        with bundle_dependents_lock:
+            pages = list(bundle_dependents.get(rel_path, ()))
+        for page in pages:
+            compression_queue.put(page)
+
+# بناء النسخة المصغرة لملف واحد (مع جمع ملفات الصفحة في حزم إذا كان html)
+def build_asset(rel_path):
+    ext = rel_path.rsplit('.', 1)[-1].lower()
+    indexed = storage_index.get(rel_path)
+    if ext not in MINIFIERS or indexed is None:
+        return None
+    size, mtime = indexed
+    path = os.path.join(BASE_DIR, rel_path)
+    meta = get_file_metadata(rel_path, path, size, mtime)
+    if meta is None:
+        return None
+    with open(path, 'rb') as f:
+        original = f.read()
+    try:
+        text = original.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    
+    deps, bundles = [], []
+    if ext == 'html':
+        text, deps, bundles = bundle_page(rel_path, text)
+    data = MINIFIERS[ext](text).encode('utf-8')
+    
+    build = None
+    if bundles or len(data) < len(original):
+        hasher = content_hash()
+        hasher.update(data)
+        build = {'etag': etag_from_hash(hasher), 'deps': deps, 'bundles': bundles}
+    previous = meta.get('build')
+    if build != previous:
+        remove_variants(rel_path)
+        if build:
+            write_atomic(build_path(rel_path), data)
+        hot_cache.invalidate(os.path.abspath(build_path(rel_path)))
+        if metadata_store.update(rel_path, size, mtime, build=build) is not None:
+            invalidation_bus.publish({'type': 'build', 'path': rel_path, 'size': size, 'mtime': mtime, 'build': build})
+    set_bundle_deps(rel_path, deps)
+    if ext != 'html':
+        schedule_dependents(rel_path)
+    return build
+
+# بناء كل الملفات وحذف الحزم التي لم تعد أي صفحة تستخدمها (أمر build في سطر الأوامر)
+def build_site():
+    count = 0
+    for rel_path in storage_index.paths():
+        if rel_path.rsplit('.', 1)[-1].lower() in MINIFIERS and build_asset(rel_path):
+            build_variants(rel_path)
+            count += 1
+    used = set()
+    for _, entry in metadata_store.items():
+        if entry.get('build'):
+            used.update(entry['build'].get('bundles', []))
+    if deployments is not None:
+        used.update(deployments.bundles())
+    for name in os.listdir(BUNDLES_DIR):
+        if '.'.join(name.split('.')[:2]) not in used:
+            os.remove(os.path.join(BUNDLES_DIR, name))
+    metadata_store.flush()
+    return count
+
+# بث تغييرات الملفات للوحة التحكم عبر Server-Sent Events (/api/events)
+CHANGE_FEED_HISTORY = int(os.environ.get('CHANGE_FEED_HISTORY', 1000))
+CHANGE_FEED_QUEUE_SIZE = 256
+SSE_HEARTBEAT_INTERVAL = 15
+# مدة البث القصوى: بعدها يُغلق الاتصال ويعيد المتصفح الاتصال ويستكمل من Last-Event-ID،
+# فلا يبقى خيط محجوزاً لاتصال انقطع دون أن يلاحظه الخادم
+SSE_STREAM_TIMEOUT = int(os.environ.get('SSE_STREAM_TIMEOUT', 300))
+
+class ChangeSubscription:
+    def __init__(self, site=''):
+        self.site = site
+        self.queue = queue.Queue(maxsize=CHANGE_FEED_QUEUE_SIZE)
+        self.closed = False
+
+    # إيقاظ البث المنتظر حتى ينتهي (عند انقطاع اتصال المتصفح)
+    def close(self):
+        self.closed = True
+        with self.queue.mutex:
+            self.queue.queue.clear()
+        self.queue.put_nowait(None)
+
+# آخر التغييرات محفوظة حتى يكمل المتصفح من حيث توقف عند إعادة الاتصال (Last-Event-ID).
+# أرقام الأحداث خاصة بكل عملية، فإذا عاد المتصفح إلى عملية أخرى أو فاته الكثير يُطلب منه إعادة التحميل
+class ChangeFeed:
+    def __init__(self, history):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+
+    def publish(self, event, site=''):
+        data = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            event_id = f"{os.getpid()}-{self._next_id}"
+            item = (event_id, data)
+            self._next_id += 1
+            self._history.append((event_id, site, data))
+            for subscription in self._subscribers:
+                if subscription.site != site:
+                    continue
+                try:
+                    subscription.queue.put_nowait(item)
+                except queue.Full:
+                    # متصفح بطيء: حذف ما تراكم وإرسال طلب إعادة تحميل بدلاً منه
+                    with subscription.queue.mutex:
+                        subscription.queue.queue.clear()
+                    subscription.queue.put_nowait(None)
+
+    # الاشتراك مع الأحداث التي فاتت منذ last_event_id، أو None إذا تعذر إكمالها
+    def subscribe(self, last_event_id=None, site=''):
+        subscription = ChangeSubscription(site)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if not last_event_id:
+                return subscription, []
+            ids = [event_id for event_id, _, _ in self._history]
+            if last_event_id not in ids:
+                return subscription, None
+            missed = list(self._history)[ids.index(last_event_id) + 1:]
+            return subscription, [(event_id, data) for event_id, event_site, data in missed if event_site == site]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+change_feed = ChangeFeed(CHANGE_FEED_HISTORY)
+
+def publish_file_change(rel_path, previous, current):
+    if previous is None and current is None:
+        return
+    size = current[0] if current is not None else 0
+    site, path = split_site(rel_path)
+    change_feed.publish({
+        'type': 'removed' if current is None else 'added' if previous is None else 'updated',
+        'path': path,
+        'size': size,
+        'delta': size - (previous[0] if previous is not None else 0),
+        'storage_info': get_storage_info(site)
+    }, site)
+
+# تسجيل ملف جديد أو معدل في الفهرس والبيانات الوصفية والذاكرة المؤقتة
+def commit_file(rel_path, etag):
+    previous = storage_index.get(rel_path)
+    storage_index.update(rel_path)
+    route_table.update(rel_path)
+    entry = storage_index.get(rel_path)
+    publish_file_change(rel_path, previous, entry)
+    if entry is not None:
+        metadata_store.put(rel_path, entry[0], entry[1], etag=etag)
+        invalidation_bus.publish({'type': 'commit', 'path': rel_path, 'size': entry[0], 'mtime': entry[1], 'etag': etag})
+    hot_cache.invalidate(os.path.abspath(os.path.join(BASE_DIR, rel_path)))
+    remove_variants(rel_path)
+    remove_image_variants(rel_path)
+    schedule_compression(rel_path)
+    schedule_image_optimization(rel_path)
+
+# إزالة ملف محذوف من الفهرس والبيانات الوصفية والذاكرة المؤقتة
+def forget_file(rel_path):
+    previous = storage_index.get(rel_path)
+    storage_index.remove(rel_path)
+    route_table.update(rel_path)
+    publish_file_change(rel_path, previous, None)
+    metadata_store.remove(rel_path)
+    remove_variants(rel_path)
+    remove_image_variants(rel_path)
+    hot_cache.invalidate(os.path.abspath(os.path.join(BASE_DIR, rel_path)))
+    invalidation_bus.publish({'type': 'forget', 'path': rel_path})
+    schedule_dependents(rel_path)
+
+# تطبيق حدث وارد من عملية أخرى على الحالة المحلية لهذه العملية
+def apply_invalidation(event):
+    if event['type'] == 'deploy':
+        if deployments is not None:
+            deployments.forget_current(event['site'])
+        return
+    rel_path = event['path']
+    if event['type'] == 'commit':
+        previous = storage_index.get(rel_path)
+        storage_index.update(rel_path)
+        route_table.update(rel_path)
+        publish_file_change(rel_path, previous, storage_index.get(rel_path))
+        metadata_store.put(rel_path, event['size'], event['mtime'], etag=event['etag'])
+    elif event['type'] == 'forget':
+        previous = storage_index.get(rel_path)
+        storage_index.remove(rel_path)
+        route_table.update(rel_path)
+        publish_file_change(rel_path, previous, None)
+        metadata_store.remove(rel_path)
+    elif event['type'] == 'variants':
+        metadata_store.update(rel_path, event['size'], event['mtime'], encodings=event['encodings'])
+    elif event['type'] == 'images':
+        metadata_store.update(rel_path, event['size'], event['mtime'], images=event['images'])
+    elif event['type'] == 'build':
+        metadata_store.update(rel_path, event['size'], event['mtime'], build=event['build'])
+        set_bundle_deps(rel_path, event['build']['deps'] if event['build'] else [])
+        hot_cache.invalidate(os.path.abspath(build_path(rel_path)))
+    hot_cache.invalidate(os.path.abspath(os.path.join(BASE_DIR, rel_path)))
+    invalidate_variants(rel_path)
+
+# قناة إبطال بين العمليات: لكل عملية مقبس Unix من نوع datagram في مجلد مشترك،
+# وكل تغيير يُرسل إلى مقابس العمليات الأخرى. لا تعمل إلا بعد استدعاء start()
+class InvalidationBus:
+    def __init__(self, directory):
+        self.directory = directory
+        self._path = None
+        self._receiver = None
+        self._sender = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self._path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        threading.Thread(target=self._listen, name='invalidation-bus', daemon=True).start()
+
+    # حذف مقابس العمليات السابقة (يستدعيها المشغل قبل إنشاء العمليات)
+    def reset(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def publish(self, event):
+        if self._sender is None:
+            return
+        data = json.dumps(event).encode('utf-8')
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self._path:
+                continue
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # مقبس عملية انتهت
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                # طابور المستقبل ممتلئ: المطابقة الدورية تعالج ما يفوت
+                app.logger.warning('تعذر إرسال حدث الإبطال إلى %s: %s', name, e)
+
+    def _listen(self):
+        while True:
+            data = self._receiver.recv(65536)
+            try:
+                apply_invalidation(json.loads(data))
+            except (ValueError, KeyError, OSError) as e:
+                app.logger.warning('حدث إبطال غير صالح: %s', e)
+
+invalidation_bus = InvalidationBus(os.path.join(META_DIR, 'bus'))
+
+# النشر بإصدارات (اختياري، DEPLOYMENTS=1): مجلد الموقع يصبح مسودة، والزوار يرون آخر إصدار منشور.
+# كل إصدار لقطة ثابتة في مجلد خاص بها (الملفات مع نسخها المبنية والمضغوطة والصور المحسنة)،
+# والإصدار الحالي رابط رمزي (current) يُستبدل بخطوة ذرية واحدة، فالنشر والرجوع لأي إصدار سابق فوريان.
+# مسارات ملفات الإصدار مختلفة لكل إصدار، لذلك لا تختلط ذاكرة الملفات المؤقتة بين الإصدارات.
+# قبل أول نشر يُعرض محتوى المسودة كما هو
+DEPLOYMENTS_ENABLED = os.environ.get('DEPLOYMENTS', '') == '1'
+RELEASES_DIR = os.path.join(META_DIR, 'releases')
+# عدد الإصدارات المحفوظة (الإصدار الحالي لا يُحذف أبداً)
+DEPLOY_KEEP = int(os.environ.get('DEPLOY_KEEP', 20))
+# أقل مدة (بالثواني) بين قراءتين للرابط الرمزي للإصدار الحالي
+DEPLOY_POINTER_TTL = float(os.environ.get('DEPLOY_POINTER_TTL', 1.0))
+RELEASE_CACHE_SIZE = 8
+# أسماء الإصدارات: لا فواصل مسارات ولا نقطة في البداية (المجلدات المؤقتة)، و"current" محجوز للرابط الرمزي
+RELEASE_VERSION = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+class ReleaseNotFound(Exception):
+    pass
+
+# ربط صلب لملف لا يُعدل في مكانه، أو نسخه إذا تعذر الربط (قرص مختلف)
+def link_file(src_path, dest_path):
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    try:
+        os.link(src_path, dest_path)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            shutil.copy2(src_path, dest_path)
+        except OSError:
+            return False
+    return True
+
+class Release:
+    def __init__(self, directory, manifest):
+        self.directory = os.path.abspath(directory)
+        self.version = manifest['version']
+        self.created = manifest['created']
+        self.files = manifest['files']
+        routes = {rel_path: rel_path for rel_path in self.files}
+        for rel_path in sorted(self.files):
+            alias = RouteTable._alias(rel_path)
+            if alias:
+                routes.setdefault(alias, rel_path)
+        self._routes = routes
+
+    # الإصدار ثابت، فلا حاجة للرجوع إلى القرص عند عدم وجود الرابط
+    def resolve(self, url):
+        return self._routes.get(normalize_rel_path(url))
+
+    # kind: files أو build أو variants أو images
+    def path(self, kind, rel_path, suffix=''):
+        return os.path.join(self.directory, kind, split_site(rel_path)[1] + suffix)
+
+    def summary(self):
+        return {
+            'version': self.version,
+            'created': self.created,
+            'file_count': len(self.files),
+            'total_size': sum(entry['size'] for entry in self.files.values())
+        }
+
+class Deployments:
+    def __init__(self, directory):
+        self.directory = directory
+        self._releases = OrderedDict()  # (site, version) -> Release
+        self._live = {}  # site -> (version, وقت القراءة)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _site_dir(self, site):
+        # '_' لا يمكن أن يكون اسم موقع
+        return os.path.join(self.directory, site or '_')
+
+    def current(self, site):
+        now = time.monotonic()
+        cached = self._live.get(site)
+        if cached is not None and now - cached[1] < DEPLOY_POINTER_TTL:
+            return cached[0]
+        try:
+            version = os.readlink(os.path.join(self._site_dir(site), 'current'))
+        except OSError:
+            version = None
+        self._live[site] = (version, now)
+        return version
+
+    def forget_current(self, site):
+        self._live.pop(site, None)
+
+    def release(self, site, version):
+        if version == 'current' or not RELEASE_VERSION.match(version):
+            raise ReleaseNotFound(version)
+        key = (site, version)
+        with self._lock:
+            release = self._releases.get(key)
+            if release is not None:
+                self._releases.move_to_end(key)
+                return release
+        directory = os.path.join(self._site_dir(site), version)
+        try:
+            with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+                release = Release(directory, json.load(f))
+        except (OSError, ValueError):
+            raise ReleaseNotFound(version)
+        with self._lock:
+            self._releases[key] = release
+            while len(self._releases) > RELEASE_CACHE_SIZE:
+                self._releases.popitem(last=False)
+        return release
+
+    # الإصدار الذي يراه الزوار، أو None قبل أول نشر
+    def live(self, site):
+        version = self.current(site)
+        if version is None:
+            return None
+        try:
+            return self.release(site, version)
+        except ReleaseNotFound:
+            return None
+
+    def versions(self, site):
+        site_dir = self._site_dir(site)
+        releases = []
+        try:
+            names = os.listdir(site_dir)
+        except OSError:
+            names = []
+        for name in names:
+            if name == 'current' or name.startswith('.'):
+                continue
+            try:
+                releases.append(self.release(site, name).summary())
+            except ReleaseNotFound:
+                pass
+        return sorted(releases, key=lambda r: r['created'], reverse=True)
+
+    # استبدال الرابط الرمزي للإصدار الحالي بخطوة ذرية
+    def activate(self, site, version):
+        self.release(site, version)
+        site_dir = self._site_dir(site)
+        tmp_link = os.path.join(site_dir, f".current.{uuid.uuid4().hex}")
+        os.symlink(version, tmp_link)
+        os.replace(tmp_link, os.path.join(site_dir, 'current'))
+        self.forget_current(site)
+        invalidation_bus.publish({'type': 'deploy', 'site': site, 'version': version})
+
+    # نسخ ملف من المسودة مع نسخه المشتقة إلى مجلد الإصدار
+    def _snapshot_file(self, directory, rel_path, previous):
+        path = os.path.join(BASE_DIR, rel_path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        meta = get_file_metadata(rel_path, path, st.st_size, st.st_mtime)
+        if meta is None:
+            return None
+        # تجهيز النسخ المبنية والمضغوطة التي لم ينتهِ طابور الضغط منها بعد
+        if is_compressible(rel_path) and 'encodings' not in meta and storage_index.get(rel_path) == (st.st_size, st.st_mtime):
+            if BUILD_ON_UPLOAD:
+                build_asset(rel_path)
+            build_variants(rel_path)
+            meta = get_file_metadata(rel_path, path, st.st_size, st.st_mtime) or meta
+        
+        name = split_site(rel_path)[1]
+        dest_path = os.path.join(directory, 'files', name)
+        etag = meta['etag']
+        old = previous.files.get(rel_path) if previous is not None else None
+        # ملفات الإصدار السابق ومخزن المحتوى لا تُعدل في مكانها فيمكن ربطها، أما المسودة فتُنسخ
+        if old is not None and old['etag'] == etag and link_file(previous.path('files', rel_path), dest_path):
+            pass
+        elif blob_store is not None and link_file(blob_store.path(etag), dest_path):
+            pass
+        else:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            with open(path, 'rb') as f:
+                etag = save_stream(f, dest_path)
+            shutil.copystat(path, dest_path)
+        st = os.stat(dest_path)
+        entry = {'size': st.st_size, 'mtime': st.st_mtime, 'etag': etag}
+        # تغير الملف أثناء النسخ: نسخه المشتقة لا تطابقه
+        if etag != meta['etag']:
+            return entry
+        
+        # النسخ المشتقة تُكتب دائماً في ملف جديد ثم تُنقل، فربطها آمن
+        if meta.get('build') and link_file(build_path(rel_path), os.path.join(directory, 'build', name)):
+            entry['build'] = meta['build']
+        entry['encodings'] = [
+            encoding for encoding in meta.get('encodings') or []
+            if link_file(variant_path(rel_path, ENCODING_SUFFIXES[encoding]),
+                         os.path.join(directory, 'variants', name + ENCODING_SUFFIXES[encoding]))
+        ]
+        images = meta.get('images')
+        if images and all(link_file(os.path.join(image_variant_dir(rel_path, etag), variant),
+                                    os.path.join(directory, 'images', name, variant))
+                          for variant in images['variants']):
+            entry['images'] = images
+        return entry
+
+    # إنشاء إصدار جديد من المسودة الحالية ونشره
+    def deploy(self, site=''):
+        site_dir = self._site_dir(site)
+        os.makedirs(site_dir, exist_ok=True)
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        tmp_dir = os.path.join(site_dir, f".{version}.tmp")
+        previous = self.live(site)
+        prefix = site_path(site, '')
+        try:
+            # الرفع الجماعي لا يُقطع في منتصفه
+            with metrics.timer('deploy'), site_commit_lock:
+                files = {}
+                for rel_path in storage_index.paths():
+                    if not rel_path.startswith(prefix):
+                        continue
+                    entry = self._snapshot_file(tmp_dir, rel_path, previous)
+                    if entry is not None:
+                        files[rel_path] = entry
+            os.makedirs(tmp_dir, exist_ok=True)
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'created': time.time(), 'files': files}, f, ensure_ascii=False)
+            os.rename(tmp_dir, os.path.join(site_dir, version))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.activate(site, version)
+        self.prune(site)
+        return version
+
+    def prune(self, site):
+        live = self.current(site)
+        for release in self.versions(site)[DEPLOY_KEEP:]:
+            if release['version'] != live:
+                shutil.rmtree(os.path.join(self._site_dir(site), release['version']), ignore_errors=True)
+                with self._lock:
+                    self._releases.pop((site, release['version']), None)
+
+    # الحزم التي تستخدمها الإصدارات المحفوظة (حتى لا يحذفها أمر build)
+    def bundles(self):
+        used = set()
+        for name in os.listdir(self.directory):
+            site = '' if name == '_' else name
+            for summary in self.versions(site):
+                for entry in self.release(site, summary['version']).files.values():
+                    if entry.get('build'):
+                        used.update(entry['build'].get('bundles', []))
+        return used
+
+deployments = Deployments(RELEASES_DIR) if DEPLOYMENTS_ENABLED else None
+
+# مراقبة مجلد الموقع: الملفات التي تتغير خارج الخادم (rsync أو git) تُسجل في الفهرس والذاكرة المؤقتة
+# والبيانات الوصفية فور تغيرها، دفعة واحدة بعد هدوء التغييرات. تستخدم inotify على لينكس وإلا المسح الدوري.
+# عملية واحدة فقط تراقب (بقفل على ملف) وتصل التغييرات إلى العمليات الأخرى عبر قناة الإبطال
+WATCH_ENABLED = os.environ.get('WATCH_FILES', '1') == '1'
+WATCH_DEBOUNCE = float(os.environ.get('WATCH_DEBOUNCE', 0.2))
+WATCH_MAX_DELAY = float(os.environ.get('WATCH_MAX_DELAY', 2.0))
+WATCH_POLL_INTERVAL = float(os.environ.get('WATCH_POLL_INTERVAL', 5.0))
+
+# تسجيل حالة ملف على القرص إذا اختلفت عما في الفهرس
+def sync_file(rel_path):
+    with path_locks.hold(rel_path):
+        sync_file_locked(rel_path)
+
+def sync_file_locked(rel_path):
+    path = os.path.join(BASE_DIR, rel_path)
+    indexed = storage_index.get(rel_path)
+    try:
+        st = os.stat(path) if os.path.isfile(path) else None
+    except OSError:
+        st = None
+    if st is None:
+        if indexed is not None:
+            forget_file(rel_path)
+        return
+    if indexed == (st.st_size, st.st_mtime):
+        return
+    try:
+        etag = hash_file(path)
+    except OSError:
+        return
+    commit_file(rel_path, etag)
+
+def sync_files(rel_paths):
+    with metrics.timer('watch_sync'):
+        for rel_path in sorted(rel_paths):
+            try:
+                sync_file(rel_path)
+            except OSError as e:
+                app.logger.warning('فشل تسجيل تغيير الملف %s: %s', rel_path, e)
+
+class InotifyWatcher:
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self._watches = {}  # wd -> rel_dir
+        self.add_tree('')
+
+    # مراقبة مجلد وكل ما تحته، وإرجاع الملفات الموجودة فيه
+    def add_tree(self, rel_dir):
+        files = set()
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.root, rel_dir)):
+            rel_dir = normalize_rel_path(os.path.relpath(dirpath, self.root))
+            if rel_dir == '.' and SITES_DIR:
+                dirnames[:] = [d for d in dirnames if d != WORK_DIR_NAME]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.MASK)
+            if wd >= 0:
+                self._watches[wd] = '' if rel_dir == '.' else rel_dir
+            for f in filenames:
+                files.add(normalize_rel_path(os.path.relpath(os.path.join(dirpath, f), self.root)))
+        return files
+
+    def remove_tree(self, rel_dir):
+        prefix = rel_dir + '/'
+        for wd, watched in list(self._watches.items()):
+            if watched == rel_dir or watched.startswith(prefix):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self._watches[wd]
+        return {rel_path for rel_path in storage_index.paths() if rel_path.startswith(prefix)}
+
+    # انتظار الأحداث حتى timeout ثانية، وإرجاع (المسارات المتغيرة، هل فاض طابور الأحداث)
+    def read(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set(), False
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0'))
+            offset += self.EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            rel_path = f"{directory}/{name}" if directory else name
+            if rel_path == WORK_DIR_NAME and SITES_DIR:
+                continue
+            if not mask & self.IN_ISDIR:
+                changed.add(rel_path)
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                changed |= self.add_tree(rel_path)
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                changed |= self.remove_tree(rel_path)
+        return changed, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+def watch_with_inotify(watcher):
+    pending = set()
+    first = last = None
+    while True:
+        now = time.monotonic()
+        timeout = None if first is None else max(0.0, min(last + WATCH_DEBOUNCE, first + WATCH_MAX_DELAY) - now)
+        changed, overflow = watcher.read(timeout)
+        if overflow:
+            changed |= storage_index.changes()
+        if changed:
+            pending |= changed
+            last = time.monotonic()
+            first = first or last
+            continue
+        if pending and time.monotonic() >= min(last + WATCH_DEBOUNCE, first + WATCH_MAX_DELAY):
+            sync_files(pending)
+            pending = set()
+            first = last = None
+
+def watch_with_polling():
+    while True:
+        time.sleep(WATCH_POLL_INTERVAL)
+        sync_files(storage_index.changes())
+
+@background_task
+def file_watch_loop():
+    if not WATCH_ENABLED:
+        return
+    with open(os.path.join(META_DIR, 'watch.lock'), 'w') as lock_file:
+        # عملية عاملة أخرى تراقب: المحاولة مجدداً حتى تتوقف
+        while fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                time.sleep(WATCH_POLL_INTERVAL)
+        
+        # التقاط التغييرات التي حدثت قبل بدء المراقبة
+        sync_files(storage_index.changes())
+        try:
+            watcher = InotifyWatcher(BASE_DIR)
+        except (OSError, AttributeError, TypeError) as e:
+            app.logger.info('inotify غير متاح، المراقبة بالمسح الدوري: %s', e)
+            watch_with_polling()
+            return
+        try:
+            watch_with_inotify(watcher)
+        finally:
+            watcher.close()
+
+# اختيار أفضل ترميز يقبله المتصفح من بين النسخ المتوفرة
+def negotiate_encoding(req, encodings):
+    if not encodings:
+        return None
+    return req.accept_encodings.best_match(encodings)
+
+# التحقق من ترويسات الطلب الشرطي (If-None-Match / If-Modified-Since)
+def is_not_modified(req, etag, mtime):
+    if req.if_none_match:
+        return req.if_none_match.contains_weak(etag)
+    if req.if_modified_since:
+        return int(mtime) <= req.if_modified_since.timestamp()
+    return False
+
+# حجم القطعة المرسلة في كل مرة من الملف أو النطاق
+STREAM_CHUNK_SIZE = 256 * 1024
+# عدد النطاقات المسموح بها في طلب واحد، ما زاد يُرسل الملف كاملاً
+MAX_RANGES = int(os.environ.get('MAX_RANGES', 16))
+
+# النطاقات المطلوبة بترويسة Range كأزواج (start, stop)، أو None لإرسال الملف كاملاً
+def requested_ranges(req, size, etag, mtime):
+    rng = req.range
+    if rng is None or rng.units != 'bytes' or len(rng.ranges) > MAX_RANGES:
+        return None
+    
+    # If-Range: إذا تغير الملف منذ أن حمّل العميل جزءه الأول يُرسل كاملاً
+    if_range = req.if_range
+    if if_range.etag is not None:
+        if etag is None or if_range.etag != etag:
+            return None
+    elif if_range.date is not None:
+        if mtime is None or int(mtime) > if_range.date.timestamp():
+            return None
+    
+    ranges = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start = max(size + start, 0)
+            stop = size
+        elif stop is None or stop > size:
+            stop = size
+        if start < stop:
+            ranges.append((start, stop))
+    if not ranges:
+        raise RequestedRangeNotSatisfiable(length=size)
+    return ranges
+
+# تخطيط جسم استجابة 206: نطاق واحد مباشرة، أو عدة نطاقات بصيغة multipart/byteranges
+class ByteRanges:
+    def __init__(self, ranges, size, content_type):
+        self.headers = Headers()
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            self.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+            self.parts = [(b'', start, stop)]
+            self.trailer = b''
+        else:
+            boundary = uuid.uuid4().hex
+            self.headers['Content-Type'] = f"multipart/byteranges; boundary={boundary}"
+            self.parts = [
+                (f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+                 f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n".encode('latin-1'), start, stop)
+                for start, stop in ranges
+            ]
+            self.trailer = f"\r\n--{boundary}--\r\n".encode('latin-1')
+        self.length = sum(len(head) + stop - start for head, start, stop in self.parts) + len(self.trailer)
+        self.headers['Content-Length'] = str(self.length)
+
+# جسم استجابة يقرأ النطاقات المطلوبة من الملف (أو من بيانات في الذاكرة) قطعة بقطعة دون نسخ الملف كاملاً.
+# القراءة العادية لا mmap: الملف الذي يُقتطع أثناء الإرسال يرفع OSError بدل أن يُسقط العملية بـ SIGBUS
+class RangeStream:
+    def __init__(self, layout, path=None, data=None):
+        self.layout = layout
+        self._file = None
+        self._view = None
+        if data is not None:
+            self._view = memoryview(data)
+        else:
+            self._file = open(path, 'rb')
+
+    def _read(self, offset, length):
+        if self._view is not None:
+            return bytes(self._view[offset:offset + length])
+        self._file.seek(offset)
+        chunk = self._file.read(length)
+        if len(chunk) < length:
+            raise OSError(f'تغير حجم الملف أثناء إرساله: {self._file.name}')
+        return chunk
+
+    def __iter__(self):
+        for head, start, stop in self.layout.parts:
+            if head:
+                yield head
+            for offset in range(start, stop, STREAM_CHUNK_SIZE):
+                yield self._read(offset, min(STREAM_CHUNK_SIZE, stop - offset))
+        if self.layout.trailer:
+            yield self.layout.trailer
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+        if self._file is not None:
+            self._file.close()
+
+# واجهة التحكم: التنسيقات والأكواد ملفات منفصلة تحمل بصمة محتواها (/_panel/panel.<بصمة>.css)
+# وتُخزن في المتصفح دون انتهاء، والصفحة نفسها صغيرة ومضغوطة مسبقاً مع ETag فتكلف الزيارة المتكررة ردّ 304 واحداً.
+# لا شيء يُحمّل من الإنترنت: الخط من الجهاز (Tajawal إن كان مثبتاً) والأيقونات رموز SVG مضمنة في الصفحة
+PANEL_CSS = f'''
         :root {{
             --primary: {PRIMARY_COLOR};
             --secondary: {SECONDARY_COLOR};
@@ -60,7 +2802,7 @@ CONTROL_PANEL = f'''
             box-sizing: border-box;
             margin: 0;
             padding: 0;
-            font-family: 'Tajawal', sans-serif;
+            font-family: 'Tajawal', system-ui, -apple-system, 'Segoe UI', Tahoma, sans-serif;
         }}
         
         body {{
@@ -341,24 +3083,541 @@ CONTROL_PANEL = f'''
         
         /* أيقونات */
         .icon {{
-            font-family: 'Material Icons';
-            font-weight: normal;
-            font-style: normal;
+            width: 1em;
+            height: 1em;
             font-size: 24px;
-            line-height: 1;
-            letter-spacing: normal;
-            text-transform: none;
+            fill: currentColor;
             display: inline-block;
-            white-space: nowrap;
-            word-wrap: normal;
-            direction: ltr;
-            -webkit-font-feature-settings: 'liga';
-            -webkit-font-smoothing: antialiased;
-        }}
-    </style>
-    <link href="https://fonts.googleapis.com/icon?family=Material+Icons" rel="stylesheet">
+            vertical-align: middle;
+            flex-shrink: 0;
+        }}
+'''
+
+PANEL_JS = '''
+        // أيقونة من رموز SVG المضمنة في الصفحة
+        function icon(name) {
+            return `<svg class="icon"><use href="#icon-${name}"></use></svg>`;
+        }
+        
+        // حجم الجزء الواحد في الرفع المجزأ
+        const UPLOAD_CHUNK_SIZE = 1024 * 1024;
+        // بادئة الموقع عند فتح اللوحة من /sites/<site>/ (فارغة عند تحديد الموقع باسم النطاق)
+        const SITE_BASE = location.pathname.replace(/\\/+$/, '');
+        
+        // رفع الملفات
+        async function uploadFile() {
+            const fileInput = document.getElementById('fileInput');
+            const fileType = document.getElementById('file_type');
+            const progressContainer = document.getElementById('progressContainer');
+            const progressFill = document.getElementById('progressFill');
+            const progressText = document.getElementById('progressText');
+            const resultMessage = document.getElementById('resultMessage');
+            
+            if (fileInput.files.length === 0) {
+                showResult('الرجاء اختيار ملف أولاً', 'error');
+                return;
+            }
+            
+            if (!fileType.value) {
+                showResult('الرجاء اختيار نوع الملف', 'error');
+                return;
+            }
+            
+            // إظهار شريط التقدم
+            progressContainer.style.display = 'block';
+            progressFill.style.width = '0%';
+            progressText.textContent = 'جاري رفع الملف...';
+            resultMessage.style.display = 'none';
+            
+            try {
+                const data = await uploadInChunks(fileInput.files[0], fileType.value, percent => {
+                    progressFill.style.width = percent + '%';
+                    progressText.textContent = `جاري رفع الملف... ${percent}%`;
+                });
+                
+                progressFill.style.width = '100%';
+                progressText.textContent = 'اكتمل الرفع!';
+                
+                if (data.status === 'success') {
+                    showResult(`تم رفع الملف بنجاح: ${data.filename}`, 'success');
+                    // مع البث المباشر تصل الإضافة من الخادم، وإلا تُحدّث القائمة كاملة
+                    if (!liveUpdates) loadFiles();
+                } else {
+                    showResult(data.message || 'حدث خطأ أثناء الرفع', 'error');
+                }
+                
+                // إخفاء شريط التقدم بعد 3 ثواني
+                setTimeout(() => {
+                    progressContainer.style.display = 'none';
+                }, 3000);
+            } catch (error) {
+                showResult('حدث خطأ في الاتصال بالخادم، أعد المحاولة لاستئناف الرفع', 'error');
+                progressContainer.style.display = 'none';
+                console.error('Error:', error);
+            }
+        }
+        
+        // رفع الملف على أجزاء مع استئناف الجلسة السابقة لنفس الملف إن وجدت
+        async function uploadInChunks(file, fileType, onProgress) {
+            const resumeKey = `upload:${fileType}:${file.name}:${file.size}:${file.lastModified}`;
+            let uploadId = localStorage.getItem(resumeKey);
+            let offset = 0;
+            
+            if (uploadId) {
+                const response = await fetch(`${SITE_BASE}/api/uploads/${uploadId}`);
+                if (response.ok) {
+                    offset = (await response.json()).offset;
+                } else {
+                    uploadId = null;
+                }
+            }
+            
+            if (!uploadId) {
+                const response = await fetch(`${SITE_BASE}/api/uploads`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ filename: file.name, file_type: fileType, size: file.size })
+                });
+                const data = await response.json();
+                if (data.status !== 'success') return data;
+                uploadId = data.upload_id;
+                localStorage.setItem(resumeKey, uploadId);
+            }
+            
+            while (offset < file.size) {
+                onProgress(Math.floor(offset / file.size * 100));
+                const response = await fetch(`${SITE_BASE}/api/uploads/${uploadId}?offset=${offset}`, {
+                    method: 'PUT',
+                    body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+                });
+                // تجاوز حد معدل الرفع: الانتظار المدة التي يطلبها الخادم ثم إعادة إرسال الجزء
+                if (response.status === 429) {
+                    const retryAfter = Number(response.headers.get('Retry-After')) || 1;
+                    await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+                    continue;
+                }
+                const data = await response.json();
+                // عند عدم تطابق الموضع يعيد الخادم الموضع الصحيح فنكمل منه
+                if (data.offset === undefined) {
+                    if (response.status === 404) localStorage.removeItem(resumeKey);
+                    return data;
+                }
+                offset = data.offset;
+            }
+            onProgress(100);
+            
+            const response = await fetch(`${SITE_BASE}/api/uploads/${uploadId}/finalize`, { method: 'POST' });
+            const data = await response.json();
+            if (data.status === 'success' || response.status === 404) {
+                localStorage.removeItem(resumeKey);
+            }
+            return data;
+        }
+        
+        // عرض رسائل النتيجة
+        function showResult(message, type) {
+            const resultMessage = document.getElementById('resultMessage');
+            resultMessage.textContent = message;
+            resultMessage.className = 'result-message ' + type;
+            resultMessage.style.display = 'block';
+        }
+        
+        // حالة التحميل التدريجي لقائمة الملفات
+        let nextCursor = null;
+        let loadingFiles = false;
+        let filesGeneration = 0;
+        
+        // جلب قائمة الملفات من البداية
+        function loadFiles() {
+            filesGeneration++;
+            nextCursor = null;
+            loadingFiles = false;
+            document.getElementById('fileList').innerHTML = '';
+            fetchFilesPage('');
+        }
+        
+        // جلب الصفحة التالية عند التمرير
+        function loadMoreFiles() {
+            if (nextCursor !== null && !loadingFiles) {
+                fetchFilesPage(nextCursor);
+            }
+        }
+        
+        function fetchFilesPage(cursor) {
+            const generation = filesGeneration;
+            loadingFiles = true;
+            fetch(`${SITE_BASE}/api/files?cursor=${encodeURIComponent(cursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                if (generation !== filesGeneration) return;
+                const fileList = document.getElementById('fileList');
+                
+                if (cursor === '' && data.files.length === 0) {
+                    showEmptyFileList();
+                } else {
+                    data.files.forEach(file => fileList.appendChild(createFileItem(file)));
+                }
+                
+                nextCursor = data.next_cursor;
+                loadingFiles = false;
+                
+                // إعادة المراقبة حتى تُجلب صفحة أخرى إذا بقيت نهاية القائمة ظاهرة
+                if (nextCursor !== null) {
+                    const sentinel = document.getElementById('fileListSentinel');
+                    fileListObserver.unobserve(sentinel);
+                    fileListObserver.observe(sentinel);
+                }
+                
+                // تحديث معلومات التخزين
+                updateStorageInfo(data.storage_info);
+            })
+            .catch(error => {
+                loadingFiles = false;
+                console.error('Error loading files:', error);
+            });
+        }
+        
+        function createFileItem(file) {
+            const li = document.createElement('li');
+            li.className = 'file-item';
+            li.dataset.path = file;
+            
+            const link = document.createElement('a');
+            link.href = `${SITE_BASE}/${file}`;
+            link.className = 'file-link';
+            link.target = '_blank';
+            link.innerHTML = `
+                ${icon(getFileIcon(file))}
+                ${file}
+            `;
+            
+            const actions = document.createElement('div');
+            actions.className = 'file-actions';
+            
+            const viewBtn = document.createElement('button');
+            viewBtn.className = 'action-btn view-btn';
+            viewBtn.innerHTML = icon('visibility') + ' عرض';
+            viewBtn.onclick = () => window.open(`${SITE_BASE}/${file}`, '_blank');
+            
+            const deleteBtn = document.createElement('button');
+            deleteBtn.className = 'action-btn delete-btn';
+            deleteBtn.innerHTML = icon('delete') + ' حذف';
+            deleteBtn.onclick = () => deleteFile(file);
+            
+            actions.appendChild(viewBtn);
+            actions.appendChild(deleteBtn);
+            li.appendChild(link);
+            li.appendChild(actions);
+            return li;
+        }
+        
+        function showEmptyFileList() {
+            document.getElementById('fileList').innerHTML = '<li class="file-item" id="emptyFileList">لا توجد ملفات بعد</li>';
+        }
+        
+        // تحديث القائمة بحدث واحد من الخادم بدل إعادة جلبها كاملة
+        let liveUpdates = false;
+        
+        function applyFileEvent(event) {
+            const fileList = document.getElementById('fileList');
+            const items = Array.from(fileList.querySelectorAll('li[data-path]'));
+            const existing = items.find(li => li.dataset.path === event.path);
+            
+            if (event.type === 'removed') {
+                if (existing) existing.remove();
+                if (items.length === 1 && existing && nextCursor === null) showEmptyFileList();
+            } else if (event.type === 'added' && !existing) {
+                // الملف يُضاف في موضعه المرتب إذا كان ضمن الجزء المحمّل من القائمة
+                const before = items.find(li => li.dataset.path > event.path);
+                if (before || nextCursor === null) {
+                    const empty = document.getElementById('emptyFileList');
+                    if (empty) empty.remove();
+                    fileList.insertBefore(createFileItem(event.path), before || null);
+                }
+            }
+            updateStorageInfo(event.storage_info);
+        }
+        
+        function connectFileEvents() {
+            if (!window.EventSource) return;
+            const events = new EventSource(`${SITE_BASE}/api/events`);
+            events.onopen = () => { liveUpdates = true; };
+            events.onerror = () => { liveUpdates = false; };
+            events.addEventListener('file', e => applyFileEvent(JSON.parse(e.data)));
+            // فاتت أحداث كثيرة (أو عاد الاتصال إلى عملية أخرى): إعادة تحميل القائمة
+            events.addEventListener('reset', () => loadFiles());
+        }
+        
+        // تحميل الصفحة التالية عندما تظهر نهاية القائمة
+        const fileListObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreFiles();
+            }
+        }, { rootMargin: '200px' });
+        
+        // تحديث معلومات التخزين
+        function updateStorageInfo(storageInfo) {
+            document.getElementById('totalFiles').textContent = storageInfo.file_count;
+            document.getElementById('usedSpace').textContent = `${storageInfo.total_size_mb} MB`;
+            
+            // حساب النسبة المئوية من المساحة المخصصة للموقع (0 تعني بلا حد)
+            const maxStorageMB = storageInfo.quota_mb;
+            const percentage = maxStorageMB ? Math.min((storageInfo.total_size_mb / maxStorageMB) * 100, 100) : 0;
+            
+            document.getElementById('storageProgress').style.width = `${percentage}%`;
+            
+            // تحديث النصوص
+            const progressInfo = document.querySelector('.progress-info');
+            if (progressInfo) {
+                progressInfo.innerHTML = `
+                    <span>${percentage.toFixed(1)}% مستخدم</span>
+                    <span>${(100 - percentage).toFixed(1)}% متبقي</span>
+                `;
+            }
+        }
+        
+        // حذف الملف
+        function deleteFile(filename) {
+            if (confirm(`هل أنت متأكد من حذف الملف ${filename}؟`)) {
+                fetch(`${SITE_BASE}/api/delete/${encodeURIComponent(filename)}`, {
+                    method: 'DELETE'
+                })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status === 'success') {
+                        showResult(`تم حذف الملف ${filename}`, 'success');
+                        if (!liveUpdates) loadFiles();
+                    } else {
+                        showResult(data.message || 'حدث خطأ أثناء الحذف', 'error');
+                    }
+                })
+                .catch(error => {
+                    showResult('حدث خطأ في الاتصال بالخادم', 'error');
+                    console.error('Error:', error);
+                });
+            }
+        }
+        
+        // الإصدارات: تظهر فقط إذا كان النشر بإصدارات مفعلاً
+        function loadReleases() {
+            fetch(`${SITE_BASE}/api/deploys`)
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!data) return;
+                document.getElementById('deployCard').style.display = '';
+                const releaseList = document.getElementById('releaseList');
+                releaseList.innerHTML = '';
+                data.versions.forEach(release => {
+                    const li = document.createElement('li');
+                    li.className = 'file-item';
+                    const created = new Date(release.created * 1000).toLocaleString();
+                    li.innerHTML = `
+                        <span class="file-link">
+                            ${icon(release.version === data.live ? 'check_circle' : 'history')}
+                            ${created} (${release.file_count} ملف)
+                        </span>
+                    `;
+                    if (release.version !== data.live) {
+                        const actions = document.createElement('div');
+                        actions.className = 'file-actions';
+                        const activateBtn = document.createElement('button');
+                        activateBtn.className = 'action-btn view-btn';
+                        activateBtn.innerHTML = icon('restore') + ' استعادة';
+                        activateBtn.onclick = () => activateRelease(release.version);
+                        actions.appendChild(activateBtn);
+                        li.appendChild(actions);
+                    }
+                    releaseList.appendChild(li);
+                });
+            })
+            .catch(error => console.error('Error loading releases:', error));
+        }
+        
+        function deploySite() {
+            fetch(`${SITE_BASE}/api/deploys`, { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    showResult('تم نشر التعديلات', 'success');
+                    loadReleases();
+                } else {
+                    showResult(data.message || 'حدث خطأ أثناء النشر', 'error');
+                }
+            })
+            .catch(error => {
+                showResult('حدث خطأ في الاتصال بالخادم', 'error');
+                console.error('Error:', error);
+            });
+        }
+        
+        function activateRelease(version) {
+            if (!confirm('هل تريد استعادة هذا الإصدار؟')) return;
+            fetch(`${SITE_BASE}/api/deploys/${encodeURIComponent(version)}/activate`, { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    showResult('تمت استعادة الإصدار', 'success');
+                    loadReleases();
+                } else {
+                    showResult(data.message || 'حدث خطأ أثناء الاستعادة', 'error');
+                }
+            })
+            .catch(error => {
+                showResult('حدث خطأ في الاتصال بالخادم', 'error');
+                console.error('Error:', error);
+            });
+        }
+        
+        function formatBytes(bytes) {
+            if (bytes >= 1024 * 1024 * 1024) return `${(bytes / (1024 * 1024 * 1024)).toFixed(2)} GB`;
+            if (bytes >= 1024 * 1024) return `${(bytes / (1024 * 1024)).toFixed(2)} MB`;
+            return `${(bytes / 1024).toFixed(1)} KB`;
+        }
+        
+        // الملفات الأكثر طلباً خلال آخر ساعة: تظهر فقط إذا كان سجل الوصول مفعلاً
+        function loadAccessStats() {
+            fetch(`${SITE_BASE}/api/stats`)
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!data) return;
+                document.getElementById('statsCard').style.display = '';
+                document.getElementById('statsRequests').textContent = data.requests;
+                document.getElementById('statsBytes').textContent = formatBytes(data.bytes);
+                const hotFileList = document.getElementById('hotFileList');
+                hotFileList.innerHTML = '';
+                if (data.top_hits.length === 0) {
+                    hotFileList.innerHTML = '<li class="file-item"><span>لا توجد طلبات بعد</span></li>';
+                    return;
+                }
+                data.top_hits.forEach(file => {
+                    const li = document.createElement('li');
+                    li.className = 'file-item';
+                    const link = document.createElement('a');
+                    link.href = `${SITE_BASE}/${file.path}`;
+                    link.className = 'file-link';
+                    link.target = '_blank';
+                    // المسار يُضاف نصاً لا HTML
+                    link.innerHTML = icon(getFileIcon(file.path));
+                    link.appendChild(document.createTextNode(` ${file.path}`));
+                    const usage = document.createElement('span');
+                    usage.textContent = `${file.hits} طلب · ${formatBytes(file.bytes)}`;
+                    li.appendChild(link);
+                    li.appendChild(usage);
+                    hotFileList.appendChild(li);
+                });
+            })
+            .catch(error => console.error('Error loading stats:', error));
+        }
+        
+        // تحديد أيقونة الملف حسب نوعه
+        function getFileIcon(filename) {
+            if (filename.endsWith('.html')) return 'code';
+            if (filename.endsWith('.css')) return 'brush';
+            if (filename.endsWith('.js')) return 'terminal';
+            if (filename.endsWith('.png') || filename.endsWith('.jpg') || filename.endsWith('.jpeg') ||
+                filename.endsWith('.gif')) return 'image';
+            return 'insert_drive_file';
+        }
+        
+        // تحميل الملفات عند فتح الصفحة
+        document.addEventListener('DOMContentLoaded', () => {
+            loadFiles();
+            fileListObserver.observe(document.getElementById('fileListSentinel'));
+            connectFileEvents();
+            loadReleases();
+            loadAccessStats();
+            setInterval(loadAccessStats, 30000);
+        });
+'''
+
+# أيقونات Material المستخدمة في الواجهة فقط (مسارات SVG بحجم 24×24)
+PANEL_ICONS = {
+    'attach_file': ('M16.5 6v11.5c0 2.21-1.79 4-4 4s-4-1.79-4-4V5c0-1.38 1.12-2.5 2.5-2.5s2.5 1.12 2.5 2.5v10.5'
+                    'c0 .55-.45 1-1 1s-1-.45-1-1V6H10v9.5c0 1.38 1.12 2.5 2.5 2.5s2.5-1.12 2.5-2.5V5c0-2.21-1.79-4-4-4'
+                    'S7 2.79 7 5v12.5c0 3.04 2.46 5.5 5.5 5.5s5.5-2.46 5.5-5.5V6h-1.5z'),
+    'bar_chart': 'M5 9.2h3V19H5zM10.6 5h2.8v14h-2.8zm5.6 8H19v6h-2.8z',
+    'brush': ('M7 14c-1.66 0-3 1.34-3 3 0 1.31-1.16 2-2 2 .92 1.22 2.49 2 4 2 2.21 0 4-1.79 4-4 0-1.66-1.34-3-3-3z'
+              'm13.71-9.37l-1.34-1.34a.996.996 0 0 0-1.41 0L9 12.25 11.75 15l8.96-8.96a.996.996 0 0 0 0-1.41z'),
+    'category': 'M12 2l-5.5 9h11L12 2zM17.5 13a4.5 4.5 0 1 0 0 9 4.5 4.5 0 1 0 0-9zM3 13.5h8v8H3z',
+    'check_circle': ('M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm-2 15l-5-5 1.41-1.41L10 14.17'
+                     'l7.59-7.59L19 8l-9 9z'),
+    'cloud_upload': ('M19.35 10.04C18.67 6.59 15.64 4 12 4 9.11 4 6.6 5.64 5.35 8.04 2.34 8.36 0 10.91 0 14'
+                     'c0 3.31 2.69 6 6 6h13c2.76 0 5-2.24 5-5 0-2.64-2.05-4.78-4.65-4.96zM14 13v4h-4v-4H7l5-5 5 5h-3z'),
+    'code': 'M9.4 16.6L4.8 12l4.6-4.6L8 6l-6 6 6 6 1.4-1.4zm5.2 0l4.6-4.6-4.6-4.6L16 6l6 6-6 6-1.4-1.4z',
+    'data_usage': ('M13 2.05v3.03c3.39.49 6 3.39 6 6.92 0 .9-.18 1.75-.48 2.54l2.6 1.53'
+                   'c.56-1.24.88-2.62.88-4.07 0-5.18-3.95-9.45-9-9.95zM12 19c-3.87 0-7-3.13-7-7 0-3.53 2.61-6.43 6-6.92V2.05'
+                   'c-5.06.5-9 4.76-9 9.95 0 5.52 4.47 10 9.99 10 3.31 0 6.24-1.61 8.06-4.09l-2.6-1.53'
+                   'C16.17 17.98 14.21 19 12 19z'),
+    'delete': 'M6 19c0 1.1.9 2 2 2h8c1.1 0 2-.9 2-2V7H6v12zM19 4h-3.5l-1-1h-5l-1 1H5v2h14V4z',
+    'file_upload': 'M9 16h6v-6h4l-7-7-7 7h4zm-4 2h14v2H5z',
+    'folder': 'M10 4H4c-1.1 0-1.99.9-1.99 2L2 18c0 1.1.9 2 2 2h16c1.1 0 2-.9 2-2V8c0-1.1-.9-2-2-2h-8l-2-2z',
+    'history': ('M13 3c-4.97 0-9 4.03-9 9H1l3.89 3.89.07.14L9 12H6c0-3.87 3.13-7 7-7s7 3.13 7 7-3.13 7-7 7'
+                'c-1.93 0-3.68-.79-4.94-2.06l-1.42 1.42C8.27 19.99 10.51 21 13 21c4.97 0 9-4.03 9-9s-4.03-9-9-9zm-1 5v5'
+                'l4.28 2.54.72-1.21-3.5-2.08V8H12z'),
+    'image': ('M21 19V5c0-1.1-.9-2-2-2H5c-1.1 0-2 .9-2 2v14c0 1.1.9 2 2 2h14c1.1 0 2-.9 2-2zM8.5 13.5l2.5 3.01L14.5 12l4.5 6'
+              'H5l3.5-4.5z'),
+    'insert_drive_file': 'M6 2c-1.1 0-1.99.9-1.99 2L4 20c0 1.1.89 2 1.99 2H18c1.1 0 2-.9 2-2V8l-6-6H6zm7 7V3.5L18.5 9H13z',
+    'publish': 'M5 4v2h14V4H5zm0 10h4v6h6v-6h4l-7-7-7 7z',
+    'restore': ('M13 3c-4.97 0-9 4.03-9 9H1l3.89 3.89.07.14L9 12H6c0-3.87 3.13-7 7-7s7 3.13 7 7-3.13 7-7 7'
+                'c-1.93 0-3.68-.79-4.94-2.06l-1.42 1.42C8.27 19.99 10.51 21 13 21c4.97 0 9-4.03 9-9s-4.03-9-9-9zm-1 5v5'
+                'l4.25 2.52.77-1.28-3.52-2.09V8z'),
+    'storage': 'M2 20h20v-4H2v4zm2-3h2v2H4v-2zM2 4v4h20V4H2zm4 3H4V5h2v2zm-4 7h20v-4H2v4zm2-3h2v2H4v-2z',
+    'terminal': ('M20 4H4c-1.11 0-2 .9-2 2v12c0 1.1.89 2 2 2h16c1.1 0 2-.9 2-2V6c0-1.1-.89-2-2-2zm0 14H4V8h16v10zm-2-1h-6v-2'
+                 'h6v2zM7.5 17l-1.41-1.41L8.67 13l-2.59-2.59L7.5 9l4 4-4 4z'),
+    'visibility': ('M12 4.5C7 4.5 2.73 7.61 1 12c1.73 4.39 6 7.5 11 7.5s9.27-3.11 11-7.5c-1.73-4.39-6-7.5-11-7.5zM12 17'
+                   'c-2.76 0-5-2.24-5-5s2.24-5 5-5 5 2.24 5 5-2.24 5-5 5zm0-8c-1.66 0-3 1.34-3 3'
+                   's1.34 3 3 3 3-1.34 3-3-1.34-3-3-3z'),
+}
+
+PANEL_ICON_SPRITE = '<svg xmlns="http://www.w3.org/2000/svg" style="display: none;">' + ''.join(
+    f'<symbol id="icon-{name}" viewBox="0 0 24 24"><path d="{path}"/></symbol>' for name, path in PANEL_ICONS.items()
+) + '</svg>'
+
+# ملف من ملفات الواجهة في الذاكرة مع نسخه المضغوطة مسبقاً
+class PanelAsset:
+    def __init__(self, data, mimetype):
+        self.data = data
+        self.mimetype = mimetype
+        self.mtime = time.time()
+        hasher = content_hash()
+        hasher.update(data)
+        self.etag = etag_from_hash(hasher)
+        self.encoded = {}
+        for encoding, _, compress in COMPRESSORS:
+            compressed = compress(data)
+            if len(compressed) < len(data):
+                self.encoded[encoding] = compressed
+
+    def result(self, req, cache_control):
+        encoding = negotiate_encoding(req, list(self.encoded))
+        etag = f"{self.etag}-{encoding}" if encoding else self.etag
+        if is_not_modified(req, etag, self.mtime):
+            return StaticResult(304, etag=etag, vary='Accept-Encoding', cache_control=cache_control)
+        return StaticResult(data=self.encoded.get(encoding, self.data), mimetype=self.mimetype, etag=etag,
+                            mtime=self.mtime, encoding=encoding, vary='Accept-Encoding', cache_control=cache_control)
+
+# css الواجهة يُصغر دائماً، أما js فيُصغر فقط إذا كانت rjsmin مثبتة: المصغر البديل لا يلمس
+# الملفات التي فيها نصوص قالبية (`) وPANEL_JS مليء بها، فيُرسل كما هو مضغوطاً بـ gzip
+PANEL_STYLES = PanelAsset(minify_css(PANEL_CSS).encode('utf-8'), 'text/css')
+PANEL_SCRIPT = PanelAsset(minify_js(PANEL_JS).encode('utf-8'), 'application/javascript')
+PANEL_STYLES_NAME = f"panel.{PANEL_STYLES.etag[:16]}.css"
+PANEL_SCRIPT_NAME = f"panel.{PANEL_SCRIPT.etag[:16]}.js"
+PANEL_ASSETS = {PANEL_STYLES_NAME: PANEL_STYLES, PANEL_SCRIPT_NAME: PANEL_SCRIPT}
+# الصفحة تُعاد التحقق منها في كل زيارة (no-cache)، والرد 304 إذا لم تتغير
+PANEL_CACHE_CONTROL = 'no-cache'
+
+CONTROL_PANEL = f'''
+<!DOCTYPE html>
+<html lang="ar" dir="rtl">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>نظام الاستضافة المتكامل</title>
+    <link rel="stylesheet" href="/_panel/{PANEL_STYLES_NAME}">
+    <script src="/_panel/{PANEL_SCRIPT_NAME}" defer></script>
 </head>
 <body>
+    {PANEL_ICON_SPRITE}
     <header>
         <div class="container">
             <h1>نظام الاستضافة المتكامل</h1>
@@ -369,14 +3628,14 @@ CONTROL_PANEL = f'''
     <div class="container">
         <div class="card">
             <h2 class="card-title">
-                <span class="icon">cloud_upload</span>
+                <svg class="icon"><use href="#icon-cloud_upload"></use></svg>
                 رفع ملفات جديدة
             </h2>
             
             <form id="uploadForm">
                 <div class="form-group">
                     <label for="file_type">
-                        <span class="icon">category</span>
+                        <svg class="icon"><use href="#icon-category"></use></svg>
                         نوع الملف
                     </label>
                     <select name="file_type" id="file_type" required>
@@ -390,14 +3649,14 @@ CONTROL_PANEL = f'''
                 
                 <div class="form-group">
                     <label for="fileInput">
-                        <span class="icon">attach_file</span>
+                        <svg class="icon"><use href="#icon-attach_file"></use></svg>
                         اختر الملف
                     </label>
                     <input type="file" name="file" id="fileInput" required>
                 </div>
                 
                 <button type="button" class="btn" onclick="uploadFile()">
-                    <span class="icon">file_upload</span>
+                    <svg class="icon"><use href="#icon-file_upload"></use></svg>
                     رفع الملف
                 </button>
             </form>
@@ -414,13 +3673,13 @@ CONTROL_PANEL = f'''
         
         <div class="card">
             <h2 class="card-title">
-                <span class="icon">storage</span>
+                <svg class="icon"><use href="#icon-storage"></use></svg>
                 معلومات التخزين
             </h2>
             
             <div class="storage-info">
                 <div class="storage-item">
-                    <span class="icon">folder</span>
+                    <svg class="icon"><use href="#icon-folder"></use></svg>
                     <div>
                         <div class="storage-label">إجمالي الملفات</div>
                         <div class="storage-value" id="totalFiles">0</div>
@@ -428,7 +3687,7 @@ CONTROL_PANEL = f'''
                 </div>
                 
                 <div class="storage-item">
-                    <span class="icon">data_usage</span>
+                    <svg class="icon"><use href="#icon-data_usage"></use></svg>
                     <div>
                         <div class="storage-label">المساحة المستخدمة</div>
                         <div class="storage-value" id="usedSpace">0 MB</div>
@@ -447,9 +3706,50 @@ CONTROL_PANEL = f'''
             </div>
         </div>
         
+        <div class="card" id="deployCard" style="display: none;">
+            <h2 class="card-title">
+                <svg class="icon"><use href="#icon-history"></use></svg>
+                الإصدارات المنشورة
+            </h2>
+            
+            <button type="button" class="btn" onclick="deploySite()">
+                <svg class="icon"><use href="#icon-publish"></use></svg>
+                نشر التعديلات الحالية
+            </button>
+            
+            <ul class="file-list" id="releaseList"></ul>
+        </div>
+        
+        <div class="card" id="statsCard" style="display: none;">
+            <h2 class="card-title">
+                <svg class="icon"><use href="#icon-bar_chart"></use></svg>
+                الملفات الأكثر طلباً (آخر ساعة)
+            </h2>
+            
+            <div class="storage-info">
+                <div class="storage-item">
+                    <svg class="icon"><use href="#icon-visibility"></use></svg>
+                    <div>
+                        <div class="storage-label">الطلبات</div>
+                        <div class="storage-value" id="statsRequests">0</div>
+                    </div>
+                </div>
+                
+                <div class="storage-item">
+                    <svg class="icon"><use href="#icon-data_usage"></use></svg>
+                    <div>
+                        <div class="storage-label">البيانات المرسلة</div>
+                        <div class="storage-value" id="statsBytes">0 KB</div>
+                    </div>
+                </div>
+            </div>
+            
+            <ul class="file-list" id="hotFileList"></ul>
+        </div>
+        
         <div class="card">
             <h2 class="card-title">
-                <span class="icon">folder</span>
+                <svg class="icon"><use href="#icon-folder"></use></svg>
                 الملفات الموجودة
             </h2>
             
@@ -459,227 +3759,123 @@ CONTROL_PANEL = f'''
                     <span>جاري تحميل قائمة الملفات...</span>
                 </li>
             </ul>
+            <div id="fileListSentinel"></div>
         </div>
     </div>
     
-    <script>
-        // رفع الملفات
-        function uploadFile() {{
-            const fileInput = document.getElementById('fileInput');
-            const fileType = document.getElementById('file_type');
-            const progressContainer = document.getElementById('progressContainer');
-            const progressFill = document.getElementById('progressFill');
-            const progressText = document.getElementById('progressText');
-            const resultMessage = document.getElementById('resultMessage');
-            
-            if (fileInput.files.length === 0) {{
-                showResult('الرجاء اختيار ملف أولاً', 'error');
-                return;
-            }}
-            
-            if (!fileType.value) {{
-                showResult('الرجاء اختيار نوع الملف', 'error');
-                return;
-            }}
-            
-            const formData = new FormData();
-            formData.append('file', fileInput.files[0]);
-            formData.append('file_type', fileType.value);
-            
-            // إظهار شريط التقدم
-            progressContainer.style.display = 'block';
-            progressFill.style.width = '0%';
-            progressText.textContent = 'جاري رفع الملف...';
-            resultMessage.style.display = 'none';
-            
-            // محاكاة تقدم الرفع (في الواقع الفعلي سيتم استخدام الأحداث الحقيقية)
-            const progressInterval = setInterval(() => {{
-                const currentWidth = parseInt(progressFill.style.width) || 0;
-                if (currentWidth < 90) {{
-                    progressFill.style.width = (currentWidth + 10) + '%';
-                }}
-            }}, 300);
-            
-            fetch('/upload', {{
-                method: 'POST',
-                body: formData
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                clearInterval(progressInterval);
-                progressFill.style.width = '100%';
-                progressText.textContent = 'اكتمل الرفع!';
-                
-                if (data.status === 'success') {{
-                    showResult(`تم رفع الملف بنجاح: ${{data.filename}}`, 'success');
-                    loadFiles(); // تحديث قائمة الملفات ومعلومات التخزين
-                }} else {{
-                    showResult(data.message || 'حدث خطأ أثناء الرفع', 'error');
-                }}
-                
-                // إخفاء شريط التقدم بعد 3 ثواني
-                setTimeout(() => {{
-                    progressContainer.style.display = 'none';
-                }}, 3000);
-            }})
-            .catch(error => {{
-                clearInterval(progressInterval);
-                showResult('حدث خطأ في الاتصال بالخادم', 'error');
-                progressContainer.style.display = 'none';
-                console.error('Error:', error);
-            }});
-        }}
-        
-        // عرض رسائل النتيجة
-        function showResult(message, type) {{
-            const resultMessage = document.getElementById('resultMessage');
-            resultMessage.textContent = message;
-            resultMessage.className = 'result-message ' + type;
-            resultMessage.style.display = 'block';
-        }}
-        
-        // جلب قائمة الملفات
-        function loadFiles() {{
-            fetch('/api/files')
-            .then(response => response.json())
-            .then(data => {{
-                const fileList = document.getElementById('fileList');
-                fileList.innerHTML = '';
-                
-                if (data.files.length === 0) {{
-                    fileList.innerHTML = '<li class="file-item">لا توجد ملفات بعد</li>';
-                }} else {{
-                    data.files.forEach(file => {{
-                        const li = document.createElement('li');
-                        li.className = 'file-item';
-                        
-                        const link = document.createElement('a');
-                        link.href = `/${{file}}`;
-                        link.className = 'file-link';
-                        link.target = '_blank';
-                        link.innerHTML = `
-                            <span class="icon">${{getFileIcon(file)}}</span>
-                            ${{file}}
-                        `;
-                        
-                        const actions = document.createElement('div');
-                        actions.className = 'file-actions';
-                        
-                        const viewBtn = document.createElement('button');
-                        viewBtn.className = 'action-btn view-btn';
-                        viewBtn.innerHTML = '<span class="icon">visibility</span> عرض';
-                        viewBtn.onclick = () => window.open(`/${{file}}`, '_blank');
-                        
-                        const deleteBtn = document.createElement('button');
-                        deleteBtn.className = 'action-btn delete-btn';
-                        deleteBtn.innerHTML = '<span class="icon">delete</span> حذف';
-                        deleteBtn.onclick = () => deleteFile(file);
-                        
-                        actions.appendChild(viewBtn);
-                        actions.appendChild(deleteBtn);
-                        li.appendChild(link);
-                        li.appendChild(actions);
-                        fileList.appendChild(li);
-                    }});
-                }}
-                
-                // تحديث معلومات التخزين
-                updateStorageInfo(data.storage_info);
-            }})
-            .catch(error => {{
-                console.error('Error loading files:', error);
-            }});
-        }}
-        
-        // تحديث معلومات التخزين
-        function updateStorageInfo(storageInfo) {{
-            document.getElementById('totalFiles').textContent = storageInfo.file_count;
-            document.getElementById('usedSpace').textContent = `${{storageInfo.total_size_mb}} MB`;
-            
-            // حساب النسبة المئوية (افترضنا أن الحد الأقصى هو 100MB للتخزين)
-            const maxStorageMB = 100;
-            const percentage = Math.min((storageInfo.total_size_mb / maxStorageMB) * 100, 100);
-            
-            document.getElementById('storageProgress').style.width = `${{percentage}}%`;
-            
-            // تحديث النصوص
-            const progressInfo = document.querySelector('.progress-info');
-            if (progressInfo) {{
-                progressInfo.innerHTML = `
-                    <span>${{percentage.toFixed(1)}}% مستخدم</span>
-                    <span>${{(100 - percentage).toFixed(1)}}% متبقي</span>
-                `;
-            }}
-        }}
-        
-        // حذف الملف
-        function deleteFile(filename) {{
-            if (confirm(`هل أنت متأكد من حذف الملف ${{filename}}؟`)) {{
-                fetch(`/api/delete/${{encodeURIComponent(filename)}}`, {{
-                    method: 'DELETE'
-                }})
-                .then(response => response.json())
-                .then(data => {{
-                    if (data.status === 'success') {{
-                        showResult(`تم حذف الملف ${{filename}}`, 'success');
-                        loadFiles(); // تحديث قائمة الملفات ومعلومات التخزين
-                    }} else {{
-                        showResult(data.message || 'حدث خطأ أثناء الحذف', 'error');
-                    }}
-                }})
-                .catch(error => {{
-                    showResult('حدث خطأ في الاتصال بالخادم', 'error');
-                    console.error('Error:', error);
-                }});
-            }}
-        }}
-        
-        // تحديد أيقونة الملف حسب نوعه
-        function getFileIcon(filename) {{
-            if (filename.endsWith('.html')) return 'html';
-            if (filename.endsWith('.css')) return 'css';
-            if (filename.endsWith('.js')) return 'javascript';
-            if (filename.endsWith('.png') || filename.endsWith('.jpg') || filename.endsWith('.jpeg') || filename.endsWith('.gif')) return 'image';
-            return 'insert_drive_file';
-        }}
-        
-        // تحميل الملفات عند فتح الصفحة
-        document.addEventListener('DOMContentLoaded', loadFiles);
-    </script>
 </body>
 </html>
 '''
+PANEL_PAGE = PanelAsset(CONTROL_PANEL.encode('utf-8'), 'text/html')
 
 # الصفحة الرئيسية
+def resolve_control_panel(req):
+    if site_for_request(req) is None:
+        return None
+    return PANEL_PAGE.result(req, PANEL_CACHE_CONTROL)
+
 @app.route('/')
 def control_panel():
-    return CONTROL_PANEL
+    return resolve_control_panel(request).to_response()
+
+def resolve_panel_asset(name, req):
+    asset = PANEL_ASSETS.get(name)
+    return asset.result(req, BUNDLE_CACHE_CONTROL) if asset is not None else None
+
+@app.route('/_panel/<name>')
+def serve_panel_asset(name):
+    result = resolve_panel_asset(name, request)
+    if result is None:
+        abort(404)
+    return result.to_response()
 
 # واجهة API لسرد الملفات
 @app.route('/api/files')
 def list_files_api():
-    files = []
-    for root, dirs, filenames in os.walk(BASE_DIR):
-        for filename in filenames:
-            rel_path = os.path.relpath(os.path.join(root, filename), BASE_DIR)
-            files.append(rel_path.replace('\\', '/'))
+    cursor = request.args.get('cursor', '')
+    folder = request.args.get('folder', '')
+    extensions = {e.strip().lower().lstrip('.') for e in request.args.get('ext', '').split(',') if e.strip()}
     
-    storage_info = get_storage_info()
+    try:
+        limit = int(request.args.get('limit', FILES_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= FILES_MAX_PAGE_SIZE:
+        return jsonify({
+            'status': 'error',
+            'message': f'حجم الصفحة يجب أن يكون بين 1 و {FILES_MAX_PAGE_SIZE}'
+        }), 400
     
-    return jsonify({
-        'files': files,
-        'storage_info': storage_info
-    })
+    if folder and folder not in UPLOAD_FOLDERS:
+        return jsonify({
+            'status': 'error',
+            'message': 'المجلد غير معروف'
+        }), 400
+    
+    site_prefix = site_path(g.site, '')
+    files, next_cursor = storage_index.page(
+        cursor=site_prefix + cursor if cursor else '',
+        limit=limit,
+        prefix=site_prefix + (f"{folder}/" if folder else ''),
+        extensions=extensions
+    )
+    if site_prefix:
+        files = [f[len(site_prefix):] for f in files]
+        next_cursor = next_cursor[len(site_prefix):] if next_cursor is not None else None
+    
+    storage_info = get_storage_info(g.site)
+    
+    with metrics.timer('json_serialize'):
+        return jsonify({
+            'files': files,
+            'next_cursor': next_cursor,
+            'storage_info': storage_info
+        })
+
+# بث تغييرات الملفات ومعلومات التخزين للوحة التحكم
+@app.route('/api/events')
+def file_events():
+    subscription, backlog = change_feed.subscribe(request.headers.get('Last-Event-ID'), g.site)
+    # asgi.py يستدعي هذه الدوال عند انقطاع الاتصال، فينتهي البث فوراً بدل انتظار النبضة التالية
+    request.environ.get('sarver.on_disconnect', []).append(subscription.close)
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            if backlog is None:
+                yield 'event: reset\ndata: {}\n\n'
+            for event_id, data in backlog or []:
+                yield f"id: {event_id}\nevent: file\ndata: {data}\n\n"
+            deadline = time.monotonic() + SSE_STREAM_TIMEOUT
+            while time.monotonic() < deadline:
+                try:
+                    item = subscription.queue.get(timeout=SSE_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if subscription.closed:
+                    return
+                if item is None:
+                    yield 'event: reset\ndata: {}\n\n'
+                    continue
+                event_id, data = item
+                yield f"id: {event_id}\nevent: file\ndata: {data}\n\n"
+        finally:
+            change_feed.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # حذف الملفات
 @app.route('/api/delete/<path:filename>', methods=['DELETE'])
 def delete_file(filename):
     try:
-        file_path = os.path.join(BASE_DIR, filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        rel_path = site_rel_path(g.site, filename)
+        if rel_path is not None and delete_site_file(rel_path, request.if_match):
             return jsonify({'status': 'success', 'message': f'تم حذف الملف {filename}'})
         return jsonify({'status': 'error', 'message': 'الملف غير موجود'}), 404
+    except WriteConflict:
+        raise
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -702,22 +3898,23 @@ def upload_file():
         }), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
+        filename, _, filepath = resolve_upload_path(file.filename, file_type, g.site)
+        check_quota(g.site, request.content_length or 0, [filepath])
         
-        # تحديد مسار الحفظ بناءً على نوع الملف
-        if file_type in ['css', 'js', 'images', 'fonts']:
-            save_path = os.path.join(BASE_DIR, file_type, filename)
-            filepath = f"{file_type}/{filename}"
-        else:
-            save_path = os.path.join(BASE_DIR, filename)
-            filepath = filename
-        
-        file.save(save_path)
+        # الكتابة في ملف مؤقت ثم نقله، فلا يُرى ملف نصف مكتوب
+        tmp_path = temp_upload_path()
+        try:
+            etag = save_upload(file, tmp_path)
+            write_site_file(tmp_path, filepath, etag, request.if_match)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         
         return jsonify({
             'status': 'success',
             'filename': filename,
-            'filepath': filepath
+            'filepath': split_site(filepath)[1],
+            'etag': etag
         })
     
     return jsonify({
@@ -725,23 +3922,837 @@ def upload_file():
         'message': 'نوع الملف غير مسموح به'
     }), 400
 
+# تحديد مسار الحفظ بناءً على نوع الملف
+def resolve_upload_path(filename, file_type, site=''):
+    filename = secure_filename(filename)
+    if file_type in UPLOAD_FOLDERS:
+        filepath = site_path(site, f"{file_type}/{filename}")
+    else:
+        filepath = site_path(site, filename)
+    save_path = os.path.join(BASE_DIR, filepath)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    return filename, save_path, filepath
+
+# مسار الملف في الرفع الجماعي: بنية الأرشيف تبقى كما هي بعد تنظيف كل جزء من المسار،
+# والنوع المحدد يضع الملفات كلها تحت مجلده، والملف في أعلى الأرشيف يوضع في مجلد امتداده
+def member_path(name, file_type=''):
+    parts = [part for part in map(secure_filename, name.replace('\\', '/').split('/')) if part]
+    if not parts:
+        return None
+    if file_type in UPLOAD_FOLDERS:
+        if parts[0] != file_type:
+            parts.insert(0, file_type)
+    elif len(parts) == 1:
+        folder = EXTENSION_FOLDERS.get(parts[0].rsplit('.', 1)[-1].lower())
+        if folder:
+            parts.insert(0, folder)
+    return '/'.join(parts)
+
+# إعدادات الرفع الجماعي
+STAGING_DIR = os.path.join(WORK_DIR, 'staging')
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 5000))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', 512 * 1024 * 1024))
+BATCH_WRITE_WORKERS = int(os.environ.get('BATCH_WRITE_WORKERS', 8))
+os.makedirs(STAGING_DIR, exist_ok=True)
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WRITE_WORKERS, thread_name_prefix='batch-upload')
+
+# يمنع نشر دفعتين في نفس الوقت
+site_commit_lock = threading.Lock()
+
+class BatchUploadError(Exception):
+    pass
+
+# رفع جماعي: تُكتب الملفات أولاً في مجلد مؤقت، ولا يُنشر شيء منها
+# إلا بعد نجاح كتابة الدفعة كاملة
+class BatchUpload:
+    def __init__(self, file_type='', site=''):
+        self.file_type = file_type
+        self.site = site
+        self.dir = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+        self.staged = {}  # filepath -> (staged_path, etag)
+        self.skipped = []
+        self._targets = set()
+        self._count = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.dir)
+
+    # حجز مكان لملف في الدفعة مع التحقق من الحدود
+    def _reserve(self, size):
+        with self._lock:
+            self._count += 1
+            if self._count > BATCH_MAX_FILES:
+                raise BatchUploadError(f'عدد الملفات أكبر من الحد المسموح ({BATCH_MAX_FILES})')
+            self._add_bytes(size)
+            return self._count
+
+    # يُستدعى مع القفل
+    def _add_bytes(self, size):
+        self._bytes += size
+        if self._bytes > BATCH_MAX_BYTES:
+            raise BatchUploadError('حجم الدفعة أكبر من الحد المسموح')
+
+    # مسار الملف في الموقع، أو None إذا تُخطي. ملفان بنفس المسار يرفضان الدفعة بدل أن يطغى أحدهما على الآخر
+    def _accept(self, name):
+        rel_path = member_path(name, self.file_type)
+        if rel_path is None or not allowed_file(rel_path.rsplit('/', 1)[-1]):
+            with self._lock:
+                self.skipped.append(name)
+            return None
+        filepath = site_path(self.site, rel_path)
+        with self._lock:
+            if filepath in self._targets:
+                raise BatchUploadError(f'الملف {rel_path} مكرر في الدفعة')
+            self._targets.add(filepath)
+        return filepath
+
+    def _stage(self, seq, filepath, opener, size):
+        staged_path = os.path.join(self.dir, str(seq))
+        with opener() as stream:
+            etag = save_stream(stream, staged_path)
+        with self._lock:
+            # الحجم المعلن قد لا يكون معروفاً (أجزاء multipart)، فيُحتسب الفرق بعد الكتابة
+            self._add_bytes(os.path.getsize(staged_path) - size)
+            self.staged[filepath] = (staged_path, etag)
+
+    # كتابة مجموعة من الملفات بالتوازي: members قائمة من (الاسم، الحجم، دالة فتح)
+    def stage_parallel(self, members):
+        futures = []
+        try:
+            for name, size, opener in members:
+                filepath = self._accept(name)
+                if filepath is None:
+                    continue
+                seq = self._reserve(size)
+                futures.append(batch_executor.submit(self._stage, seq, filepath, opener, size))
+        finally:
+            # كل الملفات التي بدأت كتابتها تنتهي قبل أي حذف لمجلد الدفعة
+            for future in futures:
+                future.exception()
+        for future in futures:
+            future.result()
+
+    def stage_files(self, files):
+        self.stage_parallel([(f.filename, f.content_length or 0, lambda f=f: f.stream) for f in files])
+
+    def stage_zip(self, stream):
+        with zipfile.ZipFile(stream) as archive:
+            self.stage_parallel([
+                (info.filename, info.file_size, lambda info=info: archive.open(info))
+                for info in archive.infolist() if not info.is_dir()
+            ])
+
+    # الأرشيف tar يُقرأ كتدفق متسلسل فلا يمكن توزيع قراءته على عدة خيوط
+    def stage_tar(self, stream):
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                filepath = self._accept(member.name)
+                if filepath is None:
+                    continue
+                seq = self._reserve(member.size)
+                self._stage(seq, filepath, lambda member=member: archive.extractfile(member), member.size)
+
+    def stage_archive(self, stream):
+        if zipfile.is_zipfile(stream):
+            stream.seek(0)
+            self.stage_zip(stream)
+        else:
+            stream.seek(0)
+            self.stage_tar(stream)
+
+    # نشر الدفعة: نقل كل الملفات إلى أماكنها ثم تحديث الفهرس والذاكرة المؤقتة
+    def commit(self):
+        with site_commit_lock, path_locks.hold(*self.staged):
+            incoming = sum(os.path.getsize(staged_path) for staged_path, _ in self.staged.values())
+            check_quota(self.site, incoming, self.staged)
+            placed = []
+            try:
+                for filepath, (staged_path, etag) in self.staged.items():
+                    os.makedirs(os.path.dirname(os.path.join(BASE_DIR, filepath)), exist_ok=True)
+                    place_file(staged_path, filepath, etag)
+                    placed.append(filepath)
+            finally:
+                # ما نُقل قبل أي خطأ أصبح في الموقع فيُسجل حتى لا يبقى ملف خارج الفهرس
+                for filepath in placed:
+                    commit_file(filepath, self.staged[filepath][1])
+        self.discard()
+        return sorted(split_site(filepath)[1] for filepath in self.staged)
+
+    def discard(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+# رفع عدة ملفات أو أرشيف zip/tar في طلب واحد
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    archive = request.files.get('archive')
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if archive is None and not files:
+        return jsonify({
+            'status': 'error',
+            'message': 'لم يتم اختيار ملفات'
+        }), 400
+    
+    batch = BatchUpload(request.form.get('file_type', ''), g.site)
+    try:
+        if archive is not None:
+            batch.stage_archive(archive.stream)
+        else:
+            batch.stage_files(files)
+        committed = batch.commit()
+    except BatchUploadError as e:
+        batch.discard()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except (zipfile.BadZipFile, tarfile.TarError):
+        batch.discard()
+        return jsonify({'status': 'error', 'message': 'الأرشيف غير صالح'}), 400
+    except QuotaExceeded:
+        batch.discard()
+        raise
+    except Exception as e:
+        batch.discard()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    
+    return jsonify({
+        'status': 'success',
+        'files': committed,
+        'skipped': batch.skipped
+    })
+
+# الرفع المجزأ القابل للاستئناف:
+# POST /api/uploads ثم PUT /api/uploads/<id>?offset=N لكل جزء ثم POST /api/uploads/<id>/finalize
+UPLOADS_DIR = os.path.join(WORK_DIR, 'uploads')
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+def upload_session_paths(upload_id):
+    base = os.path.join(UPLOADS_DIR, upload_id)
+    return f"{base}.json", f"{base}.part"
+
+def load_upload_session(upload_id, site=''):
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        return None
+    session_path, part_path = upload_session_paths(upload_id)
+    try:
+        with open(session_path, encoding='utf-8') as f:
+            session = json.load(f)
+        session['offset'] = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        return None
+    # جلسة رفع موقع آخر
+    if session.get('site', '') != site:
+        return None
+    return session
+
+def discard_upload_session(upload_id):
+    for path in upload_session_paths(upload_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# حذف جلسات الرفع المتروكة
+@background_task
+def upload_sessions_cleanup_loop():
+    while True:
+        time.sleep(3600)
+        now = time.time()
+        for name in os.listdir(UPLOADS_DIR):
+            if not name.endswith('.part'):
+                continue
+            try:
+                if now - os.path.getmtime(os.path.join(UPLOADS_DIR, name)) > UPLOAD_SESSION_TTL:
+                    discard_upload_session(name[:-len('.part')])
+            except OSError:
+                pass
+
+# بدء جلسة رفع جديدة
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or request.form
+    filename = data.get('filename', '')
+    file_type = data.get('file_type', '')
+    size = data.get('size')
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({
+            'status': 'error',
+            'message': 'نوع الملف غير مسموح به'
+        }), 400
+    
+    try:
+        size = int(size) if size is not None else None
+    except (TypeError, ValueError):
+        size = -1
+    if size is not None and size < 0:
+        return jsonify({
+            'status': 'error',
+            'message': 'حجم الملف غير صالح'
+        }), 400
+    
+    filename, save_path, filepath = resolve_upload_path(filename, file_type, g.site)
+    if size is not None:
+        check_quota(g.site, size, [filepath])
+    upload_id = uuid.uuid4().hex
+    session_path, part_path = upload_session_paths(upload_id)
+    open(part_path, 'wb').close()
+    with open(session_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'filename': filename,
+            'filepath': filepath,
+            'save_path': save_path,
+            'site': g.site,
+            'size': size,
+            'created': time.time()
+        }, f, ensure_ascii=False)
+    
+    return jsonify({
+        'status': 'success',
+        'upload_id': upload_id,
+        'offset': 0
+    })
+
+# حالة جلسة الرفع (لاستئناف الرفع من آخر موضع محفوظ)
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    session = load_upload_session(upload_id, g.site)
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'جلسة الرفع غير موجودة'}), 404
+    return jsonify({
+        'status': 'success',
+        'upload_id': upload_id,
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': session['offset']
+    })
+
+# كتابة جزء من الملف مباشرة إلى الملف المؤقت دون تخزينه في الذاكرة
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    session = load_upload_session(upload_id, g.site)
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'جلسة الرفع غير موجودة'}), 404
+    
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'موضع الجزء غير صالح'}), 400
+    
+    length = request.content_length
+    if length is None:
+        return jsonify({'status': 'error', 'message': 'يجب تحديد طول الجزء'}), 411
+    if length > UPLOAD_CHUNK_MAX_SIZE:
+        return jsonify({'status': 'error', 'message': 'حجم الجزء أكبر من المسموح'}), 413
+    
+    # قفل ملف الجلسة يشمل العمليات العاملة الأخرى، فلا يكتب جزءان في نفس الملف معاً
+    session_path, part_path = upload_session_paths(upload_id)
+    with path_locks.hold(session_path):
+        current = os.path.getsize(part_path)
+        if offset != current:
+            return jsonify({
+                'status': 'error',
+                'message': 'موضع الجزء لا يطابق ما تم رفعه',
+                'offset': current
+            }), 409
+        if session['size'] is not None and offset + length > session['size']:
+            return jsonify({'status': 'error', 'message': 'البيانات أكبر من حجم الملف'}), 400
+        # الجلسة دون حجم معلن تُحسب من المساحة مع كل جزء، لا عند الإنهاء فقط
+        check_quota(g.site, offset + length, [session['filepath']])
+        
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            for chunk in iter(lambda: request.stream.read(HASH_CHUNK_SIZE), b''):
+                f.write(chunk)
+            fsync_file(f)
+            offset = f.tell()
+    
+    return jsonify({
+        'status': 'success',
+        'offset': offset
+    })
+
+# إنهاء الرفع: نقل الملف المؤقت إلى مكانه النهائي دفعة واحدة
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    session = load_upload_session(upload_id, g.site)
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'جلسة الرفع غير موجودة'}), 404
+    
+    # قفل الجلسة وقفل مسار الملف يُؤخذان معاً بترتيب الخانات، فلا تتعارض مع من يقفل المسار
+    filepath = session['filepath']
+    session_path, part_path = upload_session_paths(upload_id)
+    with path_locks.hold(session_path, filepath):
+        offset = os.path.getsize(part_path)
+        if session['size'] is not None and offset != session['size']:
+            return jsonify({
+                'status': 'error',
+                'message': 'لم يكتمل رفع الملف بعد',
+                'offset': offset
+            }), 409
+        check_quota(g.site, offset, [filepath])
+        etag = hash_file(part_path)
+        # نفس خطوات write_site_file، وقفل المسار ممسوك هنا
+        check_if_match(filepath, request.if_match)
+        place_file(part_path, filepath, etag)
+        commit_file(filepath, etag)
+        discard_upload_session(upload_id)
+    
+    return jsonify({
+        'status': 'success',
+        'filename': session['filename'],
+        'filepath': split_site(filepath)[1],
+        'etag': etag
+    })
+
+# إلغاء جلسة الرفع
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    if load_upload_session(upload_id, g.site) is None:
+        return jsonify({'status': 'error', 'message': 'جلسة الرفع غير موجودة'}), 404
+    with path_locks.hold(upload_session_paths(upload_id)[0]):
+        discard_upload_session(upload_id)
+    return jsonify({'status': 'success'})
+
+# الإصدارات المنشورة والإصدار الذي يراه الزوار
+@app.route('/api/deploys', methods=['GET'])
+def list_deploys():
+    if deployments is None:
+        abort(404)
+    return jsonify({'live': deployments.current(g.site), 'versions': deployments.versions(g.site)})
+
+@app.route('/api/deploys', methods=['POST'])
+def create_deploy():
+    if deployments is None:
+        abort(404)
+    version = deployments.deploy(g.site)
+    return jsonify({'status': 'success', 'version': version})
+
+# الرجوع إلى إصدار سابق (أو التقدم إلى إصدار أحدث)
+@app.route('/api/deploys/<version>/activate', methods=['POST'])
+def activate_deploy(version):
+    if deployments is None:
+        abort(404)
+    try:
+        deployments.activate(g.site, version)
+    except ReleaseNotFound:
+        return jsonify({'status': 'error', 'message': 'الإصدار غير موجود'}), 404
+    return jsonify({'status': 'success', 'version': version})
+
+# إحصائيات ذاكرة الملفات الساخنة
+@app.route('/api/cache')
+def cache_stats_api():
+    return jsonify(hot_cache.stats())
+
+# الملفات الأكثر طلباً والبايتات المرسلة للموقع خلال آخر ساعة (أو window ثانية)
+@app.route('/api/stats')
+def access_stats_api():
+    if access_log is None:
+        return jsonify({'status': 'error', 'message': 'سجل الوصول معطل (ACCESS_LOG=1)'}), 404
+    try:
+        top = min(max(int(request.args.get('top', STATS_TOP_N)), 1), 100)
+        window = min(max(int(request.args.get('window', STATS_WINDOW)), STATS_BUCKET_SECONDS), STATS_WINDOW)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'قيم غير صالحة'}), 400
+    return jsonify(access_log.summary(g.site, top, window))
+
+@metrics.collector
+def storage_metrics():
+    total_size, file_count = storage_index.totals()
+    cache = hot_cache.stats()
+    return [
+        ('sarver_storage_bytes', 'gauge', 'Total size of hosted files.', [({}, total_size)]),
+        ('sarver_storage_files', 'gauge', 'Number of hosted files.', [({}, file_count)]),
+        ('sarver_storage_physical_bytes', 'gauge', 'Disk usage of hosted files with shared content counted once.',
+         [({}, storage_index.physical_size())]),
+        ('sarver_hot_cache_bytes', 'gauge', 'Bytes held in the hot asset cache.', [({}, cache['size'])]),
+        ('sarver_hot_cache_entries', 'gauge', 'Entries in the hot asset cache.', [({}, cache['entries'])]),
+        ('sarver_hot_cache_hits_total', 'counter', 'Hot asset cache hits.', [({}, cache['hits'])]),
+        ('sarver_hot_cache_misses_total', 'counter', 'Hot asset cache misses.', [({}, cache['misses'])]),
+        ('sarver_hot_cache_evictions_total', 'counter', 'Hot asset cache evictions.', [({}, cache['evictions'])]),
+        ('sarver_compression_queue_length', 'gauge', 'Files waiting for precompression.',
+         [({}, compression_queue.qsize())]),
+        ('sarver_event_subscribers', 'gauge', 'Open control panel event streams.',
+         [({}, change_feed.subscriber_count())]),
+        ('sarver_path_lock_contended_total', 'counter', 'Writes that waited for another write to the same path.',
+         [({}, path_locks.contended)]),
+    ]
+
+@metrics.collector
+def rate_limit_metrics():
+    if rate_limiter is None:
+        return []
+    stats = rate_limiter.stats()
+    return [
+        ('sarver_rate_limit_allowed_total', 'counter', 'Requests admitted by the rate limiter.',
+         [({'class': route}, count) for route, count in sorted(stats['allowed'].items())]),
+        ('sarver_rate_limit_limited_total', 'counter', 'Requests rejected with 429 by the rate limiter.',
+         [({'class': route}, count) for route, count in sorted(stats['limited'].items())]),
+        ('sarver_rate_limit_clients', 'gauge', 'Client buckets held by the rate limiter.', [({}, stats['entries'])]),
+        ('sarver_rate_limit_evictions_total', 'counter', 'Client buckets evicted from the full rate limiter table.',
+         [({}, stats['evictions'])]),
+    ]
+
+@metrics.collector
+def access_log_metrics():
+    if access_log is None:
+        return []
+    return [
+        ('sarver_access_log_queue_depth', 'gauge', 'Access log entries waiting for the writer thread.',
+         [({}, access_log.queue.qsize())]),
+        ('sarver_access_log_written_total', 'counter', 'Access log entries written to disk.', [({}, access_log.written)]),
+        ('sarver_access_log_dropped_total', 'counter', 'Access log entries dropped because the queue was full.',
+         [({}, access_log.dropped)]),
+        ('sarver_access_log_rotations_total', 'counter', 'Access log file rotations.', [({}, access_log.rotations)]),
+    ]
+
+# المقاييس بصيغة Prometheus
+@app.route('/api/metrics')
+def metrics_api():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# أخذ عينات من مكدسات مسار معين لعدة ثوان وإرجاع أكثرها تكراراً
+@app.route('/api/profile')
+def profile_api():
+    if not ENABLE_PROFILER:
+        return jsonify({'status': 'error', 'message': 'المحلل غير مفعل (ENABLE_PROFILER=1)'}), 404
+    route = request.args.get('route', 'serve_file')
+    try:
+        seconds = min(float(request.args.get('seconds', 5)), PROFILER_MAX_SECONDS)
+        top = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'قيم غير صالحة'}), 400
+    return jsonify(sample_route_stacks(route, seconds, top))
+
+# نتيجة تحليل طلب ملف ثابت: إما 304، أو محتوى من الذاكرة (data)، أو ملف على القرص (path)
+# مشتركة بين تطبيق Flask ونقطة الدخول غير المتزامنة في asgi.py
+class StaticResult:
+    def __init__(self, status=200, path=None, data=None, mimetype=None, etag=None, mtime=None,
+                 encoding=None, vary=None, cache_control=None):
+        self.status = status
+        self.path = path
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = etag
+        self.mtime = mtime
+        self.encoding = encoding
+        self.vary = vary
+        self.cache_control = cache_control
+
+    def headers(self):
+        headers = Headers()
+        if self.status != 304 and self.mimetype:
+            headers['Content-Type'] = get_content_type(self.mimetype, 'utf-8')
+        if self.etag:
+            headers['ETag'] = quote_etag(self.etag)
+        if self.mtime is not None:
+            headers['Last-Modified'] = http_date(self.mtime)
+        if self.encoding:
+            headers['Content-Encoding'] = self.encoding
+        if self.vary:
+            headers['Vary'] = self.vary
+        if self.cache_control:
+            headers['Cache-Control'] = self.cache_control
+        if self.status != 304:
+            headers['Accept-Ranges'] = 'bytes'
+        return headers
+
+    def size(self):
+        return len(self.data) if self.data is not None else os.path.getsize(self.path)
+
+    def to_response(self):
+        if self.status == 304:
+            return Response(status=304, headers=self.headers())
+        
+        # طلبات Range تُرسل نطاقاتها فقط (طلب نطاق غير صالح يرفع 416)، والملف الكامل عبر send_file.
+        # ترويسة Range التي تقرر تجاهلها (If-Range قديم أو نطاقات كثيرة) لا تُترك لـ send_file ليعالجها مرة ثانية
+        size = self.size()
+        ranges = requested_ranges(request, size, self.etag, self.mtime)
+        if ranges is not None or (self.data is None and request.range is not None):
+            layout = ByteRanges(ranges or [(0, size)], size, get_content_type(self.mimetype, 'utf-8'))
+            headers = self.headers()
+            if ranges is None:
+                headers['Content-Length'] = str(size)
+            else:
+                headers.update(layout.headers)
+            response = Response(RangeStream(layout, self.path, self.data), status=206 if ranges else 200,
+                                headers=headers, direct_passthrough=True)
+            return response if ranges else response.make_conditional(request)
+        
+        if self.data is not None:
+            response = Response(self.data, headers=self.headers())
+            return response.make_conditional(request)
+        
+        with metrics.timer('send_file'):
+            response = send_file(self.path, mimetype=self.mimetype, etag=self.etag or True,
+                                 last_modified=self.mtime, conditional=True)
+        if self.encoding:
+            response.headers['Content-Encoding'] = self.encoding
+        if self.vary:
+            response.headers['Vary'] = self.vary
+        if self.cache_control:
+            response.headers['Cache-Control'] = self.cache_control
+        return response
+
+# تحليل طلب ملف ثابت دون الاعتماد على سياق Flask (req كائن Request من Werkzeug)
+def resolve_static(filename, req):
+    site = site_for_request(req)
+    url = site_rel_path(site, filename) if site is not None else None
+    if url is None:
+        return None
+    # بعد أول نشر يُرسل الملف من الإصدار الحالي لا من المسودة
+    release = deployments.live(site) if deployments is not None else None
+    rel_path = release.resolve(url) if release is not None else route_table.resolve(url)
+    if rel_path is None:
+        return None
+    # الملف الفعلي لا الرابط كما أرسله العميل، لسجل الوصول
+    req.environ['sarver.rel_path'] = rel_path
+    if release is not None:
+        path = release.path('files', rel_path)
+    else:
+        path = os.path.join(os.path.abspath(BASE_DIR), rel_path)
+    
+    # الرد بـ 304 من الفهرس والبيانات الوصفية دون قراءة الملف
+    etag = None
+    mtime = None
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    vary = 'Accept-Encoding' if is_compressible(rel_path) else None
+    meta = None
+    if release is not None:
+        meta = release.files[rel_path]
+        mtime = meta['mtime']
+    else:
+        indexed = storage_index.get(rel_path)
+        if indexed is not None:
+            size, mtime = indexed
+            meta = get_file_metadata(rel_path, path, size, mtime)
+    if meta is not None:
+        etag = meta['etag']
+        # إرسال النسخة المبنية (المصغرة) بدل الأصل إن وجدت
+        if meta.get('build'):
+            etag = meta['build']['etag']
+            path = release.path('build', rel_path) if release is not None else os.path.abspath(build_path(rel_path))
+        encoding = negotiate_encoding(req, meta.get('encodings'))
+        image = select_image_variant(req, rel_path, meta.get('images'))
+        if meta.get('images'):
+            vary = 'Accept'
+        variant = encoding or image
+        variant_etag = f"{etag}-{variant}" if variant else etag
+        
+        if is_not_modified(req, variant_etag, mtime):
+            return StaticResult(304, etag=variant_etag, mtime=mtime, vary=vary)
+        
+        # إرسال النسخة المضغوطة مسبقاً إن وجدت
+        if encoding:
+            result = resolve_encoded_variant(rel_path, mimetype, encoding, variant_etag, mtime, release)
+            if result is not None:
+                return result
+        
+        # إرسال نسخة الصورة المحسنة المناسبة إن وجدت
+        if image:
+            result = resolve_image_variant(rel_path, etag, image, variant_etag, mtime, release)
+            if result is not None:
+                return result
+    
+    if hot_cache.enabled:
+        entry = hot_cache.get(path) or hot_cache.load(path)
+        if entry is not None:
+            return StaticResult(data=entry.data, mimetype=entry.mimetype, etag=etag,
+                                mtime=entry.mtime, vary=vary)
+    
+    if not os.path.isfile(path):
+        return None
+    return StaticResult(path=path, mimetype=mimetype, etag=etag, mtime=mtime, vary=vary)
+
+def resolve_encoded_variant(rel_path, mimetype, encoding, etag, mtime, release=None):
+    if release is not None:
+        variant = release.path('variants', rel_path, ENCODING_SUFFIXES[encoding])
+    else:
+        variant = os.path.abspath(variant_path(rel_path, ENCODING_SUFFIXES[encoding]))
+    
+    entry = (hot_cache.get(variant) or hot_cache.load(variant, mimetype)) if hot_cache.enabled else None
+    if entry is not None:
+        return StaticResult(data=entry.data, mimetype=mimetype, etag=etag, mtime=mtime,
+                            encoding=encoding, vary='Accept-Encoding')
+    if os.path.isfile(variant):
+        return StaticResult(path=variant, mimetype=mimetype, etag=etag, mtime=mtime,
+                            encoding=encoding, vary='Accept-Encoding')
+    return None
+
+def resolve_image_variant(rel_path, content_etag, name, etag, mtime, release=None):
+    if release is not None:
+        variant = os.path.join(release.path('images', rel_path), name)
+    else:
+        variant = os.path.abspath(os.path.join(image_variant_dir(rel_path, content_etag), name))
+    mimetype = mimetypes.guess_type(variant)[0] or 'application/octet-stream'
+    
+    entry = (hot_cache.get(variant) or hot_cache.load(variant, mimetype)) if hot_cache.enabled else None
+    if entry is not None:
+        return StaticResult(data=entry.data, mimetype=mimetype, etag=etag, mtime=mtime, vary='Accept')
+    if os.path.isfile(variant):
+        return StaticResult(path=variant, mimetype=mimetype, etag=etag, mtime=mtime, vary='Accept')
+    return None
+
+# الحزم تحمل بصمة محتواها في اسمها فلا تتغير أبداً
+def resolve_bundle(name, req):
+    path = safe_join(os.path.abspath(BUNDLES_DIR), name)
+    if path is None or not os.path.isfile(path):
+        return None
+    etag = name.split('.')[0]
+    req.environ['sarver.rel_path'] = f"_bundles/{name}"
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if is_not_modified(req, etag, os.path.getmtime(path)):
+        return StaticResult(304, etag=etag, vary='Accept-Encoding', cache_control=BUNDLE_CACHE_CONTROL)
+    encodings = [encoding for encoding, suffix in ENCODING_SUFFIXES.items() if os.path.isfile(path + suffix)]
+    encoding = negotiate_encoding(req, encodings)
+    if encoding:
+        path += ENCODING_SUFFIXES[encoding]
+    return StaticResult(path=path, mimetype=mimetype, etag=f"{etag}-{encoding}" if encoding else etag,
+                        encoding=encoding, vary='Accept-Encoding', cache_control=BUNDLE_CACHE_CONTROL)
+
+@app.route('/_bundles/<name>')
+def serve_bundle(name):
+    result = resolve_bundle(name, request)
+    if result is None:
+        abort(404)
+    return result.to_response()
+
 # عرض الملفات
 @app.route('/<path:filename>')
 def serve_file(filename):
-    # تحديد مجلد الملف بناءً على الامتداد
-    if filename.endswith('.css'):
-        return send_from_directory(f"{BASE_DIR}/css", filename)
-    elif filename.endswith('.js'):
-        return send_from_directory(f"{BASE_DIR}/js", filename)
-    elif any(filename.endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.gif']):
-        return send_from_directory(f"{BASE_DIR}/images", filename)
-    else:
-        return send_from_directory(BASE_DIR, filename)
+    result = resolve_static(filename, request)
+    if result is None:
+        abort(404)
+    return result.to_response()
 
 # التحقق من نوع الملف المسموح به
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# عملية عاملة: تخدم الطلبات من المقبس المشترك الذي فتحته العملية الأم
+def run_worker(sock, host, port):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    invalidation_bus.start()
+    start_background_tasks()
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    # عدة عمليات تنتظر على نفس المقبس: accept غير المعطل يتجاهل الاتصال الذي سبقتنا إليه عملية أخرى
+    server.socket.setblocking(False)
+    try:
+        server.serve_forever()
+    finally:
+        metadata_store.flush()
+        if access_log is not None:
+            access_log.flush()
+
+# مشغل الإنتاج: التطبيق وواجهة التحكم محملان مسبقاً قبل إنشاء العمليات العاملة (fork)
+def serve(host, port, workers):
+    if not hasattr(os, 'fork'):
+        raise SystemExit('وضع تعدد العمليات يتطلب نظاماً يدعم fork')
+    
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    invalidation_bus.reset()
+    metadata_store.flush()
+    
+    children = set()
+    stopping = False
+    
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(sock, host, port)
+            finally:
+                os._exit(0)
+        children.add(pid)
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    
+    for _ in range(workers):
+        spawn()
+    print(f'الخادم يعمل على http://{host}:{port} بعدد {workers} عملية')
+    
+    # إعادة تشغيل أي عملية عاملة تتوقف بشكل غير متوقع
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            time.sleep(0.5)
+            spawn()
+    sock.close()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='نظام الاستضافة المتكامل')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('compress', help='إنشاء النسخ المضغوطة لكل الملفات النصية الموجودة')
+    commands.add_parser('gc', help='حذف المحتوى غير المستخدم من مخزن المحتوى')
+    commands.add_parser('build', help='تصغير ملفات html/css/js وجمع ملفات كل صفحة في حزم')
+    deploy_parser = commands.add_parser('deploy', help='نشر المسودة الحالية كإصدار جديد (DEPLOYMENTS=1)')
+    deploy_parser.add_argument('--site', default='')
+    rollback_parser = commands.add_parser('rollback', help='الرجوع إلى إصدار سابق (DEPLOYMENTS=1)')
+    rollback_parser.add_argument('version')
+    rollback_parser.add_argument('--site', default='')
+    site_parser = commands.add_parser('add-site', help='إنشاء موقع جديد (وضع تعدد المواقع)')
+    site_parser.add_argument('name')
+    site_parser.add_argument('--quota-mb', type=float)
+    serve_parser = commands.add_parser('serve', help='تشغيل خادم الإنتاج بعدة عمليات')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    
+    if args.command == 'compress':
+        print(f'تم ضغط {backfill_variants()} ملف')
+    elif args.command in ('deploy', 'rollback'):
+        if deployments is None:
+            raise SystemExit('النشر بإصدارات غير مفعل (DEPLOYMENTS=1)')
+        if args.command == 'deploy':
+            print(f'تم نشر الإصدار {deployments.deploy(args.site)}')
+        else:
+            try:
+                deployments.activate(args.site, args.version)
+            except ReleaseNotFound:
+                raise SystemExit('الإصدار غير موجود')
+            print(f'الإصدار الحالي: {args.version}')
+    elif args.command == 'add-site':
+        if not SITES_DIR:
+            raise SystemExit('وضع تعدد المواقع غير مفعل (SITES_DIR)')
+        if not SITE_NAME.match(args.name):
+            raise SystemExit('اسم الموقع غير صالح')
+        for folder in UPLOAD_FOLDERS:
+            os.makedirs(os.path.join(SITES_DIR, args.name, folder), exist_ok=True)
+        if args.quota_mb is not None:
+            site_quotas.set(args.name, args.quota_mb)
+        print(f'تم إنشاء الموقع {args.name}')
+    elif args.command == 'build':
+        print(f'تم بناء {build_site()} ملف')
+    elif args.command == 'gc':
+        if blob_store is None:
+            raise SystemExit('مخزن المحتوى غير مفعل (BLOB_STORE=1)')
+        print(f'تم حذف {blob_store.gc()} عنصر غير مستخدم')
+    elif args.command == 'serve':
+        serve(args.host, args.port, args.workers)
+    else:
+        app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+# الخادم يُنشئ مجلداته في مجلد العمل عند استيراده، فتعمل الاختبارات في مجلد مؤقت
+os.chdir(tempfile.mkdtemp(prefix='sarver-tests-'))
+os.environ.setdefault('WATCH_FILES', '0')
+os.environ.setdefault('ACCESS_LOG', '0')
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import sarver  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return sarver.app.test_client()
+
+
+# كتابة ملف في الموقع وتسجيله في الفهرس كما يفعل مراقب الملفات
+@pytest.fixture
+def site_file():
+    created = []
+
+    def write(rel_path, data):
+        path = os.path.join(sarver.BASE_DIR, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        sarver.sync_file(rel_path)
+        created.append(rel_path)
+        return rel_path
+
+    yield write
+    for rel_path in created:
+        sarver.delete_site_file(rel_path)
+
+
+# نسخة مستقلة من الخادم في وضع تعدد المواقع (SITES_DIR) بمجلد مؤقت خاص بها.
+# الإعدادات تُقرأ من البيئة عند الاستيراد فقط، فتُستعاد البيئة ومجلد العمل بعده
+@pytest.fixture(scope='module')
+def sites_server(tmp_path_factory):
+    def load(sites=(), **env):
+        root = tmp_path_factory.mktemp('sites-server')
+        for site in sites:
+            os.makedirs(root / 'sites' / site)
+        with pytest.MonkeyPatch.context() as patch:
+            patch.chdir(root)
+            patch.setenv('SITES_DIR', str(root / 'sites'))
+            for key, value in env.items():
+                patch.setenv(key, str(value))
+            spec = importlib.util.spec_from_file_location(f"sarver_{root.name}", os.path.join(REPO_DIR, 'sarver.py'))
+            server = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(server)
+        return server
+    return load
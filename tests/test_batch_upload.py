@@ -0,0 +1,85 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import sarver
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def upload_zip(client, members, file_type=''):
+    return client.post('/upload/batch', data={'archive': (make_zip(members), 'site.zip'), 'file_type': file_type})
+
+
+def read(rel_path):
+    with open(os.path.join(sarver.BASE_DIR, rel_path), 'rb') as f:
+        return f.read()
+
+
+# حذف ملفات الدفعة من الموقع بعد كل اختبار
+@pytest.fixture
+def cleanup():
+    paths = []
+    yield paths.extend
+    for rel_path in paths:
+        sarver.delete_site_file(rel_path)
+
+
+def test_archive_keeps_relative_paths(client, cleanup):
+    cleanup(['site/index.html', 'site/about/index.html', 'css/style.css'])
+    response = upload_zip(client, [
+        ('site/index.html', b'<p>home</p>'),
+        ('site/about/index.html', b'<p>about</p>'),
+        ('style.css', b'body{}'),
+    ])
+    assert response.status_code == 200
+    assert response.get_json()['files'] == ['css/style.css', 'site/about/index.html', 'site/index.html']
+    assert read('site/index.html') == b'<p>home</p>'
+    assert read('site/about/index.html') == b'<p>about</p>'
+    assert sarver.storage_index.get('site/about/index.html') is not None
+
+
+def test_archive_paths_are_sanitized(client, cleanup):
+    cleanup(['etc/evil.html', 'css/site/a.css', 'css/b.css'])
+    response = upload_zip(client, [('../../etc/evil.html', b'x'), ('run.sh', b'x')])
+    assert response.get_json() == {'status': 'success', 'files': ['etc/evil.html'], 'skipped': ['run.sh']}
+    # النوع المحدد يضع الملفات تحت مجلده دون تكراره
+    response = upload_zip(client, [('site/a.css', b'a'), ('css/b.css', b'b')], file_type='css')
+    assert response.get_json()['files'] == ['css/b.css', 'css/site/a.css']
+
+
+def test_duplicate_targets_reject_the_batch(client):
+    # style.css في أعلى الأرشيف يوضع في css/ فيصطدم بالملف الآخر
+    response = upload_zip(client, [('css/style.css', b'one'), ('style.css', b'two')])
+    assert response.status_code == 400
+    assert 'css/style.css' in response.get_json()['message']
+    assert sarver.storage_index.get('css/style.css') is None
+    assert os.listdir(sarver.STAGING_DIR) == []
+
+
+def test_failed_commit_registers_placed_files(client, cleanup, monkeypatch):
+    cleanup(['a.html', 'b.html'])
+    place_file = sarver.place_file
+    calls = []
+
+    def fail_second(*args):
+        calls.append(args[1])
+        if len(calls) == 2:
+            raise OSError('disk full')
+        place_file(*args)
+
+    monkeypatch.setattr(sarver, 'place_file', fail_second)
+    assert upload_zip(client, [('a.html', b'a'), ('b.html', b'b')]).status_code == 500
+    placed = calls[0]
+    assert read(placed) in (b'a', b'b')
+    assert sarver.storage_index.get(placed) is not None
+    assert sarver.storage_index.get(calls[1]) is None
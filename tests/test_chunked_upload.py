@@ -0,0 +1,60 @@
+import os
+
+import sarver
+
+
+def start(client, filename, size=None):
+    body = {'filename': filename}
+    if size is not None:
+        body['size'] = size
+    response = client.post('/api/uploads', json=body)
+    assert response.status_code == 200
+    return response.get_json()['upload_id']
+
+
+def put(client, upload_id, offset, data):
+    return client.put(f'/api/uploads/{upload_id}?offset={offset}', data=data)
+
+
+def test_resume_after_offset_mismatch(client):
+    upload_id = start(client, 'resume.js', size=10)
+    assert put(client, upload_id, 0, b'01234').get_json()['offset'] == 5
+    # جزء مكرر أو ضائع: الخادم يرد بالموضع الصحيح ليستأنف العميل منه
+    for offset in (0, 7):
+        response = put(client, upload_id, offset, b'56789')
+        assert response.status_code == 409
+        assert response.get_json()['offset'] == 5
+    assert client.post(f'/api/uploads/{upload_id}/finalize').status_code == 409
+    assert put(client, upload_id, 5, b'56789').get_json()['offset'] == 10
+
+    response = client.post(f'/api/uploads/{upload_id}/finalize')
+    assert response.status_code == 200
+    assert response.get_json()['filepath'] == 'resume.js'
+    with open(os.path.join(sarver.BASE_DIR, 'resume.js'), 'rb') as f:
+        assert f.read() == b'0123456789'
+    assert sarver.storage_index.get('resume.js')[0] == 10
+    # الجلسة تُحذف بعد الإنهاء
+    assert put(client, upload_id, 10, b'x').status_code == 404
+    assert sarver.delete_site_file('resume.js')
+
+
+def test_chunks_beyond_declared_size_are_rejected(client):
+    upload_id = start(client, 'small.js', size=4)
+    assert put(client, upload_id, 0, b'12345').status_code == 400
+    assert client.delete(f'/api/uploads/{upload_id}').status_code == 200
+
+
+def test_quota_is_checked_per_chunk_without_declared_size(client, monkeypatch):
+    monkeypatch.setattr(sarver.site_quotas, 'get', lambda site: sarver.storage_index.site_totals(site)[0] + 100)
+    upload_id = start(client, 'unsized.js')
+    assert put(client, upload_id, 0, b'x' * 60).status_code == 200
+    assert put(client, upload_id, 60, b'x' * 60).status_code == 413
+    _, part_path = sarver.upload_session_paths(upload_id)
+    assert os.path.getsize(part_path) == 60
+    assert client.delete(f'/api/uploads/{upload_id}').status_code == 200
+
+
+def test_invalid_size_is_a_client_error(client):
+    for size in (-1, 'big', [1], {'n': 1}):
+        response = client.post('/api/uploads', json={'filename': 'bad.js', 'size': size})
+        assert response.status_code == 400
@@ -0,0 +1,91 @@
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def server(sites_server):
+    return sites_server(sites=['alpha', 'beta'], DEPLOYMENTS=1, DEPLOY_KEEP=3, DEPLOY_POINTER_TTL=0)
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def upload(client, name, data, site='alpha'):
+    response = client.post(f'/sites/{site}/upload', data={'file': (io.BytesIO(data), name)})
+    assert response.status_code == 200
+    return response.get_json()['etag']
+
+
+def deploy(client, site='alpha'):
+    response = client.post(f'/sites/{site}/api/deploys')
+    assert response.status_code == 200
+    return response.get_json()['version']
+
+
+def page(client, site='alpha'):
+    return client.get(f'/sites/{site}/index.html')
+
+
+def test_deploy_and_rollback(client, server):
+    # قبل أول نشر تُعرض المسودة
+    upload(client, 'index.html', b'v1')
+    upload(client, 'logo.css', b'a{}')
+    assert page(client).data == b'v1'
+    first = deploy(client)
+
+    # تعديل المسودة لا يظهر للزوار حتى النشر التالي
+    upload(client, 'index.html', b'v2')
+    assert page(client).data == b'v1'
+    second = deploy(client)
+    response = page(client)
+    assert response.data == b'v2'
+    etag = response.headers['ETag']
+
+    listing = client.get('/sites/alpha/api/deploys').get_json()
+    assert listing['live'] == second
+    assert [release['version'] for release in listing['versions']] == [second, first]
+
+    assert client.post(f'/sites/alpha/api/deploys/{first}/activate').status_code == 200
+    assert page(client).data == b'v1'
+    assert client.get('/sites/alpha/api/deploys').get_json()['live'] == first
+    assert client.post(f'/sites/alpha/api/deploys/{second}/activate').status_code == 200
+    # ETag بصمة المحتوى، فلا يتغير بالرجوع إلى نفس الإصدار
+    assert page(client).headers['ETag'] == etag
+
+    # الملف الذي لم يتغير بين الإصدارين مربوط لا منسوخ
+    first_release = server.deployments.release('alpha', first)
+    second_release = server.deployments.release('alpha', second)
+    assert os.path.samefile(first_release.path('files', 'alpha/logo.css'),
+                            second_release.path('files', 'alpha/logo.css'))
+
+
+def test_deploys_are_per_site(client):
+    upload(client, 'index.html', b'beta draft', site='beta')
+    assert page(client, 'beta').data == b'beta draft'
+    assert client.get('/sites/beta/api/deploys').get_json() == {'live': None, 'versions': []}
+    version = deploy(client, 'beta')
+    assert client.post(f'/sites/alpha/api/deploys/{version}/activate').status_code == 404
+
+
+def test_prune_keeps_the_newest_and_the_live_release(client, server, monkeypatch):
+    versions = [deploy(client) for _ in range(4)]
+    listed = [release['version'] for release in client.get('/sites/alpha/api/deploys').get_json()['versions']]
+    assert listed == versions[::-1][:3]
+    assert not os.path.exists(os.path.join(server.RELEASES_DIR, 'alpha', versions[0]))
+
+    # الإصدار الحالي لا يُحذف حتى لو كان أقدم من الحد
+    oldest_kept = listed[-1]
+    assert client.post(f'/sites/alpha/api/deploys/{oldest_kept}/activate').status_code == 200
+    monkeypatch.setattr(server, 'DEPLOY_KEEP', 1)
+    server.deployments.prune('alpha')
+    listed = [release['version'] for release in client.get('/sites/alpha/api/deploys').get_json()['versions']]
+    assert listed == [versions[-1], oldest_kept]
+
+
+def test_invalid_versions_are_not_found(client):
+    for version in ('current', 'missing', '.hidden.tmp', '..'):
+        assert client.post(f'/sites/alpha/api/deploys/{version}/activate').status_code == 404
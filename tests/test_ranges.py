@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import sarver
+
+# ملف صغير يُرسل من ذاكرة الملفات الساخنة، وآخر أكبر من حدها يُقرأ من القرص
+SIZES = [1000, sarver.HOT_CACHE_MAX_FILE_SIZE + 4096]
+
+
+def payload(size):
+    return bytes(i % 251 for i in range(size))
+
+
+@pytest.fixture(params=SIZES, ids=['cached', 'disk'])
+def served(request, site_file):
+    data = payload(request.param)
+    name = site_file(f"ranges-{request.param}.bin", data)
+    return f"/{name}", data
+
+
+def test_single_range(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 10-19/{len(data)}"
+    assert response.headers['Content-Length'] == '10'
+    assert response.data == data[10:20]
+
+
+def test_open_ended_range(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': f"bytes={len(data) - 5}-"})
+    assert response.status_code == 206
+    assert response.data == data[-5:]
+
+
+def test_suffix_range(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': 'bytes=-7'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes {len(data) - 7}-{len(data) - 1}/{len(data)}"
+    assert response.data == data[-7:]
+
+
+def test_multiple_ranges(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': 'bytes=0-4,100-109'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    boundary = response.mimetype_params['boundary'].encode()
+    assert int(response.headers['Content-Length']) == len(response.data)
+    parts = response.data.split(b'--' + boundary)
+    assert parts[-1].strip() == b'--'
+    bodies = []
+    for part in parts[1:-1]:
+        head, _, body = part.partition(b'\r\n\r\n')
+        assert b'Content-Range: bytes ' in head
+        bodies.append(body[:-2] if body.endswith(b'\r\n') else body)
+    assert bodies == [data[0:5], data[100:110]]
+
+
+def test_unsatisfiable_range(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': f"bytes={len(data) + 10}-{len(data) + 20}"})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(data)}"
+
+
+def test_if_range_matching_etag(client, served):
+    url, data = served
+    etag = client.get(url).headers['ETag']
+    response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == data[:10]
+
+
+def test_if_range_mismatch_sends_whole_file(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == data
+
+
+def test_if_range_old_date_sends_whole_file(client, served):
+    url, data = served
+    response = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+    assert response.status_code == 200
+    assert response.data == data
+
+
+def test_too_many_ranges_send_the_whole_file(client, served):
+    url, data = served
+    ranges = ','.join(f"{i * 10}-{i * 10 + 4}" for i in range(sarver.MAX_RANGES + 1))
+    response = client.get(url, headers={'Range': f"bytes={ranges}"})
+    assert response.status_code == 200
+    assert response.data == data
+
+
+# ملف يُقتطع في مكانه أثناء إرساله يرفع خطأ قراءة عادياً بدل أن يُسقط العملية
+def test_truncated_file_fails_with_an_os_error(client, site_file):
+    data = payload(sarver.HOT_CACHE_MAX_FILE_SIZE + 4 * sarver.STREAM_CHUNK_SIZE)
+    name = site_file('truncated.bin', data)
+    response = client.get(f"/{name}", headers={'Range': 'bytes=0-'}, buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks) == data[:sarver.STREAM_CHUNK_SIZE]
+    with open(os.path.join(sarver.BASE_DIR, name), 'r+b') as f:
+        f.truncate(1000)
+    with pytest.raises(OSError):
+        list(chunks)
+    response.close()
@@ -0,0 +1,67 @@
+import pytest
+
+import sarver
+
+
+# محدد بحدود صغيرة بدل المحدد المعطل افتراضياً
+@pytest.fixture
+def limit(monkeypatch):
+    def install(static=(0, 0), api=(0, 0), upload=(0, 0), burst=1):
+        limiter = sarver.RateLimiter({'static': static, 'api': api, 'upload': upload}, burst, 1000, 4)
+        monkeypatch.setattr(sarver, 'rate_limiter', limiter)
+        return limiter
+    return install
+
+
+def get(client, path, ip='10.0.0.1', forwarded=None):
+    headers = {'X-Forwarded-For': forwarded} if forwarded else {}
+    return client.get(path, headers=headers, environ_base={'REMOTE_ADDR': ip})
+
+
+def test_rate_limit_is_off_by_default():
+    assert not sarver.RATE_LIMIT_ENABLED
+
+
+def test_exhausted_bucket_returns_429_with_retry_after(client, site_file, limit):
+    site_file('limited.html', b'<p>x</p>')
+    limit(static=(0.5, 0), burst=4)
+    assert [get(client, '/limited.html').status_code for _ in range(2)] == [200, 200]
+    response = get(client, '/limited.html')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    assert response.get_json()['status'] == 'error'
+    # كل عميل له دلوه
+    assert get(client, '/limited.html', ip='10.0.0.2').status_code == 200
+
+
+def test_byte_debt_blocks_the_next_request(client, site_file, limit):
+    site_file('big.css', b'x' * 4000)
+    limit(static=(0, 1000), burst=1)
+    assert get(client, '/big.css').status_code == 200
+    response = get(client, '/big.css')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 3
+
+
+def test_forwarded_for_is_ignored_unless_proxy_is_trusted(client, site_file, limit, monkeypatch):
+    site_file('proxied.html', b'<p>x</p>')
+    limit(static=(0.5, 0), burst=2)
+    # دون الثقة بالوكيل لا يستطيع العميل تغيير هويته بالترويسة
+    assert get(client, '/proxied.html', forwarded='1.1.1.1').status_code == 200
+    assert get(client, '/proxied.html', forwarded='2.2.2.2').status_code == 429
+
+    limit(static=(0.5, 0), burst=2)
+    monkeypatch.setattr(sarver, 'RATE_LIMIT_TRUST_PROXY', True)
+    assert get(client, '/proxied.html', forwarded='1.1.1.1, 10.0.0.1').status_code == 200
+    assert get(client, '/proxied.html', forwarded='1.1.1.1, 10.0.0.1').status_code == 429
+    assert get(client, '/proxied.html', forwarded='2.2.2.2, 10.0.0.1').status_code == 200
+
+
+def test_upload_chunks_are_limited_by_bytes_not_requests(client, limit):
+    limiter = limit(upload=(0.01, 0), burst=100)
+    upload_id = client.post('/api/uploads', json={'filename': 'chunks.js', 'size': 10}).get_json()['upload_id']
+    for offset in range(10):
+        assert client.put(f'/api/uploads/{upload_id}?offset={offset}', data=b'x').status_code == 200
+    assert client.post(f'/api/uploads/{upload_id}/finalize').status_code == 429
+    assert limiter.stats()['limited'] == {'upload': 1}
+    client.delete(f'/api/uploads/{upload_id}')
@@ -0,0 +1,88 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def server(sites_server):
+    # حد صغير لكل موقع حتى يمكن تجاوزه في الاختبار
+    return sites_server(sites=['alpha', 'beta'], SITE_QUOTA_MB=0.001, SITES_HOST_SUFFIX='.example.test')
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def upload(client, site, name, data):
+    return client.post(f'/sites/{site}/upload', data={'file': (io.BytesIO(data), name)})
+
+
+def test_sites_do_not_see_each_others_files(client, server):
+    assert upload(client, 'alpha', 'private.html', b'<p>alpha</p>').status_code == 200
+    assert client.get('/sites/alpha/private.html').data == b'<p>alpha</p>'
+    assert client.get('/sites/beta/private.html').status_code == 404
+    assert 'private.html' in client.get('/sites/alpha/api/files').get_json()['files']
+    assert client.get('/sites/beta/api/files').get_json()['files'] == []
+    assert os.path.isfile(os.path.join(server.SITES_DIR, 'alpha', 'private.html'))
+    # موقع آخر لا يستطيع حذف الملف
+    assert client.delete('/sites/beta/api/delete/private.html').status_code == 404
+    assert client.delete('/sites/beta/api/delete/../alpha/private.html').status_code == 404
+    assert client.delete('/sites/alpha/api/delete/private.html').status_code == 200
+
+
+def test_paths_cannot_escape_the_site(client):
+    assert upload(client, 'alpha', 'secret.css', b'a{}').status_code == 200
+    for url in ('/sites/beta/../alpha/secret.css', '/sites/beta/%2e%2e/alpha/secret.css'):
+        assert client.get(url).status_code == 404
+    assert client.delete('/sites/alpha/api/delete/secret.css').status_code == 200
+
+
+def test_site_from_host_name(client):
+    assert upload(client, 'beta', 'host.html', b'beta').status_code == 200
+    assert client.get('/host.html', headers={'Host': 'beta.example.test'}).data == b'beta'
+    assert client.get('/host.html', headers={'Host': 'alpha.example.test'}).status_code == 404
+    assert client.delete('/sites/beta/api/delete/host.html').status_code == 200
+
+
+def test_unknown_and_reserved_sites_are_not_found(client, server):
+    for site in ('gamma', server.WORK_DIR_NAME, '..'):
+        assert client.get(f'/sites/{site}/api/files').status_code == 404
+        assert upload(client, site, 'x.html', b'x').status_code == 404
+    # مجلد العمل داخل SITES_DIR لا يظهر كموقع ولا في الفهرس
+    assert not any(path.startswith(server.WORK_DIR_NAME) for path in server.storage_index.paths())
+
+
+def test_quota_is_enforced_per_site(client):
+    quota = int(0.001 * 1024 * 1024)
+    assert upload(client, 'alpha', 'a.js', b'a' * 600).status_code == 200
+    response = upload(client, 'alpha', 'b.js', b'b' * 600)
+    assert response.status_code == 413
+    assert response.get_json()['status'] == 'error'
+    # استبدال الملف لا يحسب حجمه القديم
+    assert upload(client, 'alpha', 'a.js', b'c' * 700).status_code == 200
+    info = client.get('/sites/alpha/api/files').get_json()['storage_info']
+    assert info['quota'] == quota and info['total_size'] == 700
+    # الموقع الآخر له مساحته الخاصة
+    assert upload(client, 'beta', 'b.js', b'b' * 600).status_code == 200
+    assert client.delete('/sites/alpha/api/delete/a.js').status_code == 200
+    assert client.delete('/sites/beta/api/delete/b.js').status_code == 200
+
+
+def test_batch_and_chunked_uploads_respect_the_quota(client, server):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('one.html', b'1' * 600)
+        zf.writestr('two.html', b'2' * 600)
+    archive.seek(0)
+    response = client.post('/sites/beta/upload/batch', data={'archive': (archive, 'site.zip')})
+    assert response.status_code == 413
+    assert server.storage_index.site_totals('beta') == (0, 0)
+
+    upload_id = client.post('/sites/beta/api/uploads', json={'filename': 'big.js'}).get_json()['upload_id']
+    assert client.put(f'/sites/beta/api/uploads/{upload_id}?offset=0', data=b'x' * 2000).status_code == 413
+    # جلسة موقع لا تُستخدم من موقع آخر
+    assert client.put(f'/sites/alpha/api/uploads/{upload_id}?offset=0', data=b'x').status_code == 404
+    assert client.delete(f'/sites/beta/api/uploads/{upload_id}').status_code == 200
@@ -0,0 +1,138 @@
+import os
+
+import pytest
+
+import sarver
+
+
+@pytest.fixture
+def tree(tmp_path):
+    def write(rel_path, data=b'x'):
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return rel_path
+    write.root = str(tmp_path)
+    return write
+
+
+def make_index(tree, *names):
+    for name in names:
+        tree(name)
+    index = sarver.StorageIndex(tree.root)
+    index.reconcile()
+    return index
+
+
+def walk(index, limit, **kwargs):
+    files, cursor = index.page('', limit, **kwargs)
+    pages = [files]
+    while cursor is not None:
+        files, cursor = index.page(cursor, limit, **kwargs)
+        pages.append(files)
+    return pages
+
+
+def test_pages_cover_every_file_once(tree):
+    names = [f"f{i:02}.css" for i in range(10)]
+    index = make_index(tree, *names)
+    pages = walk(index, 3)
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert sum(pages, []) == names
+
+
+def test_cursor_survives_inserts_and_deletes(tree):
+    index = make_index(tree, *[f"f{i:02}.css" for i in range(6)])
+    files, cursor = index.page('', 3)
+    assert files == ['f00.css', 'f01.css', 'f02.css'] and cursor == 'f02.css'
+
+    # الملف الذي يشير إليه المؤشر يُحذف، ويُضاف ملف قبله وآخر بعده
+    os.remove(os.path.join(tree.root, 'f02.css'))
+    index.remove('f02.css')
+    index.update(tree('f00a.css'))
+    index.update(tree('f02a.css'))
+
+    files, cursor = index.page(cursor, 3)
+    assert files == ['f02a.css', 'f03.css', 'f04.css']
+    files, cursor = index.page(cursor, 3)
+    assert files == ['f05.css'] and cursor is None
+
+
+def test_page_filters_by_folder_and_extension(tree):
+    index = make_index(tree, 'a.html', 'css/a.css', 'css/b.css', 'css/c.js', 'js/a.js')
+    assert sum(walk(index, 1, prefix='css/'), []) == ['css/a.css', 'css/b.css', 'css/c.js']
+    assert sum(walk(index, 2, extensions={'js'}), []) == ['css/c.js', 'js/a.js']
+
+
+def test_update_and_remove_keep_totals(tree):
+    index = make_index(tree, 'a.css')
+    index.update(tree('b.css', b'12345'))
+    assert index.totals() == (6, 2)
+    os.remove(os.path.join(tree.root, 'a.css'))
+    index.update('a.css')
+    assert index.totals() == (5, 1)
+    assert index.paths() == ['b.css']
+
+
+def test_reconcile_replays_changes_made_during_scan(tree, monkeypatch):
+    index = make_index(tree, 'a.css', 'b.css')
+    scan = index._scan
+
+    # تغييرات تصل أثناء المسح: نتيجة المسح قديمة، والتغييرات المسجلة يجب ألا تضيع
+    def racing_scan():
+        entries = scan()
+        os.remove(os.path.join(tree.root, 'a.css'))
+        index.remove('a.css')
+        index.update(tree('c.css', b'abc'))
+        return entries
+
+    monkeypatch.setattr(index, '_scan', racing_scan)
+    index.reconcile()
+    assert index.paths() == ['b.css', 'c.css']
+    assert index.get('a.css') is None
+    assert index.get('c.css')[0] == 3
+    assert index.totals() == (4, 2)
+
+
+def test_reconcile_picks_up_external_changes(tree):
+    index = make_index(tree, 'a.css')
+    tree('b.css')
+    os.remove(os.path.join(tree.root, 'a.css'))
+    assert index.changes() == {'a.css', 'b.css'}
+    index.reconcile()
+    assert index.paths() == ['b.css']
+    assert index.changes() == set()
+
+
+def test_hardlinks_count_once_in_physical_size(tree):
+    index = make_index(tree, 'a.css')
+    os.link(os.path.join(tree.root, 'a.css'), os.path.join(tree.root, 'b.css'))
+    index.update('b.css')
+    assert index.totals() == (2, 2)
+    assert index.physical_size() == 1
+
+
+def test_files_api_pages_with_cursor_and_limit(client, site_file):
+    names = [site_file(f"css/page{i}.css", b'x') for i in range(5)]
+    site_file('page.html', b'x')
+
+    def files(**args):
+        response = client.get('/api/files', query_string=dict(folder='css', ext='css', **args))
+        assert response.status_code == 200
+        return response.get_json()
+
+    seen = []
+    body = files(limit=2)
+    while True:
+        assert len(body['files']) <= 2
+        seen += body['files']
+        if body['next_cursor'] is None:
+            break
+        assert body['next_cursor'] == body['files'][-1]
+        body = files(limit=2, cursor=body['next_cursor'])
+    assert [name for name in seen if name.startswith('css/page')] == names
+    assert 'page.html' not in seen
+
+    for limit in (0, -1, 'x', sarver.FILES_MAX_PAGE_SIZE + 1):
+        assert client.get('/api/files', query_string={'limit': limit}).status_code == 400
+    assert client.get('/api/files', query_string={'folder': 'secret'}).status_code == 400
@@ -0,0 +1,77 @@
+import io
+import os
+import threading
+
+import sarver
+
+
+def upload(client, name, data, headers=None):
+    return client.post('/upload', data={'file': (io.BytesIO(data), name)}, headers=headers or {})
+
+
+def test_concurrent_writes_to_same_path_never_tear():
+    contents = [bytes([65 + i]) * (256 * 1024) for i in range(8)]
+    path = os.path.join(sarver.BASE_DIR, 'race.js')
+    assert upload(sarver.app.test_client(), 'race.js', contents[0]).status_code == 200
+    done = threading.Event()
+    torn = []
+
+    # القارئ يجب أن يرى دائماً أحد المحتويات كاملاً
+    def read_loop():
+        while not done.is_set():
+            with open(path, 'rb') as f:
+                data = f.read()
+            if data not in contents:
+                torn.append(len(data))
+
+    def write(data):
+        assert upload(sarver.app.test_client(), 'race.js', data).status_code == 200
+
+    reader = threading.Thread(target=read_loop)
+    reader.start()
+    writers = [threading.Thread(target=write, args=(data,)) for data in contents * 3]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    reader.join()
+
+    assert not torn
+    with open(path, 'rb') as f:
+        final = f.read()
+    assert final in contents
+    # الفهرس والبيانات الوصفية تطابق آخر كتابة
+    size, mtime = sarver.storage_index.get('race.js')
+    assert size == len(final)
+    hasher = sarver.content_hash()
+    hasher.update(final)
+    assert sarver.metadata_store.get('race.js', size, mtime)['etag'] == sarver.etag_from_hash(hasher)
+    assert sarver.delete_site_file('race.js')
+
+
+def test_failed_write_leaves_no_temp_file(client, monkeypatch):
+    assert upload(client, 'keep.js', b'original').status_code == 200
+
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(sarver, 'place_file', fail)
+    assert upload(client, 'keep.js', b'replacement').status_code == 500
+    monkeypatch.undo()
+
+    assert os.listdir(sarver.TMP_DIR) == []
+    with open(os.path.join(sarver.BASE_DIR, 'keep.js'), 'rb') as f:
+        assert f.read() == b'original'
+    assert sarver.delete_site_file('keep.js')
+
+
+def test_if_match_conflict_keeps_file(client):
+    etag = upload(client, 'match.js', b'one').json['etag']
+    assert upload(client, 'match.js', b'two', {'If-Match': f'"{etag}"'}).status_code == 200
+    response = upload(client, 'match.js', b'three', {'If-Match': f'"{etag}"'})
+    assert response.status_code == 412
+    assert os.listdir(sarver.TMP_DIR) == []
+    with open(os.path.join(sarver.BASE_DIR, 'match.js'), 'rb') as f:
+        assert f.read() == b'two'
+    assert sarver.delete_site_file('match.js')